@@ -0,0 +1,108 @@
+"""
+Compares store codecs: encode / decode throughput and stored size.
+
+    python -m benchmarks.bench_codecs [--records N]
+
+Sizes are of the values as stored (read back from a DBM file), not of the
+file itself: dbm.dumb pads every value to a 512 byte block, which hides
+the differences between codecs.
+
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from norm import codecs
+from norm.backends.dbm_backend import DBMConnection
+
+
+CODECS = [
+    ("json", None), ("marshal", None), ("pickle", None),
+    ("json", "zlib"), ("marshal", "zlib")
+]
+
+
+def small_record(i):
+    return {
+        "id": "user-{}".format(i), "name": "User {}".format(i),
+        "email": "user{}@example.com".format(i), "age": i % 90,
+        "active": bool(i % 2)
+    }
+
+
+def wide_record(i):
+    record = dict(("field_{}".format(f), i * f) for f in range(50))
+    record["id"] = "wide-{}".format(i)
+    return record
+
+
+def nested_record(i):
+    return {
+        "id": "event-{}".format(i), "kind": "click",
+        "tags": ["tag-{}".format(t) for t in range(10)],
+        "payload": {"x": i * 0.5, "y": i * 1.5, "labels": ["a", "b", "c"]},
+        "body": "lorem ipsum dolor sit amet " * 8
+    }
+
+
+SHAPES = [("small", small_record), ("wide", wide_record),
+          ("nested", nested_record)]
+
+
+def bench(shape, make_record, name, compress, count):
+    codec = codecs.get_codec(name, compress)
+    records = [make_record(i) for i in range(count)]
+    encoded = [codec.dumps(record) for record in records]
+
+    encode_time = timeit.timeit(
+        lambda: [codec.dumps(record) for record in records], number=1)
+    decode_time = timeit.timeit(
+        lambda: [codecs.loads(value, True) for value in encoded], number=1)
+
+    directory = tempfile.mkdtemp()
+    try:
+        connection = DBMConnection(os.path.join(directory, "bench.db"))
+        keys = ["Record:{}".format(record["id"]) for record in records]
+        with connection.batch():
+            for key, value in zip(keys, encoded):
+                connection.save(key, value)
+        size = sum(len(connection.fetch(key)) for key in keys)
+        connection.disconnect()
+    finally:
+        shutil.rmtree(directory)
+
+    return {
+        "shape": shape,
+        "codec": name if not compress else "{}+{}".format(name, compress),
+        "encode_ops": count / encode_time,
+        "decode_ops": count / decode_time,
+        "value_bytes": sum(len(v) for v in encoded) / float(count),
+        "stored_bytes": size
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_codecs")
+    parser.add_argument("--records", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    row = "{:<8} {:<14} {:>12} {:>12} {:>10} {:>12}"
+    print(row.format(
+        "shape", "codec", "encode/s", "decode/s", "bytes/rec",
+        "stored bytes"))
+    for shape, make_record in SHAPES:
+        for name, compress in CODECS:
+            result = bench(shape, make_record, name, compress, args.records)
+            print(row.format(
+                result["shape"], result["codec"],
+                "{:.0f}".format(result["encode_ops"]),
+                "{:.0f}".format(result["decode_ops"]),
+                "{:.1f}".format(result["value_bytes"]),
+                result["stored_bytes"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Measures the per-call overhead of binding models to stores and of
+dispatching through `Model.use(store).store.<method>`.
+
+    python -m benchmarks.bench_store_context [--number N]
+
+"""
+
+import argparse
+import gc
+import timeit
+
+from norm.field import Field
+from norm.model import Model
+import norm.framework
+
+
+@norm.framework.store
+class NullStore(object):
+
+    @norm.framework.deserialize
+    def fetch(self, model, key):
+        return None
+
+    @norm.framework.serialize
+    def save(self, instance):
+        return None
+
+    def delete(self, model, key):
+        return None
+
+
+class User(Model):
+    id = Field()
+    name = Field()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.bench_store_context")
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args(argv)
+
+    store = NullStore()
+    bound = User.use(store)
+    instance = bound(id="foo", name="Foo")
+
+    cases = [
+        ("User.use(store)", lambda: User.use(store)),
+        ("User.use(store).store.fetch(key)",
+         lambda: User.use(store).store.fetch("foo")),
+        ("M.store.fetch(key)", lambda: bound.store.fetch("foo")),
+        ("instance.store.save()", lambda: instance.store.save()),
+        ("store.fetch(M, key) (baseline)", lambda: store.fetch(bound, "foo")),
+    ]
+
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=args.number, repeat=3))
+        print("{:<36} {:>8.3f} us/call".format(
+            name, seconds / args.number * 1e6))
+
+    classes = len([o for o in gc.get_objects() if isinstance(o, type)])
+    print("{:<36} {:>8}".format("live classes", classes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Benchmarks the hot paths of fields, models and `DBMStore`, across model
+widths and dataset sizes, reporting throughput and peak memory.
+
+    python -m benchmarks.suite --output before.json
+    # ...change things...
+    python -m benchmarks.suite --baseline before.json --threshold 0.1
+
+With a baseline, any case whose ops/sec dropped by more than the
+threshold (a fraction) is reported and the exit status is 1. Two saved
+results can also be compared without running anything:
+
+    python -m benchmarks.suite --compare before.json after.json
+
+`--only field` runs just the cases whose name starts with "field", and
+`--full` runs every dataset size up to 1M records (slow, since dbm.dumb
+rewrites its whole directory file on every flush).
+
+"""
+
+import argparse
+import json
+import operator
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from norm.backends.dbm_backend import DBMConnection
+from norm.field import Field, IntField
+from norm.model import Model
+
+
+WIDTHS = [5, 20, 50, 200]
+SIZES = [1000, 10000]
+FULL_SIZES = [1000, 10000, 100000, 1000000]
+# the width of the models stored by the dataset cases.
+RECORD_WIDTH = 10
+
+
+def wide_model(width, field=Field):
+    """Returns a model with `width` fields, every other one defaulted."""
+    fields = {"id": Field()}
+    for i in range(1, width):
+        fields["field_{}".format(i)] = field(default=0) if i % 2 else field()
+    return type("Wide{}".format(width), (Model,), fields)
+
+
+def record(model, i):
+    data = dict((name, i) for name in model._fields)
+    data["id"] = str(i)
+    return data
+
+
+# Each case takes its parameter (and a scratch directory) and returns
+# (run, ops, reset, close): `run` is timed, performing `ops` operations,
+# `reset` (if any) runs untimed before each repeat and `close` (if any)
+# runs once the case is done.
+
+def field_get(width, directory, field=Field):
+    model = wide_model(width, field)
+    instance = model.from_dict(record(model, 1))
+    getter = operator.attrgetter(*sorted(model._fields))
+    return lambda: getter(instance), width, None, None
+
+
+def field_set(width, directory, field=Field):
+    model = wide_model(width, field)
+    instance = model.from_dict(record(model, 1))
+    names = sorted(model._fields)
+
+    def run():
+        for name in names:
+            setattr(instance, name, 1)
+    return run, width, None, None
+
+
+def int_field_get(width, directory):
+    return field_get(width, directory, IntField)
+
+
+def int_field_set(width, directory):
+    return field_set(width, directory, IntField)
+
+
+def model_new(width, directory):
+    model = wide_model(width)
+    return model, 1, None, None
+
+
+def model_from_dict(width, directory):
+    model = wide_model(width)
+    data = record(model, 1)
+    return lambda: model.from_dict(data), 1, None, None
+
+
+def model_bulk_create(width, directory):
+    model = wide_model(width)
+    rows = [record(model, i) for i in range(100)]
+    return lambda: model.bulk_create(rows), len(rows), None, None
+
+
+def _dataset(size, directory):
+    model = wide_model(RECORD_WIDTH)
+    connection = DBMConnection(os.path.join(directory, "bench.db"))
+    store = connection.get_store()
+    instances = [model(**record(model, i)) for i in range(size)]
+    return model, connection, store, instances
+
+
+def _stored(size, directory):
+    model, connection, store, instances = _dataset(size, directory)
+    # one batch, and so one flush, however many records there are.
+    with store.batch():
+        store.save_many(model, instances)
+    return model, connection, store, instances
+
+
+def dbm_save(size, directory):
+    model, connection, store, instances = _dataset(size, directory)
+
+    def run():
+        with store.batch():
+            for instance in instances:
+                store.save(instance)
+
+    def reset():
+        for instance in instances:
+            instance.mark_dirty()
+    return run, size, reset, connection.disconnect
+
+
+def dbm_fetch(size, directory):
+    model, connection, store, instances = _stored(size, directory)
+    keys = [instance.id for instance in instances]
+
+    def run():
+        for key in keys:
+            store.fetch(model, key)
+    return run, size, None, connection.disconnect
+
+
+def dbm_find(size, directory):
+    model, connection, store, instances = _stored(size, directory)
+
+    def run():
+        for _ in store.find(model):
+            pass
+    return run, size, None, connection.disconnect
+
+
+CASES = [
+    (field_get, "width"), (field_set, "width"), (int_field_get, "width"),
+    (int_field_set, "width"), (model_new, "width"),
+    (model_from_dict, "width"), (model_bulk_create, "width"),
+    (dbm_save, "size"), (dbm_fetch, "size"), (dbm_find, "size")
+]
+
+
+def measure(run, ops, reset, repeat):
+    """Returns the best ops/sec of `repeat` runs, and the peak memory."""
+    if reset is None:
+        timer = timeit.Timer(run)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=number))
+    else:
+        # dataset cases run once per repeat, from a fresh state.
+        number = 1
+        best = None
+        for _ in range(repeat):
+            reset()
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        reset()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return ops * number / best, peak
+
+
+def run_suite(widths=WIDTHS, sizes=SIZES, only=None, repeat=3,
+              stream=sys.stdout):
+    results = []
+    for case, parameter in CASES:
+        if only and not case.__name__.startswith(only):
+            continue
+        for value in widths if parameter == "width" else sizes:
+            directory = tempfile.mkdtemp()
+            try:
+                run, ops, reset, close = case(value, directory)
+                try:
+                    ops_per_sec, peak = measure(run, ops, reset, repeat)
+                finally:
+                    if close:
+                        close()
+            finally:
+                shutil.rmtree(directory)
+            result = {
+                "name": case.__name__,
+                "params": {parameter: value},
+                "ops_per_sec": ops_per_sec,
+                "peak_memory": peak
+            }
+            results.append(result)
+            stream.write("{:<32} {:>14,.0f} ops/s {:>12,} bytes peak\n".format(
+                _key(result), ops_per_sec, peak))
+            stream.flush()
+    return {"meta": _meta(), "results": results}
+
+
+def compare(baseline, current, threshold):
+    """
+    Returns (rows, regressions) for the cases in both results, each row
+    being (case, old ops/sec, new ops/sec, relative change).
+
+    """
+    old = dict((_key(r), r["ops_per_sec"]) for r in baseline["results"])
+    rows = []
+    regressions = []
+    for result in current["results"]:
+        key = _key(result)
+        if key not in old:
+            continue
+        change = result["ops_per_sec"] / old[key] - 1
+        row = (key, old[key], result["ops_per_sec"], change)
+        rows.append(row)
+        if change < -threshold:
+            regressions.append(row)
+    return rows, regressions
+
+
+def _key(result):
+    params = ",".join(
+        "{}={}".format(name, value)
+        for name, value in sorted(result["params"].items()))
+    return "{}[{}]".format(result["name"], params)
+
+
+def _meta():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode("utf8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def _print_comparison(rows, regressions, threshold, stream=sys.stdout):
+    for key, old, new, change in rows:
+        flag = "  REGRESSION" if change < -threshold else ""
+        stream.write("{:<32} {:>14,.0f} -> {:>14,.0f} {:>+8.1%}{}\n".format(
+            key, old, new, change, flag))
+    stream.write("{} regression(s) beyond {:.0%}\n".format(
+        len(regressions), threshold))
+
+
+def _load(path):
+    with open(path) as stream:
+        return json.load(stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("--output", help="save results as JSON")
+    parser.add_argument("--baseline", help="compare against saved results")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+        help="compare two saved results without running")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--only", help="run cases starting with this")
+    parser.add_argument(
+        "--widths", type=int, nargs="+", default=WIDTHS)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--full", action="store_true", help="dataset sizes up to 1M")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline, current = [_load(path) for path in args.compare]
+    else:
+        baseline = _load(args.baseline) if args.baseline else None
+        current = run_suite(
+            widths=args.widths, sizes=FULL_SIZES if args.full else args.sizes,
+            only=args.only, repeat=args.repeat)
+        if args.output:
+            with open(args.output, "w") as stream:
+                json.dump(current, stream, indent=2)
+        if baseline is None:
+            return 0
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    _print_comparison(rows, regressions, args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Asyncio support for norm stores.
+
+`AsyncStoreAdapter` runs a regular (blocking) store such as `DBMStore` on
+a dedicated thread pool, so disk I/O never stalls the event loop:
+
+    store = AsyncStoreAdapter(connection.get_store())
+    User = User.use(store)
+    user = await User.store.fetch("foo")
+    await user.store.save()
+    async for user in User.store.find():
+        ...
+
+At most `max_concurrency` calls run at once; the rest wait on the event
+loop. A call cancelled before it starts never runs. A call cancelled
+while already running in a thread finishes there (it cannot be
+interrupted) and keeps its concurrency slot until it does.
+
+The default single worker serializes every call, which is what stores
+that aren't thread-safe (like `DBMStore`) need.
+
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+
+import norm.framework
+
+
+@norm.framework.async_store
+class AsyncStoreAdapter(object):
+
+    def __init__(
+            self, store, executor=None, max_workers=1, max_concurrency=None,
+            find_chunk_size=100):
+        self._store = store
+        self._owns_executor = executor is None
+        self._executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="norm-aio")
+        self._max_concurrency = max_concurrency or max_workers
+        self._find_chunk_size = find_chunk_size
+        # created on first use, so it belongs to the running loop.
+        self._semaphore = None
+
+    def __getattr__(self, attribute_name):
+        # any other store method (count, create, etc.) runs on the
+        # executor too, keeping its serialize / deserialize markers.
+        if attribute_name.startswith("_"):
+            raise AttributeError(attribute_name)
+        attribute = getattr(self._store, attribute_name)
+        if not callable(attribute):
+            return attribute
+
+        async def call(*args, **kwargs):
+            return await self._run(attribute, *args, **kwargs)
+
+        if norm.framework._deserializable(attribute):
+            norm.framework.deserialize(call)
+        elif norm.framework._serializable(attribute):
+            norm.framework.serialize(call)
+        return call
+
+    @norm.framework.deserialize
+    async def fetch(self, model, key):
+        return await self._run(self._store.fetch, model, key)
+
+    @norm.framework.deserialize
+    async def fetch_many(self, model, keys):
+        return await self._run(self._store.fetch_many, model, list(keys))
+
+    @norm.framework.serialize
+    async def save(self, instance):
+        return await self._run(self._store.save, instance)
+
+    @norm.framework.deserialize
+    async def save_many(self, model, instances):
+        return await self._run(self._store.save_many, model, list(instances))
+
+    async def delete(self, model, key):
+        return await self._run(self._store.delete, model, key)
+
+    @norm.framework.deserialize
+    async def delete_many(self, model, keys):
+        return await self._run(self._store.delete_many, model, list(keys))
+
+    @norm.framework.deserialize
+    async def exists(self, model, key):
+        return await self._run(self._store.exists, model, key)
+
+    @norm.framework.deserialize
+    async def exists_many(self, model, keys):
+        return await self._run(self._store.exists_many, model, list(keys))
+
+    @norm.framework.deserialize
+    async def count(self, model):
+        return await self._run(self._store.count, model)
+
+    @norm.framework.deserialize
+    async def find(self, model, *args, **kwargs):
+        # results are pulled from the blocking generator in chunks, so a
+        # large listing costs one executor round trip per chunk.
+        iterator = await self._run(
+            lambda: iter(self._store.find(model, *args, **kwargs)))
+        size = self._find_chunk_size
+        while True:
+            chunk = await self._run(_take, iterator, size)
+            for result in chunk:
+                yield result
+            if len(chunk) < size:
+                return
+
+    def close(self, wait=True):
+        if self._owns_executor:
+            self._executor.shutdown(wait=wait)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        semaphore = self._semaphore
+
+        await semaphore.acquire()
+        try:
+            future = self._executor.submit(
+                functools.partial(func, *args, **kwargs))
+        except BaseException:
+            semaphore.release()
+            raise
+        # the slot is released when the call actually finishes (or is
+        # cancelled before starting), not when the awaiting task gives up.
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(semaphore.release))
+        return await asyncio.wrap_future(future)
+
+
+def _take(iterator, count):
+    chunk = []
+    for result in iterator:
+        chunk.append(result)
+        if len(chunk) == count:
+            break
+    return chunk
@@ -2,87 +2,287 @@
 
 import dbm
 import json
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from norm.backends.keyvalue import KeyValueConnection, KeyValueStore
+from norm.backends.keyvalue import _DELETED, _reads, _writes
 import norm.framework
 
 
 @norm.framework.store
-class DBMStore(object):
-
-    def __init__(self, connection):
-        self._connection = connection
-
-    @norm.framework.deserialize
-    def fetch(self, model, key):
-        key = "%s:%s" % (model.__name__, key)
-        result = self._connection.fetch(key)
-        if result:
-            result = model.from_dict(json.loads(result.decode("utf8")))
-        return result
-
-    @norm.framework.serialize
-    def save(self, instance):
-        key = "%s:%s" % (instance.__class__.__name__, instance.identify())
-        data = instance.to_dict()
-        self._connection.save(key, json.dumps(data).encode("utf8"))
-        self._connection.flush()
-
-    @norm.framework.deserialize
-    def create(self, model, **kwargs):
-        instance = model(**kwargs)
-        self.save(instance)
-        return instance
-
-    @norm.framework.deserialize
-    def find(self, model):
-        prefix = "{}:".format(model.__name__)
-        for key in self._connection._dbm.keys():
-            key = key.decode("utf8")
-            if key.startswith(prefix):
-                identifier = key.split(prefix)[1]
-                yield self.fetch(model, identifier)
-
-    def delete(self, model, key):
-        prefix = "{}:{}".format(model.__name__, key)
-        self._connection.delete(prefix)
+class DBMStore(KeyValueStore):
+    pass
 
 
 @norm.framework.connection
-class DBMConnection(object):
+class DBMConnection(KeyValueConnection):
+
+    # the key index (and dbm.dumb's directory) live in the connection, so
+    # a pooled context shares one per uri rather than opening more.
+    single_instance = True
 
     @classmethod
     def from_uri(cls, uri):
-        path = uri.split("dbm://")[1]
-        return cls(path)
+        # dbm:///path/to/file.db?codec=marshal&compress=zlib
+        parsed = urlparse.urlparse(uri)
+        options = dict(urlparse.parse_qsl(parsed.query))
+        return cls(
+            parsed.netloc + parsed.path,
+            codec=options.get("codec", "json"),
+            compress=options.get("compress"),
+            allow_pickle=options.get("allow_pickle") in ("1", "true"),
+            thread_safe=options.get("thread_safe") in ("1", "true"))
 
-    def __init__(self, path, flag="c"):
+    def __init__(
+            self, path, flag="c", codec="json", compress=None,
+            allow_pickle=False, thread_safe=False):
+        super(DBMConnection, self).__init__(
+            codec, compress, allow_pickle, thread_safe)
         self._path = path
         self._flag = flag
+        # per-model sets of identifiers, loaded lazily from the index
+        # entries stored in the dbm (see _write_index).
+        self._index = {}
+        # model name -> [first, next] delta sequence numbers
+        self._index_deltas = {}
+        # model name -> {identifier: stored} changed since the last flush
+        self._index_changes = {}
+        # model name -> delta sequence numbers a crash mid-compaction may
+        # have left behind, removed on the next flush.
+        self._stale_deltas = {}
         self._open()
+        self._indexed = _INDEX_MARKER in self._dbm
+        if not self._indexed and self._flag != "r" and len(self._dbm) == 0:
+            # fresh files are indexed from the start. existing unindexed
+            # files fall back to key scans until rebuild_index() is run.
+            self._dbm[_INDEX_MARKER] = b"1"
+            self._indexed = True
 
     def _open(self):
         self._dbm = dbm.open(self._path, self._flag)
 
-    def disconnect(self):
+    @_writes
+    def _disconnect(self):
+        self._write_index()
         self._dbm.close()
 
     def get_store(self):
         return DBMStore(self)
 
+    @_writes
     def flush(self):
+        # dbm.dumb only rewrites its directory file on close.
+        self._write_index()
         self._dbm.close()
         self._open()
 
-    def save(self, key, data):
-        self._dbm[key] = data
+    @property
+    def indexed(self):
+        return self._indexed
+
+    @_reads
+    def keys(self):
+        if not self._pending:
+            return self._dbm.keys()
+        keys = set(self._dbm.keys())
+        for key, data in self._pending.items():
+            if data is _DELETED:
+                keys.discard(key)
+            else:
+                keys.add(key)
+        return list(keys)
+
+    def iter_ids(self, model_name, chunk_size=1000):
+        """
+        Yields every stored identifier for a model. Unindexed gdbm files
+        are walked with firstkey / nextkey, a chunk at a time, instead of
+        listing every key in the file first (writes made during the walk
+        may be missed). Other files list the model's identifiers once,
+        which for indexed files are already in memory.
 
-    def fetch(self, key):
-        key = key.encode("utf8")
-        if key not in self._dbm:
-            return None
+        """
+        if self._indexed or self._pending or \
+                not hasattr(self._dbm, "firstkey"):
+            for identifier in self.model_ids(model_name):
+                yield identifier
+            return
+        prefix = "{}:".format(model_name).encode("utf8")
+        key = None
+        while True:
+            ids, key = self._scan(prefix, key, chunk_size)
+            for identifier in ids:
+                yield identifier
+            if key is None:
+                return
+
+    @_reads
+    def _scan(self, prefix, key, chunk_size):
+        # returns up to chunk_size matching identifiers, from `key` (or the
+        # first key) on, and the next key to examine.
+        if key is None:
+            key = self._dbm.firstkey()
+        ids = []
+        while key is not None and len(ids) < chunk_size:
+            if key.startswith(prefix):
+                ids.append(key[len(prefix):].decode("utf8"))
+            key = self._dbm.nextkey(key)
+        return ids, key
+
+    @_writes
+    def rebuild_index(self):
+        """Rebuilds the per-model key index from every record in the file."""
+        index = {}
+        stale = []
+        for key in self._dbm.keys():
+            if key.startswith(_RESERVED_PREFIX):
+                if key != _INDEX_MARKER:
+                    stale.append(key)
+                continue
+            model_name, _, identifier = key.decode("utf8").partition(":")
+            index.setdefault(model_name, set()).add(identifier)
+        for key in stale:
+            del self._dbm[key]
+        self._index = index
+        self._index_deltas = dict((name, [0, 0]) for name in index)
+        self._index_changes = {}
+        self._stale_deltas = {}
+        for model_name in index:
+            self._compact_index(model_name)
+        self._dbm[_INDEX_MARKER] = b"1"
+        self._indexed = True
+        self.flush()
+        return dict((name, len(ids)) for name, ids in index.items())
+
+    def _get(self, key):
         return self._dbm[key]
 
-    def delete(self, key):
+    def _contains(self, key):
+        return key in self._dbm
+
+    def _stored_keys(self):
+        return [
+            key for key in self._dbm.keys()
+            if not key.startswith(_RESERVED_PREFIX)
+        ]
+
+    def _stored_ids(self, model_name):
+        if self._indexed:
+            return self._model_index(model_name)
+        prefix = "{}:".format(model_name).encode("utf8")
+        return [
+            key[len(prefix):].decode("utf8")
+            for key in self._dbm.keys() if key.startswith(prefix)
+        ]
+
+    def _model_index(self, model_name):
+        ids = self._index.get(model_name)
+        if ids is None:
+            ids = set()
+            first = 0
+            data = self._dbm.get(_index_key(model_name))
+            if data:
+                base = json.loads(data.decode("utf8"))
+                ids.update(base["ids"])
+                first = base["first"]
+                if base["previous"] < first and self._flag != "r":
+                    self._stale_deltas[model_name] = range(
+                        base["previous"], first)
+            sequence = first
+            while True:
+                delta = self._dbm.get(_delta_key(model_name, sequence))
+                if delta is None:
+                    break
+                added, removed = json.loads(delta.decode("utf8"))
+                ids.difference_update(removed)
+                ids.update(added)
+                sequence += 1
+            self._index[model_name] = ids
+            self._index_deltas[model_name] = [first, sequence]
+        return ids
+
+    def _write_index(self):
+        # each flush appends the changes to a model's ids as a delta, so a
+        # single save costs the same however many records there are. once
+        # the deltas add up to a fair share of the ids, they're compacted
+        # into the base entry (costing O(ids) again, but rarely).
+        for model_name, changes in self._index_changes.items():
+            first, sequence = self._index_deltas[model_name]
+            ids = self._index[model_name]
+            if len(changes) * 2 >= len(ids) or \
+                    sequence - first >= max(_MIN_DELTAS, len(ids) // 64):
+                self._compact_index(model_name)
+                continue
+            delta = [[], []]
+            for identifier, stored in changes.items():
+                delta[0 if stored else 1].append(identifier)
+            self._dbm[_delta_key(model_name, sequence)] = json.dumps(
+                delta).encode("utf8")
+            self._index_deltas[model_name][1] = sequence + 1
+        self._index_changes.clear()
+        for model_name, stale in self._stale_deltas.items():
+            self._remove_deltas(model_name, stale)
+        self._stale_deltas.clear()
+
+    def _compact_index(self, model_name):
+        first, sequence = self._index_deltas[model_name]
+        # the base names the first delta that applies to it, so deltas left
+        # behind by a crash before they're all removed are ignored, and the
+        # ones it replaced, so those are removed when it's next loaded.
+        self._dbm[_index_key(model_name)] = json.dumps({
+            "ids": list(self._index[model_name]),
+            "first": sequence,
+            "previous": first
+        }).encode("utf8")
+        self._remove_deltas(model_name, range(first, sequence))
+        self._index_deltas[model_name] = [sequence, sequence]
+
+    def _remove_deltas(self, model_name, sequences):
+        for sequence in sequences:
+            try:
+                del self._dbm[_delta_key(model_name, sequence)]
+            except KeyError:
+                pass
+
+    def _changed(self, key, stored):
+        model_name, _, identifier = key.decode("utf8").partition(":")
+        ids = self._model_index(model_name)
+        if stored:
+            ids.add(identifier)
+        else:
+            ids.discard(identifier)
+        self._index_changes.setdefault(model_name, {})[identifier] = stored
+
+    def _write(self, key, data):
+        self._dbm[key] = data
+        if self._indexed:
+            self._changed(key, True)
+
+    def _remove(self, key):
         del self._dbm[key]
+        if self._indexed:
+            self._changed(key, False)
+
+
+# reserved keys for the per-model key index. the leading NUL keeps them
+# apart from every "Model:id" record key.
+_RESERVED_PREFIX = b"\x00"
+_INDEX_MARKER = b"\x00index"
+
+
+# index deltas kept per model before compacting, at the least
+_MIN_DELTAS = 64
+
+
+def _index_key(model_name):
+    return "\x00index:{}".format(model_name).encode("utf8")
+
+
+def _delta_key(model_name, sequence):
+    return "\x00delta:{}:{}".format(model_name, sequence).encode("utf8")
 
 
 def register(context):
@@ -0,0 +1,565 @@
+"""Shared store and connection plumbing for key / value backends."""
+
+import base64
+import binascii
+import contextlib
+import functools
+import heapq
+import itertools
+import threading
+
+from norm import codecs
+from norm.instrumentation import _recording, count_read, count_written
+from norm.locks import ReadWriteLock
+import norm.columns
+import norm.framework
+
+
+def _reads(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        if self._lock is None:
+            return method(self, *args, **kwargs)
+        self._lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._lock.release_read()
+    return locked
+
+
+def _writes(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        if self._lock is None:
+            return method(self, *args, **kwargs)
+        self._lock.acquire_write()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._lock.release_write()
+    return locked
+
+
+class KeyValueStore(object):
+    """
+    A store over any `KeyValueConnection`, keeping each instance encoded
+    under a "Model:id" key.
+
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    @norm.framework.deserialize
+    def fetch(self, model, key):
+        key = "%s:%s" % (model.__name__, key)
+        result = self._connection.fetch(key)
+        if result:
+            result = self._load(model, result)
+        return result
+
+    @norm.framework.deserialize
+    def fetch_many(self, model, keys):
+        prefix = "{}:".format(model.__name__)
+        results = self._connection.fetch_many(
+            ["{}{}".format(prefix, key) for key in keys])
+        return [
+            self._load(model, result) if result else None
+            for result in results
+        ]
+
+    @norm.framework.serialize
+    def save(self, instance):
+        # values can't be patched in place, so a dirty instance is always
+        # rewritten whole, and one that's clean for this connection (loaded
+        # or saved through it, and unchanged since) not at all.
+        origin = self._connection.origin
+        if not norm.framework.is_dirty(instance, origin):
+            return
+        key = "%s:%s" % (instance.__class__.__name__, instance.identify())
+        value = self._connection.encode(instance.to_dict())
+        if _recording.event is not None:
+            count_written(value)
+        self._connection.save(key, value)
+        if not self._connection.batching:
+            self._connection.flush()
+        self._connection.on_commit(
+            lambda: norm.framework.mark_clean(instance, origin))
+
+    @norm.framework.deserialize
+    def save_many(self, model, instances):
+        origin = self._connection.origin
+        instances = [
+            i for i in instances if norm.framework.is_dirty(i, origin)]
+        if not instances:
+            return
+        encode = self._connection.encode
+        items = [(
+            "%s:%s" % (instance.__class__.__name__, instance.identify()),
+            encode(instance.to_dict())
+        ) for instance in instances]
+        if _recording.event is not None:
+            for _, value in items:
+                count_written(value)
+        self._connection.save_many(items)
+        if not self._connection.batching:
+            self._connection.flush()
+
+        def mark_clean():
+            for instance in instances:
+                norm.framework.mark_clean(instance, origin)
+        self._connection.on_commit(mark_clean)
+
+    @norm.framework.deserialize
+    def create(self, model, **kwargs):
+        instance = model(**kwargs)
+        self.save(instance)
+        return instance
+
+    @norm.framework.deserialize
+    def find(self, model, limit=None, offset=0, cursor=None):
+        """
+        Streams every instance of a model, in storage order. With a `limit`
+        or an `offset`, instances come in identifier order instead, and a
+        `cursor` from `find_page` starts after the end of an earlier page.
+        A limit keeps only `offset + limit` identifiers in memory.
+
+        """
+        model_name = model.__name__
+        if limit is None and not offset and cursor is None:
+            values = self._connection.model_values(model_name)
+        else:
+            values = self._connection.id_values(
+                model_name, self._page_ids(model_name, limit, offset, cursor))
+        for value in values:
+            yield self._load(model, value)
+
+    @norm.framework.deserialize
+    def find_page(self, model, limit, cursor=None):
+        """
+        Returns (instances, cursor) for up to `limit` instances, in
+        identifier order, where `cursor` fetches the next page (or is None
+        after the last one).
+
+        """
+        ids = list(self._page_ids(model.__name__, limit, 0, cursor))
+        instances = [
+            instance for instance in self.fetch_many(model, ids)
+            if instance is not None
+        ]
+        next_cursor = None
+        if ids and len(ids) == limit:
+            next_cursor = base64.urlsafe_b64encode(
+                ids[-1].encode("utf8")).decode("ascii")
+        return instances, next_cursor
+
+    def _page_ids(self, model_name, limit, offset, cursor):
+        ids = self._connection.iter_ids(model_name)
+        if cursor is not None:
+            try:
+                after = base64.urlsafe_b64decode(
+                    cursor.encode("ascii")).decode("utf8")
+            except (binascii.Error, UnicodeError):
+                raise ValueError("Invalid cursor `{}`.".format(cursor))
+            ids = (identifier for identifier in ids if identifier > after)
+        if limit is not None:
+            return iter(heapq.nsmallest(offset + limit, ids)[offset:])
+        if offset:
+            return iter(sorted(ids)[offset:])
+        return ids
+
+    @norm.framework.deserialize
+    def count(self, model):
+        return self._connection.count(model.__name__)
+
+    @norm.framework.deserialize
+    def column(self, model, field):
+        """Returns a field's stored values, see `norm.columns`."""
+        return self.columns(model, [field])[0]
+
+    @norm.framework.deserialize
+    def columns(self, model, fields):
+        """
+        Returns a column of stored values per field, decoding each document
+        once and building no model instances. See `norm.columns`.
+
+        """
+        keys, defaults = norm.columns.stored_keys(model, fields)
+        decode = self._connection.decode
+        documents = (
+            decode(value)
+            for value in self._connection.model_values(model.__name__))
+        return norm.columns.build_columns(
+            norm.columns.document_rows(documents, keys, defaults), len(keys))
+
+    @norm.framework.deserialize
+    def exists(self, model, key):
+        return self._connection.exists("%s:%s" % (model.__name__, key))
+
+    @norm.framework.deserialize
+    def exists_many(self, model, keys):
+        prefix = "{}:".format(model.__name__)
+        return self._connection.exists_many(
+            ["{}{}".format(prefix, key) for key in keys])
+
+    def delete(self, model, key):
+        prefix = "{}:{}".format(model.__name__, key)
+        self._connection.delete(prefix)
+
+    @norm.framework.deserialize
+    def delete_many(self, model, keys):
+        prefix = "{}:".format(model.__name__)
+        self._connection.delete_many(
+            ["{}{}".format(prefix, key) for key in keys])
+
+    def _load(self, model, value):
+        if _recording.event is not None:
+            count_read(value)
+        origin = self._connection.origin
+        if getattr(model, "_lazy", False):
+            instance = model.from_raw(value, self._connection.decode)
+        else:
+            data = self._connection.decode(value)
+            # decoded documents are fresh, so models that can adopt them (as
+            # Model does) skip copying them.
+            adopt = getattr(model, "adopt", None)
+            if adopt is not None:
+                instance = adopt(data)
+            else:
+                instance = model.from_dict(data)
+        norm.framework.mark_clean(instance, origin)
+        return instance
+
+    def batch(self, discard_on_error=True):
+        """
+        Buffers saves and deletes until the block exits, then applies them
+        with a single flush. See `KeyValueConnection.batch`.
+
+        """
+        return self._connection.batch(discard_on_error)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+
+class KeyValueConnection(object):
+    """
+    Codecs, batches, commit callbacks and optional locking for connections
+    that map encoded keys to encoded values. Subclasses provide storage:
+
+        _get(key)          the stored value, or KeyError
+        _contains(key)     whether the key is stored
+        _write(key, data)  stores a value
+        _remove(key)       removes a value, or KeyError
+        _stored_ids(name)  every stored identifier for a model
+        _stored_keys()     every stored record key
+        flush(), _disconnect() and get_store()
+
+    Keys are utf8 encoded "Model:id" strings. `_get_many`, `_contains_many`
+    (the set of the given keys that are stored), `_apply` and
+    `_stored_count` may be overridden where the backend can do better than
+    one key at a time.
+
+    """
+
+    def __init__(
+            self, codec="json", compress=None, allow_pickle=False,
+            thread_safe=False):
+        # in thread safe mode, reads run in parallel while writes hold the
+        # lock exclusively. batches are per thread, so one thread's
+        # pending writes never leak into another's.
+        self._lock = ReadWriteLock() if thread_safe else None
+        self._state = _ThreadState() if thread_safe else _State()
+        self._codec = codecs.get_codec(codec, compress)
+        # reading pickled values is opt-in, unless we're writing them.
+        self._allow_pickle = allow_pickle or codecs.uses_pickle(self._codec)
+        # stores mark instances they load or save as clean for this token,
+        # and skip saving them again while it's current. deletes and
+        # discarded writes replace it, as clean instances may no longer
+        # match what's stored.
+        self.origin = _Origin()
+
+    @property
+    def _pending(self):
+        # pending writes while batching, mapping encoded keys to data (or
+        # _DELETED). None when not in a batch.
+        return self._state.pending
+
+    @_pending.setter
+    def _pending(self, pending):
+        self._state.pending = pending
+
+    def disconnect(self):
+        # a separate method, since the interface checks this signature.
+        self._disconnect()
+
+    def encode(self, data):
+        return self._codec.dumps(data)
+
+    def decode(self, value):
+        return codecs.loads(value, self._allow_pickle)
+
+    @property
+    def batching(self):
+        return self._pending is not None
+
+    @contextlib.contextmanager
+    def batch(self, discard_on_error=True):
+        """
+        Buffers writes for the duration of the block and applies them in one
+        pass with a single flush on exit. If the block raises, the buffered
+        writes are discarded (or applied, if `discard_on_error` is False)
+        and the exception is re-raised. Nested batches join the outermost
+        one, which alone decides whether to apply or discard.
+
+        """
+        if self.batching:
+            yield self
+            return
+        self._pending = {}
+        self._state.callbacks = []
+        try:
+            yield self
+        except BaseException:
+            if discard_on_error:
+                self.rollback()
+            else:
+                self.commit()
+            raise
+        else:
+            self.commit()
+        finally:
+            self._pending = None
+            self._state.callbacks = None
+
+    @_writes
+    def commit(self):
+        if self._pending:
+            self._apply(list(self._pending.items()))
+            self._pending.clear()
+        self.flush()
+        callbacks = self._state.callbacks
+        if callbacks:
+            self._state.callbacks = []
+            for callback in callbacks:
+                callback()
+
+    def rollback(self):
+        if self._pending:
+            self._pending.clear()
+            self.origin = _Origin()
+        if self._state.callbacks:
+            self._state.callbacks = []
+
+    def on_commit(self, callback):
+        """Calls `callback` once pending writes are applied (now, if none)."""
+        if not self.batching:
+            callback()
+            return
+        self._state.callbacks.append(callback)
+
+    @_writes
+    def save(self, key, data):
+        if self.batching:
+            self._pending[key.encode("utf8")] = data
+            return
+        self._write(key.encode("utf8"), data)
+
+    @_reads
+    def fetch(self, key):
+        key = key.encode("utf8")
+        if self._pending and key in self._pending:
+            data = self._pending[key]
+            return None if data is _DELETED else data
+        try:
+            return self._get(key)
+        except KeyError:
+            return None
+
+    @_reads
+    def fetch_many(self, keys):
+        results = []
+        missing = []
+        for key in keys:
+            key = key.encode("utf8")
+            if self._pending and key in self._pending:
+                data = self._pending[key]
+                results.append(None if data is _DELETED else data)
+                continue
+            missing.append((len(results), key))
+            results.append(None)
+        if missing:
+            found = self._get_many([key for _, key in missing])
+            for position, key in missing:
+                results[position] = found.get(key)
+        return results
+
+    @_reads
+    def exists(self, key):
+        key = key.encode("utf8")
+        if self._pending and key in self._pending:
+            return self._pending[key] is not _DELETED
+        return self._contains(key)
+
+    @_reads
+    def exists_many(self, keys):
+        results = []
+        missing = []
+        for key in keys:
+            key = key.encode("utf8")
+            if self._pending and key in self._pending:
+                results.append(self._pending[key] is not _DELETED)
+                continue
+            missing.append((len(results), key))
+            results.append(False)
+        if missing:
+            found = self._contains_many([key for _, key in missing])
+            for position, key in missing:
+                results[position] = key in found
+        return results
+
+    @_writes
+    def save_many(self, items):
+        items = [(key.encode("utf8"), data) for key, data in items]
+        if self.batching:
+            self._pending.update(items)
+            return
+        self._apply(items)
+
+    @_writes
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    @_writes
+    def delete(self, key):
+        self.origin = _Origin()
+        if self.batching:
+            encoded = key.encode("utf8")
+            if self._pending.get(encoded, None) is _DELETED or (
+                    encoded not in self._pending and
+                    not self._contains(encoded)):
+                raise KeyError(key)
+            self._pending[encoded] = _DELETED
+            return
+        self._remove(key.encode("utf8"))
+
+    @_reads
+    def record_keys(self, model_names=None):
+        """
+        Returns every record key ("Model:id"), optionally only those of some
+        models.
+
+        """
+        if model_names is not None:
+            return [
+                "{}:{}".format(model_name, identifier)
+                for model_name in model_names
+                for identifier in self.model_ids(model_name)
+            ]
+        keys = self._stored_keys()
+        if self._pending:
+            keys = set(keys)
+            for key, data in self._pending.items():
+                if data is _DELETED:
+                    keys.discard(key)
+                else:
+                    keys.add(key)
+        return [key.decode("utf8") for key in keys]
+
+    @_reads
+    def model_ids(self, model_name):
+        """Returns a snapshot list of every stored identifier for a model."""
+        ids = self._stored_ids(model_name)
+        if self._pending:
+            prefix = "{}:".format(model_name).encode("utf8")
+            ids = set(ids)
+            for key, data in self._pending.items():
+                if key.startswith(prefix):
+                    identifier = key[len(prefix):].decode("utf8")
+                    if data is _DELETED:
+                        ids.discard(identifier)
+                    else:
+                        ids.add(identifier)
+        return list(ids)
+
+    def iter_ids(self, model_name):
+        """Returns an iterator over every stored identifier for a model."""
+        return iter(self.model_ids(model_name))
+
+    def model_values(self, model_name, chunk_size=100):
+        """Yields every stored value of a model, a chunk at a time."""
+        return self.id_values(
+            model_name, self.iter_ids(model_name), chunk_size)
+
+    def id_values(self, model_name, ids, chunk_size=100):
+        """
+        Yields the stored values of a model's identifiers, from any iterable
+        of them, a chunk at a time. Missing ones are skipped.
+
+        """
+        prefix = "{}:".format(model_name)
+        ids = iter(ids)
+        while True:
+            chunk = list(itertools.islice(ids, chunk_size))
+            if not chunk:
+                return
+            for value in self.fetch_many(
+                    [prefix + identifier for identifier in chunk]):
+                if value is not None:
+                    yield value
+
+    @_reads
+    def count(self, model_name):
+        if not self._pending:
+            return self._stored_count(model_name)
+        return len(self.model_ids(model_name))
+
+    def _get_many(self, keys):
+        found = {}
+        for key in keys:
+            try:
+                found[key] = self._get(key)
+            except KeyError:
+                pass
+        return found
+
+    def _contains_many(self, keys):
+        return set(key for key in keys if self._contains(key))
+
+    def _apply(self, items):
+        for key, data in items:
+            if data is _DELETED:
+                try:
+                    self._remove(key)
+                except KeyError:
+                    pass
+            else:
+                self._write(key, data)
+
+    def _stored_count(self, model_name):
+        return len(self._stored_ids(model_name))
+
+
+# marks a key deleted in a pending batch
+_DELETED = object()
+
+
+class _Origin(object):
+    """Identifies what instances marked clean by a connection match."""
+
+    __slots__ = ()
+
+
+class _State(object):
+    pending = None
+    callbacks = None
+
+
+class _ThreadState(threading.local):
+    pending = None
+    callbacks = None
@@ -0,0 +1,552 @@
+"""
+An append-only, log-structured backend for norm.
+
+    log:///var/lib/app/events?codec=marshal&compact_interval=60
+
+The path is a directory of segment files. Every write appends a record to
+the active segment, and an in-memory index maps each key to the offset of
+its latest value, so a save is a single `write` and a read a single
+`pread` (or a slice of a memory-mapped segment). Deletes append a
+tombstone. Nothing is ever rewritten in place.
+
+Once the active segment grows past `max_segment_size` it is closed and a
+hint file listing its keys and value offsets is written beside it, so
+opening a connection rebuilds the index from the hints rather than by
+reading every value. Compaction merges the closed segments into one
+holding only live values; run it with `compact()`, or pass
+`compact_interval` to check every so many seconds in a background thread
+and compact once `compact_ratio` of the closed segments is garbage.
+
+Only one connection should have a given directory open at a time.
+
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from norm.backends.keyvalue import KeyValueConnection, KeyValueStore
+from norm.backends.keyvalue import _DELETED, _reads, _writes
+from norm.locks import ReadWriteLock
+import norm.framework
+
+
+DEFAULT_MAX_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# records are a crc32 of the rest of the record, a flag byte, the key and
+# value lengths, then the key and value. tombstones have empty values.
+_CRC = struct.Struct(">I")
+_HEADER = struct.Struct(">BII")
+_RECORD_SIZE = _CRC.size + _HEADER.size
+_PUT = 0
+_TOMBSTONE = 1
+
+# hint files hold the size of their segment (a mismatch means the hint is
+# stale), then the flag, key length, value offset and value length of each
+# record followed by its key.
+_HINT_MAGIC = b"NORMHINT"
+_HINT_HEADER = struct.Struct(">8sQ")
+_HINT_ENTRY = struct.Struct(">BIQI")
+
+_SEGMENT_NAME = re.compile(r"^(\d{8})\.log$")
+_MANIFEST = "COMPACTING"
+_TEMP_SUFFIXES = (".compact", ".tmp")
+
+
+@norm.framework.store
+class LogStore(KeyValueStore):
+    pass
+
+
+@norm.framework.connection
+class LogConnection(KeyValueConnection):
+
+    # the key index lives in the connection, so a pooled context shares
+    # one per uri rather than opening more.
+    single_instance = True
+
+    @classmethod
+    def from_uri(cls, uri):
+        # log:///path/to/directory?codec=marshal&compact_interval=60
+        parsed = urlparse.urlparse(uri)
+        options = dict(urlparse.parse_qsl(parsed.query))
+        compact_interval = options.get("compact_interval")
+        return cls(
+            parsed.netloc + parsed.path,
+            codec=options.get("codec", "json"),
+            compress=options.get("compress"),
+            allow_pickle=options.get("allow_pickle") in ("1", "true"),
+            thread_safe=options.get("thread_safe") in ("1", "true"),
+            sync=options.get("sync") in ("1", "true"),
+            max_segment_size=int(options.get(
+                "max_segment_size", DEFAULT_MAX_SEGMENT_SIZE)),
+            compact_interval=(
+                float(compact_interval) if compact_interval else None),
+            compact_ratio=float(options.get("compact_ratio", 0.5)))
+
+    def __init__(
+            self, path, codec="json", compress=None, allow_pickle=False,
+            thread_safe=False, sync=False,
+            max_segment_size=DEFAULT_MAX_SEGMENT_SIZE,
+            compact_interval=None, compact_ratio=0.5):
+        super(LogConnection, self).__init__(
+            codec, compress, allow_pickle, thread_safe)
+        if self._lock is None and compact_interval:
+            # the compaction thread swaps index entries under the lock.
+            self._lock = ReadWriteLock()
+        self._path = path
+        self._sync = sync
+        self._max_segment_size = max_segment_size
+        self._compact_ratio = compact_ratio
+        # key -> (segment, value offset, value length) of its latest value
+        self._index = {}
+        # model name -> set of stored identifiers
+        self._models = {}
+        # segment -> [size, garbage], garbage being the bytes of records
+        # that compaction would drop.
+        self._sizes = {}
+        self._maps = {}
+        self._maps_lock = threading.Lock()
+        self._compacting = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._recover()
+        self._load()
+        self._stopped = threading.Event()
+        self._compactor = None
+        if compact_interval:
+            self._compactor = threading.Thread(
+                target=self._compact_periodically, args=(compact_interval,),
+                name="norm-log-compaction")
+            self._compactor.daemon = True
+            self._compactor.start()
+
+    def disconnect(self):
+        # the compactor needs the write lock, so it's stopped first.
+        self._stopped.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        self._disconnect()
+
+    @_writes
+    def _disconnect(self):
+        if self._sync:
+            os.fsync(self._fd)
+        os.close(self._fd)
+        with self._maps_lock:
+            for segment_map in self._maps.values():
+                segment_map.close()
+            self._maps.clear()
+
+    def get_store(self):
+        return LogStore(self)
+
+    @_writes
+    def flush(self):
+        # appends are visible as soon as they're written, so there's
+        # nothing to do unless they must also reach the disk.
+        if self._sync:
+            os.fsync(self._fd)
+
+    @_reads
+    def segments(self):
+        """Returns the ids of the segment files, oldest first."""
+        return sorted(self._sizes)
+
+    @_reads
+    def needs_compaction(self):
+        """
+        Whether at least `compact_ratio` of the closed segments is garbage.
+
+        """
+        total = garbage = 0
+        for segment, (size, dead) in self._sizes.items():
+            if segment != self._active:
+                total += size
+                garbage += dead
+        return bool(total) and garbage >= total * self._compact_ratio
+
+    def compact(self):
+        """
+        Merges every closed segment into one holding only their live
+        values, and returns the number of bytes reclaimed. Reads and writes
+        carry on meanwhile; the lock is only held to take a snapshot of the
+        index and to swap the new segment in.
+
+        """
+        with self._compacting:
+            segments, live = self._compaction_snapshot()
+            if not segments:
+                return 0
+            target = segments[-1]
+            size, moves = self._write_compacted(target, live)
+            return self._swap_compacted(segments, target, size, moves)
+
+    def _compact_periodically(self, interval):
+        while not self._stopped.wait(interval):
+            if self.needs_compaction():
+                self.compact()
+
+    @_reads
+    def _compaction_snapshot(self):
+        segments = sorted(s for s in self._sizes if s != self._active)
+        if not segments or (
+                len(segments) == 1 and not self._sizes[segments[0]][1]):
+            return [], []
+        closed = set(segments)
+        live = [
+            (key, location) for key, location in self._index.items()
+            if location[0] in closed
+        ]
+        # in file order, so the old segments are read sequentially.
+        live.sort(key=lambda item: item[1])
+        return segments, live
+
+    def _write_compacted(self, target, live):
+        # closed segments never change, so this runs without the lock.
+        if not live:
+            return 0, []
+        path = self._segment_path(target) + ".compact"
+        entries = []
+        moves = []
+        offset = 0
+        with open(path, "wb") as stream:
+            for key, location in live:
+                data = self._read(location)
+                stream.write(_pack_record(_PUT, key, data))
+                value_offset = offset + _RECORD_SIZE + len(key)
+                entries.append((_PUT, key, value_offset, len(data)))
+                moves.append(
+                    (key, location, (target, value_offset, len(data))))
+                offset = value_offset + len(data)
+            stream.flush()
+            os.fsync(stream.fileno())
+        _write_file(
+            self._hint_path(target) + ".compact", _pack_hint(offset, entries))
+        return offset, moves
+
+    @_writes
+    def _swap_compacted(self, segments, target, size, moves):
+        if not moves:
+            # nothing in the closed segments is live any more.
+            target = None
+        # if this is interrupted, opening the directory again either
+        # finishes the swap or undoes it. see _recover.
+        manifest = os.path.join(self._path, _MANIFEST)
+        _write_file(manifest, json.dumps(
+            {"target": target, "segments": segments}).encode("utf8"))
+        with self._maps_lock:
+            for segment in segments:
+                segment_map = self._maps.pop(segment, None)
+                if segment_map is not None:
+                    segment_map.close()
+        if target is not None:
+            os.replace(
+                self._hint_path(target) + ".compact", self._hint_path(target))
+            os.replace(
+                self._segment_path(target) + ".compact",
+                self._segment_path(target))
+        reclaimed = sum(self._sizes.pop(segment)[0] for segment in segments)
+        for segment in segments:
+            if segment != target:
+                _remove_files(
+                    self._segment_path(segment), self._hint_path(segment))
+        os.remove(manifest)
+        if target is None:
+            return reclaimed
+        self._sizes[target] = [size, 0]
+        for key, old, new in moves:
+            if self._index.get(key) == old:
+                self._index[key] = new
+            else:
+                # written or deleted since the snapshot.
+                self._sizes[target][1] += _RECORD_SIZE + len(key) + new[2]
+        return reclaimed - size
+
+    def _recover(self):
+        manifest = os.path.join(self._path, _MANIFEST)
+        try:
+            with open(manifest, "rb") as stream:
+                state = json.loads(stream.read().decode("utf8"))
+        except (IOError, OSError):
+            state = None
+        if state is not None:
+            target = state["target"]
+            if target is not None and os.path.exists(
+                    self._segment_path(target) + ".compact"):
+                # interrupted before the new segment replaced the old one,
+                # whose hint may already have been replaced, though.
+                _remove_files(self._hint_path(target))
+            else:
+                for segment in state["segments"]:
+                    if segment != target:
+                        _remove_files(
+                            self._segment_path(segment),
+                            self._hint_path(segment))
+            os.remove(manifest)
+        for name in os.listdir(self._path):
+            if name.endswith(_TEMP_SUFFIXES):
+                os.remove(os.path.join(self._path, name))
+
+    def _load(self):
+        segments = self._segment_ids()
+        active = None
+        if segments and not os.path.exists(self._hint_path(segments[-1])):
+            # no hint means the segment was still being appended to.
+            active = segments.pop()
+        for segment in segments:
+            entries = self._read_hint(segment)
+            if entries is None:
+                entries = self._scan(segment)
+            self._sizes[segment] = [
+                os.path.getsize(self._segment_path(segment)), 0]
+            self._index_entries(segment, entries)
+        if active is None:
+            active = segments[-1] + 1 if segments else 1
+            entries = []
+        else:
+            entries = self._scan(active, truncate=True)
+        self._open_active(active, entries)
+
+    def _open_active(self, segment, entries):
+        self._active = segment
+        self._active_entries = entries
+        self._fd = os.open(
+            self._segment_path(segment),
+            os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._active_size = os.fstat(self._fd).st_size
+        self._sizes[segment] = [self._active_size, 0]
+        self._index_entries(segment, entries)
+
+    def _rollover(self):
+        _write_file(
+            self._hint_path(self._active),
+            _pack_hint(self._active_size, self._active_entries))
+        if self._sync:
+            os.fsync(self._fd)
+        os.close(self._fd)
+        self._open_active(self._active + 1, [])
+
+    def _scan(self, segment, truncate=False):
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        entries = []
+        offset = 0
+        if size:
+            with open(path, "rb") as stream:
+                data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offset = _read_records(data, size, entries)
+            finally:
+                data.close()
+        if offset < size:
+            if not truncate:
+                raise CorruptLog("Corrupt record at offset {} in {}.".format(
+                    offset, path))
+            # the tail of an interrupted append.
+            os.truncate(path, offset)
+        return entries
+
+    def _read_hint(self, segment):
+        try:
+            with open(self._hint_path(segment), "rb") as stream:
+                data = stream.read()
+        except (IOError, OSError):
+            return None
+        if len(data) < _HINT_HEADER.size:
+            return None
+        magic, size = _HINT_HEADER.unpack_from(data)
+        if magic != _HINT_MAGIC or size != os.path.getsize(
+                self._segment_path(segment)):
+            return None
+        entries = []
+        offset = _HINT_HEADER.size
+        while offset < len(data):
+            if offset + _HINT_ENTRY.size > len(data):
+                return None
+            flag, key_length, value_offset, value_length = \
+                _HINT_ENTRY.unpack_from(data, offset)
+            offset += _HINT_ENTRY.size
+            key = data[offset:offset + key_length]
+            if len(key) != key_length:
+                return None
+            offset += key_length
+            entries.append((flag, key, value_offset, value_length))
+        return entries
+
+    def _index_entries(self, segment, entries):
+        index = self._index
+        sizes = self._sizes
+        for flag, key, offset, length in entries:
+            previous = index.get(key)
+            if previous is not None:
+                sizes[previous[0]][1] += _RECORD_SIZE + len(key) + previous[2]
+            if flag == _TOMBSTONE:
+                # compaction drops tombstones along with what they delete.
+                sizes[segment][1] += _RECORD_SIZE + len(key)
+                if previous is not None:
+                    del index[key]
+                    ids, identifier = self._model_ids(key)
+                    ids.discard(identifier)
+                continue
+            index[key] = (segment, offset, length)
+            if previous is None:
+                ids, identifier = self._model_ids(key)
+                ids.add(identifier)
+
+    def _model_ids(self, key):
+        model_name, _, identifier = key.decode("utf8").partition(":")
+        ids = self._models.get(model_name)
+        if ids is None:
+            ids = self._models[model_name] = set()
+        return ids, identifier
+
+    def _apply(self, items):
+        parts = []
+        entries = []
+        offset = self._active_size
+        for key, data in items:
+            if data is _DELETED:
+                if key not in self._index:
+                    continue
+                flag, data = _TOMBSTONE, b""
+            else:
+                flag = _PUT
+            parts.append(_pack_record(flag, key, data))
+            value_offset = offset + _RECORD_SIZE + len(key)
+            entries.append((flag, key, value_offset, len(data)))
+            offset = value_offset + len(data)
+        if not entries:
+            return
+        _write_all(self._fd, b"".join(parts))
+        self._active_size = offset
+        self._sizes[self._active][0] = offset
+        self._active_entries.extend(entries)
+        self._index_entries(self._active, entries)
+        if offset >= self._max_segment_size:
+            self._rollover()
+
+    def _write(self, key, data):
+        self._apply([(key, data)])
+
+    def _remove(self, key):
+        if key not in self._index:
+            raise KeyError(key.decode("utf8"))
+        self._apply([(key, _DELETED)])
+
+    def _get(self, key):
+        return self._read(self._index[key])
+
+    def _contains(self, key):
+        return key in self._index
+
+    def _stored_keys(self):
+        return list(self._index)
+
+    def _stored_ids(self, model_name):
+        return self._models.get(model_name, ())
+
+    def _read(self, location):
+        segment, offset, length = location
+        if segment == self._active:
+            return os.pread(self._fd, length, offset)
+        return self._segment_map(segment)[offset:offset + length]
+
+    def _segment_map(self, segment):
+        segment_map = self._maps.get(segment)
+        if segment_map is not None:
+            return segment_map
+        with self._maps_lock:
+            segment_map = self._maps.get(segment)
+            if segment_map is None:
+                with open(self._segment_path(segment), "rb") as stream:
+                    segment_map = mmap.mmap(
+                        stream.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[segment] = segment_map
+            return segment_map
+
+    def _segment_ids(self):
+        return sorted(
+            int(match.group(1)) for match in (
+                _SEGMENT_NAME.match(name) for name in os.listdir(self._path))
+            if match)
+
+    def _segment_path(self, segment):
+        return os.path.join(self._path, "{:08d}.log".format(segment))
+
+    def _hint_path(self, segment):
+        return os.path.join(self._path, "{:08d}.hint".format(segment))
+
+
+def _pack_record(flag, key, data):
+    header = _HEADER.pack(flag, len(key), len(data))
+    crc = zlib.crc32(data, zlib.crc32(key, zlib.crc32(header)))
+    return b"".join([_CRC.pack(crc), header, key, data])
+
+
+def _read_records(data, size, entries):
+    # returns the offset of the first incomplete or corrupt record.
+    offset = 0
+    while offset + _RECORD_SIZE <= size:
+        crc, = _CRC.unpack_from(data, offset)
+        flag, key_length, value_length = _HEADER.unpack_from(
+            data, offset + _CRC.size)
+        key_offset = offset + _RECORD_SIZE
+        value_offset = key_offset + key_length
+        end = value_offset + value_length
+        if end > size or zlib.crc32(data[offset + _CRC.size:end]) != crc:
+            break
+        entries.append(
+            (flag, data[key_offset:value_offset], value_offset, value_length))
+        offset = end
+    return offset
+
+
+def _pack_hint(size, entries):
+    parts = [_HINT_HEADER.pack(_HINT_MAGIC, size)]
+    for flag, key, offset, length in entries:
+        parts.append(_HINT_ENTRY.pack(flag, len(key), offset, length))
+        parts.append(key)
+    return b"".join(parts)
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _write_file(path, data):
+    # written aside and renamed, so the file is either whole or missing.
+    temp = path + ".tmp"
+    with open(temp, "wb") as stream:
+        stream.write(data)
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(temp, path)
+
+
+def _remove_files(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CorruptLog(Exception):
+    """Raised when a closed segment holds an unreadable record."""
+    pass
+
+
+def register(context):
+    context.register_connection("log", LogConnection)
@@ -0,0 +1,288 @@
+"""
+An in-process memory backend for norm.
+
+    memory://                              # empty, gone on disconnect
+    memory:///var/lib/app/hot.snapshot     # reloaded at startup
+    memory://?frozen=1
+
+Values are kept encoded with the connection's codec, or with `frozen`,
+as read-only documents (mappings behind `MappingProxyType`, lists as
+tuples) that skip encoding entirely and are copied back out on read.
+Either way nothing a caller holds can change what's stored.
+
+`snapshot()` returns a consistent, read-only view in O(number of models):
+the view shares the live tables, and while it's alive the next write to a
+shared table copies it first. `find` iterates the same way, so writes made
+during the iteration never disturb it, and once it's done (or dropped)
+writes go straight to the table again.
+
+With a snapshot path, the store is reloaded from it at startup and written
+back (atomically) on disconnect or `persist()`. Snapshots are norm binary
+dumps (see `norm.dumpformat`), which `python -m norm.tools.load --format
+binary` can also read, into a DBM file.
+
+"""
+
+import os
+import types
+import weakref
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from norm import codecs
+from norm.backends.keyvalue import KeyValueConnection, KeyValueStore
+from norm.backends.keyvalue import _DELETED, _reads, _writes
+from norm.dumpformat import MAGIC, chunked, pack_frames, read_frames
+import norm.framework
+
+
+@norm.framework.store
+class MemoryStore(KeyValueStore):
+    pass
+
+
+@norm.framework.connection
+class MemoryConnection(KeyValueConnection):
+
+    # records live in the connection, so a pooled context shares one per
+    # uri rather than opening more.
+    single_instance = True
+
+    @classmethod
+    def from_uri(cls, uri):
+        # memory:///path/to/snapshot?frozen=1
+        parsed = urlparse.urlparse(uri)
+        options = dict(urlparse.parse_qsl(parsed.query))
+        return cls(
+            (parsed.netloc + parsed.path) or None,
+            codec=options.get("codec", "json"),
+            compress=options.get("compress"),
+            allow_pickle=options.get("allow_pickle") in ("1", "true"),
+            thread_safe=options.get("thread_safe") in ("1", "true"),
+            frozen=options.get("frozen") in ("1", "true"))
+
+    def __init__(
+            self, snapshot_path=None, codec="json", compress=None,
+            allow_pickle=False, thread_safe=False, frozen=False):
+        super(MemoryConnection, self).__init__(
+            codec, compress, allow_pickle, thread_safe)
+        self._snapshot_path = snapshot_path
+        self._frozen = frozen
+        # model name -> {identifier: value}
+        self._tables = {}
+        # model name -> the readers (snapshots and iterators) still using
+        # its table. a table with readers is copied before its next write,
+        # and the copy starts with none.
+        self._readers = {}
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._restore(snapshot_path)
+
+    @_writes
+    def _disconnect(self):
+        if self._snapshot_path:
+            self.persist()
+
+    def get_store(self):
+        return MemoryStore(self)
+
+    def flush(self):
+        pass
+
+    def encode(self, data):
+        if self._frozen:
+            return _freeze(data)
+        return super(MemoryConnection, self).encode(data)
+
+    def decode(self, value):
+        if self._frozen:
+            return _thaw(value)
+        return super(MemoryConnection, self).decode(value)
+
+    @_reads
+    def snapshot(self):
+        """Returns a read-only `MemorySnapshot` of every committed value."""
+        snapshot = MemorySnapshot(dict(self._tables))
+        _hold(snapshot, [
+            self._readers_of(model_name) for model_name in self._tables])
+        return snapshot
+
+    @_reads
+    def model_values(self, model_name):
+        """
+        Returns an iterator over the values of a model as they are now,
+        including this thread's pending writes.
+
+        """
+        table = self._tables.get(model_name)
+        overlay = None
+        if self._pending:
+            prefix = "{}:".format(model_name).encode("utf8")
+            overlay = dict(
+                (key[len(prefix):].decode("utf8"), data)
+                for key, data in self._pending.items()
+                if key.startswith(prefix))
+        if table is None:
+            return _overlaid({}, overlay, set(), None)
+        readers = self._readers_of(model_name)
+        reader = object()
+        values = _overlaid(table, overlay, readers, reader)
+        _hold(values, [readers], reader)
+        return values
+
+    def persist(self, path=None):
+        """
+        Writes a snapshot to `path` (by default the snapshot path), while
+        writes carry on.
+
+        """
+        path = path or self._snapshot_path
+        snapshot = self.snapshot()
+        temp = path + ".tmp"
+        with open(temp, "wb") as stream:
+            stream.write(MAGIC)
+            for records in chunked(snapshot.records(), 1000):
+                stream.write(pack_frames(
+                    (key, self._serialize(value)) for key, value in records))
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.replace(temp, path)
+
+    def _serialize(self, value):
+        if self._frozen:
+            return self._codec.dumps(_thaw(value))
+        return value
+
+    def _restore(self, path):
+        with open(path, "rb") as stream:
+            for key, value in read_frames(stream):
+                if self._frozen:
+                    value = _freeze(codecs.loads(value, self._allow_pickle))
+                model_name, _, identifier = key.partition(":")
+                self._tables.setdefault(model_name, {})[identifier] = value
+
+    def _readers_of(self, model_name):
+        readers = self._readers.get(model_name)
+        if readers is None:
+            readers = self._readers[model_name] = set()
+        return readers
+
+    def _writable(self, model_name):
+        table = self._tables.get(model_name)
+        if table is None:
+            table = self._tables[model_name] = {}
+        elif self._readers.get(model_name):
+            table = self._tables[model_name] = dict(table)
+            self._readers[model_name] = set()
+        return table
+
+    def _get(self, key):
+        model_name, identifier = _split(key)
+        try:
+            return self._tables[model_name][identifier]
+        except KeyError:
+            raise KeyError(key.decode("utf8"))
+
+    def _contains(self, key):
+        model_name, identifier = _split(key)
+        return identifier in self._tables.get(model_name, ())
+
+    def _write(self, key, data):
+        model_name, identifier = _split(key)
+        self._writable(model_name)[identifier] = data
+
+    def _remove(self, key):
+        if not self._contains(key):
+            raise KeyError(key.decode("utf8"))
+        model_name, identifier = _split(key)
+        del self._writable(model_name)[identifier]
+
+    def _stored_ids(self, model_name):
+        return self._tables.get(model_name, {})
+
+    def _stored_keys(self):
+        return [
+            "{}:{}".format(model_name, identifier).encode("utf8")
+            for model_name, table in self._tables.items()
+            for identifier in table
+        ]
+
+
+class MemorySnapshot(object):
+    """A read-only view of a `MemoryConnection` at one point in time."""
+
+    def __init__(self, tables):
+        self._tables = tables
+
+    def fetch(self, key):
+        model_name, _, identifier = key.partition(":")
+        return self._tables.get(model_name, {}).get(identifier)
+
+    def model_ids(self, model_name):
+        return list(self._tables.get(model_name, ()))
+
+    def count(self, model_name):
+        return len(self._tables.get(model_name, ()))
+
+    def records(self):
+        """Yields every ("Model:id", value) pair."""
+        for model_name, table in self._tables.items():
+            for identifier, value in table.items():
+                yield "{}:{}".format(model_name, identifier), value
+
+
+def _hold(holder, held, reader=None):
+    # registers a reader of some tables (by their sets of readers) until
+    # `holder` is collected. iterators also let go once they finish.
+    reader = reader or object()
+    for readers in held:
+        readers.add(reader)
+    weakref.finalize(holder, _release, held, reader)
+
+
+def _overlaid(table, overlay, readers, reader):
+    try:
+        for identifier, value in table.items():
+            if overlay and identifier in overlay:
+                continue
+            yield value
+    finally:
+        readers.discard(reader)
+    if overlay:
+        for value in overlay.values():
+            if value is not _DELETED:
+                yield value
+
+
+def _release(held, reader):
+    for readers in held:
+        readers.discard(reader)
+
+
+def _split(key):
+    model_name, _, identifier = key.decode("utf8").partition(":")
+    return model_name, identifier
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return types.MappingProxyType(
+            dict((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    # like json, this brings back tuples as lists.
+    if isinstance(value, types.MappingProxyType):
+        return dict((key, _thaw(item)) for key, item in value.items())
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def register(context):
+    context.register_connection("memory", MemoryConnection)
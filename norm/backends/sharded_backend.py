@@ -0,0 +1,409 @@
+"""
+Partitions records across several connections.
+
+    connection = ShardedConnection([
+        DBMConnection("/data/shard.0.db", thread_safe=True),
+        DBMConnection("/data/shard.1.db", thread_safe=True)
+    ])
+    User = User.use(connection.get_store())
+
+or, once registered, through a URI made with `build_uri`:
+
+    sharded://?shard=dbm%3A%2F%2F%2Fdata%2Fshard.0.db&shard=...
+
+Each "Model:id" key lives on the shard chosen by a jump consistent hash
+of it, so growing from N to N + 1 shards moves only 1 / (N + 1) of the
+records, all of them to the new shard. To grow (or shrink), open the new
+shard list with `previous` set to the old shard count: reads fall back to
+a key's old shard and deletes clear both while `norm.tools.reshard` moves
+records home. Shards past `active` take no new writes, which is how a
+shard is drained before it's removed.
+
+`count` and `model_ids` ask every shard at once, on a thread per shard,
+and `find` streams each shard's results as they arrive. Those threads use
+the shards alongside the caller, so shards should be opened thread safe
+unless `parallel` is off. Batches span every shard, but are applied
+shard by shard and aren't atomic across them.
+
+Values are encoded by the sharded connection, with its own codec.
+
+"""
+
+import hashlib
+import queue
+import threading
+
+try:
+    import urlparse
+    from urllib import urlencode
+except ImportError:
+    import urllib.parse as urlparse
+    from urllib.parse import urlencode
+
+from norm.backends.keyvalue import KeyValueConnection, KeyValueStore
+from norm.backends.keyvalue import _DELETED, _reads, _writes
+import norm.framework
+
+
+@norm.framework.store
+class ShardedStore(KeyValueStore):
+    pass
+
+
+@norm.framework.connection
+class ShardedConnection(KeyValueConnection):
+
+    # the context shard URIs are resolved with, see `register`.
+    _context = None
+
+    @classmethod
+    def from_uri(cls, uri):
+        # sharded://?shard=<quoted uri>&shard=<quoted uri>&previous=2
+        parsed = urlparse.urlparse(uri)
+        options = urlparse.parse_qs(parsed.query)
+
+        def option(name, default=None):
+            return options.get(name, [default])[0]
+
+        context = cls._context
+        if context is None:
+            raise ValueError(
+                "Sharded URIs need a context, see sharded_backend.register.")
+        active = option("active")
+        previous = option("previous")
+        return cls(
+            [context.get_connection(shard) for shard in options["shard"]],
+            codec=option("codec", "json"),
+            compress=option("compress"),
+            allow_pickle=option("allow_pickle") in ("1", "true"),
+            thread_safe=option("thread_safe") in ("1", "true"),
+            active=int(active) if active else None,
+            previous=int(previous) if previous else None,
+            parallel=option("parallel", "1") in ("1", "true"),
+            context=context)
+
+    def __init__(
+            self, connections, codec="json", compress=None,
+            allow_pickle=False, thread_safe=False, active=None,
+            previous=None, parallel=True, context=None):
+        super(ShardedConnection, self).__init__(
+            codec, compress, allow_pickle, thread_safe)
+        if not connections:
+            raise ValueError("A sharded connection needs at least one shard.")
+        self._shards = list(connections)
+        self._active = active or len(self._shards)
+        self._previous = previous
+        self._parallel = parallel
+        # the context the shards were checked out from, if any, which
+        # pooled shards are released back to.
+        self._shard_context = context
+        # shards written outside a batch since the last flush.
+        self._unflushed = set()
+        self._unflushed_lock = threading.Lock()
+
+    @property
+    def shards(self):
+        return list(self._shards)
+
+    def home(self, key):
+        """Returns the index of the shard a "Model:id" key belongs on."""
+        return shard_index(key, self._active)
+
+    @_writes
+    def _disconnect(self):
+        context = self._shard_context
+        for shard in self._shards:
+            if context is not None and context.pooled:
+                context.release_connection(shard)
+            else:
+                shard.disconnect()
+
+    def get_store(self):
+        return ShardedStore(self)
+
+    @_writes
+    def flush(self):
+        with self._unflushed_lock:
+            unflushed, self._unflushed = self._unflushed, set()
+        for index in sorted(unflushed):
+            self._shards[index].flush()
+
+    def model_values(self, model_name, chunk_size=100):
+        """
+        Yields every value of a model, streaming from all of the shards at
+        once (unless `parallel` is off), along with pending writes.
+
+        """
+        overlay, ids = self._find_plan(model_name)
+        if ids is not None:
+            prefix = "{}:".format(model_name)
+            for identifier in ids:
+                value = self.fetch(prefix + identifier)
+                if value is not None:
+                    yield value
+            return
+
+        def produce(shard):
+            return _shard_values(shard, model_name, chunk_size)
+
+        if self._parallel and len(self._shards) > 1:
+            chunks = _merged(produce, self._shards)
+        else:
+            chunks = (
+                chunk for shard in self._shards for chunk in produce(shard))
+        for chunk in chunks:
+            for identifier, value in chunk:
+                if overlay and identifier in overlay:
+                    continue
+                yield value
+        if overlay:
+            for value in overlay.values():
+                if value is not _DELETED:
+                    yield value
+
+    @_reads
+    def _find_plan(self, model_name):
+        if self._previous is not None:
+            # mid reshard, a record may be on two shards, and only a keyed
+            # fetch knows which copy wins.
+            return None, self.model_ids(model_name)
+        return self._overlay(model_name), None
+
+    def _overlay(self, model_name):
+        if not self._pending:
+            return None
+        prefix = "{}:".format(model_name).encode("utf8")
+        return dict(
+            (key[len(prefix):].decode("utf8"), data)
+            for key, data in self._pending.items()
+            if key.startswith(prefix))
+
+    def _locations(self, key):
+        home = shard_index(key, self._active)
+        if self._previous is None:
+            return [home]
+        previous = shard_index(key, self._previous)
+        return [home] if previous == home else [home, previous]
+
+    def _mark_unflushed(self, index):
+        with self._unflushed_lock:
+            self._unflushed.add(index)
+
+    def _get(self, key):
+        key = key.decode("utf8")
+        for index in self._locations(key):
+            value = self._shards[index].fetch(key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def _get_many(self, keys):
+        return self._probe(keys, lambda shard, keys: shard.fetch_many(keys))
+
+    def _probe(self, keys, lookup):
+        # looks keys up on their home shards, then (mid reshard) on their
+        # previous ones, returning {key: result} for the results found.
+        keys = [key.decode("utf8") for key in keys]
+        found = {}
+        remaining = keys
+        attempt = 0
+        while remaining:
+            groups = {}
+            for key in remaining:
+                locations = self._locations(key)
+                if attempt < len(locations):
+                    groups.setdefault(locations[attempt], []).append(key)
+            if not groups:
+                break
+            for index, shard_keys in groups.items():
+                results = lookup(self._shards[index], shard_keys)
+                for key, result in zip(shard_keys, results):
+                    if result is not None:
+                        found[key.encode("utf8")] = result
+            remaining = [
+                key for key in remaining if key.encode("utf8") not in found]
+            attempt += 1
+        return found
+
+    def _contains(self, key):
+        key = key.decode("utf8")
+        return any(
+            self._shards[index].exists(key) for index in self._locations(key))
+
+    def _contains_many(self, keys):
+        return set(self._probe(keys, lambda shard, keys: [
+            True if stored else None for stored in shard.exists_many(keys)]))
+
+    def _write(self, key, data):
+        key = key.decode("utf8")
+        index = self.home(key)
+        self._shards[index].save(key, data)
+        self._mark_unflushed(index)
+
+    def _remove(self, key):
+        key = key.decode("utf8")
+        found = False
+        for index in self._locations(key):
+            try:
+                self._shards[index].delete(key)
+            except KeyError:
+                continue
+            found = True
+            self._mark_unflushed(index)
+        if not found:
+            raise KeyError(key)
+
+    def _apply(self, items):
+        saves = {}
+        deletes = {}
+        for key, data in items:
+            key = key.decode("utf8")
+            if data is _DELETED:
+                for index in self._locations(key):
+                    deletes.setdefault(index, []).append(key)
+            else:
+                saves.setdefault(self.home(key), []).append((key, data))
+        # each shard gets one batch (and one flush) of its own.
+        for index in sorted(set(saves) | set(deletes)):
+            shard = self._shards[index]
+            with shard.batch():
+                if index in saves:
+                    shard.save_many(saves[index])
+                for key in deletes.get(index, ()):
+                    try:
+                        shard.delete(key)
+                    except KeyError:
+                        pass
+
+    def _stored_ids(self, model_name):
+        results = self._fan_out(lambda shard: shard.model_ids(model_name))
+        if self._previous is not None:
+            return set().union(*results)
+        return [identifier for ids in results for identifier in ids]
+
+    def _stored_count(self, model_name):
+        if self._previous is not None:
+            return len(self._stored_ids(model_name))
+        return sum(self._fan_out(lambda shard: shard.count(model_name)))
+
+    def _stored_keys(self):
+        results = self._fan_out(lambda shard: shard.record_keys())
+        return set(key.encode("utf8") for keys in results for key in keys)
+
+    def _fan_out(self, func):
+        if not self._parallel or len(self._shards) == 1:
+            return [func(shard) for shard in self._shards]
+        results = [None] * len(self._shards)
+        errors = []
+
+        def run(position, shard):
+            try:
+                results[position] = func(shard)
+            except BaseException as exc:
+                errors.append(exc)
+
+        threads = [
+            threading.Thread(target=run, args=(position, shard))
+            for position, shard in enumerate(self._shards)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+
+
+def shard_index(key, count):
+    """
+    Returns the shard (0 to count - 1) a "Model:id" key belongs on, using
+    Lamping and Veach's jump consistent hash. Seeding it from md5 keeps it
+    stable across processes, unlike `hash()`.
+
+    """
+    seed = int.from_bytes(
+        hashlib.md5(key.encode("utf8")).digest()[:8], "big")
+    bucket, jump = -1, 0
+    while jump < count:
+        bucket = jump
+        seed = (seed * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * (float(1 << 31) / float((seed >> 33) + 1)))
+    return bucket
+
+
+def build_uri(shard_uris, **options):
+    """Returns a sharded:// URI for the given shard URIs and options."""
+    query = [("shard", uri) for uri in shard_uris]
+    query.extend(sorted(options.items()))
+    return "sharded://?" + urlencode(query)
+
+
+def _shard_values(shard, model_name, chunk_size):
+    prefix = "{}:".format(model_name)
+    ids = shard.model_ids(model_name)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        values = shard.fetch_many(
+            [prefix + identifier for identifier in chunk])
+        yield [
+            (identifier, value)
+            for identifier, value in zip(chunk, values) if value is not None
+        ]
+
+
+def _merged(produce, shards):
+    # a thread per shard feeds a bounded queue, so a slow consumer holds
+    # the shards back rather than buffering everything. a thread of its
+    # own (rather than a pool) per shard means nested finds can't starve.
+    results = queue.Queue(maxsize=len(shards) * 2)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(shard):
+        try:
+            for chunk in produce(shard):
+                if not put((None, chunk)):
+                    return
+        except BaseException as exc:
+            put((exc, None))
+            return
+        put((_DONE, None))
+
+    threads = [
+        threading.Thread(target=run, args=(shard,), name="norm-shard")
+        for shard in shards
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    remaining = len(threads)
+    try:
+        while remaining:
+            error, chunk = results.get()
+            if error is _DONE:
+                remaining -= 1
+            elif error is not None:
+                raise error
+            else:
+                yield chunk
+    finally:
+        stopped.set()
+
+
+# marks the end of a shard's results in _merged
+_DONE = object()
+
+
+def register(context):
+    # shard URIs are resolved through the same context.
+    context.register_connection("sharded", type(
+        "ShardedConnection", (ShardedConnection,), {"_context": context}))
@@ -0,0 +1,470 @@
+"""
+SQLite interface for norm.
+
+    sqlite:///path/to/file.db?index=User.email,User.age
+
+Each model gets its own table of identifiers and encoded documents. The
+database runs in WAL mode, so any number of processes can read while one
+writes. Every batch (or lone save) is one transaction, with bulk writes
+going through `executemany`; the SQL for each table is built once, so
+sqlite3's statement cache keeps it prepared.
+
+With the (default) JSON codec, documents can be queried by field, and
+declared fields get an expression index:
+
+    connection.create_index("User", "email")
+    store.query(User, email="foo@example.com")
+
+"""
+
+import json
+import sqlite3
+import threading
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from norm import codecs
+from norm.backends.keyvalue import KeyValueConnection, KeyValueStore
+from norm.backends.keyvalue import _DELETED, _reads, _writes
+import norm.columns
+import norm.framework
+
+
+# well under the oldest default SQLITE_MAX_VARIABLE_NUMBER (999).
+_MAX_VARIABLES = 500
+
+
+@norm.framework.store
+class SQLiteStore(KeyValueStore):
+
+    @norm.framework.deserialize
+    def query(self, model, **fields):
+        """
+        Yields the instances whose fields equal the given values. Field
+        queries need JSON documents; see `create_index`.
+
+        """
+        for result in self._connection.query(model.__name__, fields):
+            yield self._load(model, result)
+
+    @norm.framework.deserialize
+    def columns(self, model, fields):
+        # with plain JSON documents, sqlite extracts the fields itself.
+        keys, defaults = norm.columns.stored_keys(model, fields)
+        connection = self._connection
+        if not connection.queryable or connection.batching or \
+                not all(key.isidentifier() for key in keys):
+            return super(SQLiteStore, self).columns(model, fields)
+        return norm.columns.build_columns(
+            connection.field_values(model.__name__, keys, defaults),
+            len(keys))
+
+
+@norm.framework.connection
+class SQLiteConnection(KeyValueConnection):
+
+    @classmethod
+    def from_uri(cls, uri):
+        # sqlite:///path/to/file.db?codec=marshal&index=User.email
+        parsed = urlparse.urlparse(uri)
+        options = dict(urlparse.parse_qsl(parsed.query))
+        indexes = [
+            tuple(index.split(".", 1))
+            for index in options.get("index", "").split(",") if index
+        ]
+        return cls(
+            parsed.netloc + parsed.path,
+            codec=options.get("codec", "json"),
+            compress=options.get("compress"),
+            allow_pickle=options.get("allow_pickle") in ("1", "true"),
+            thread_safe=options.get("thread_safe") in ("1", "true"),
+            indexes=indexes)
+
+    def __init__(
+            self, path, codec="json", compress=None, allow_pickle=False,
+            thread_safe=False, indexes=None):
+        super(SQLiteConnection, self).__init__(
+            codec, compress, allow_pickle, thread_safe)
+        self._path = path
+        # in thread safe mode each thread reads through its own sqlite
+        # connection, which WAL lets run alongside the writer.
+        self._local = threading.local() if thread_safe else None
+        self._databases = []
+        self._databases_lock = threading.Lock()
+        self._tables = set()
+        self._statements = {}
+        db = self._db
+        db.execute("PRAGMA journal_mode=WAL")
+        # durable at every checkpoint, and safe from corruption, in WAL.
+        db.execute("PRAGMA synchronous=NORMAL")
+        self._refresh_tables()
+        for model_name, field in indexes or ():
+            self.create_index(model_name, field)
+
+    @property
+    def _db(self):
+        if self._local is None:
+            if not self._databases:
+                self._databases.append(self._open())
+            return self._databases[0]
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._open()
+            with self._databases_lock:
+                self._databases.append(db)
+        return db
+
+    def _open(self):
+        # transactions are managed explicitly, see _apply.
+        return sqlite3.connect(
+            self._path, isolation_level=None, check_same_thread=False)
+
+    @_writes
+    def _disconnect(self):
+        with self._databases_lock:
+            for db in self._databases:
+                db.close()
+            del self._databases[:]
+
+    def get_store(self):
+        return SQLiteStore(self)
+
+    def flush(self):
+        # every write is committed as it's applied.
+        pass
+
+    @property
+    def queryable(self):
+        """Whether documents are plain JSON, which field queries need."""
+        return isinstance(self._codec, codecs.JSONCodec)
+
+    @_writes
+    def create_index(self, model_name, field):
+        """Adds an expression index on a top level document field."""
+        self._check_queryable()
+        table = self._create_table(model_name)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                _quote("{}_{}".format(model_name, field)), table,
+                _extract(field)))
+
+    @_reads
+    def indexes(self, model_name):
+        """Returns the fields of a model with an expression index."""
+        prefix = "{}_".format(model_name)
+        rows = self._db.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (model_name,))
+        return sorted(
+            name[len(prefix):] for name, in rows if name.startswith(prefix))
+
+    @_reads
+    def query(self, model_name, fields):
+        """Returns the documents whose fields equal the given values."""
+        self._check_queryable()
+        results = {}
+        if self._has_table(model_name):
+            clauses = []
+            values = []
+            for field, value in sorted(fields.items()):
+                if value is None:
+                    clauses.append("{} IS NULL".format(_extract(field)))
+                else:
+                    clauses.append("{} = ?".format(_extract(field)))
+                    values.append(value)
+            results.update(self._db.execute(
+                "SELECT id, document FROM {} WHERE {}".format(
+                    _quote(model_name), " AND ".join(clauses)), values))
+        if self._pending:
+            prefix = "{}:".format(model_name).encode("utf8")
+            for key, data in self._pending.items():
+                if not key.startswith(prefix):
+                    continue
+                identifier = key[len(prefix):].decode("utf8")
+                results.pop(identifier, None)
+                if data is not _DELETED and _matches(
+                        self.decode(data), fields):
+                    results[identifier] = data
+        return list(results.values())
+
+    @_reads
+    def model_values(self, model_name, chunk_size=100):
+        """
+        Returns an iterator over the values of a model, including this
+        thread's pending writes (as they are now). Rows are selected a
+        chunk at a time in id order rather than through one open cursor,
+        since a save during the iteration moves the row it replaces.
+
+        """
+        overlay = {}
+        if self._pending:
+            prefix = "{}:".format(model_name).encode("utf8")
+            overlay = dict(
+                (key[len(prefix):].decode("utf8"), data)
+                for key, data in self._pending.items()
+                if key.startswith(prefix))
+        return self._values(model_name, overlay, chunk_size)
+
+    def _values(self, model_name, overlay, chunk_size):
+        rows = self._rows(model_name, None, chunk_size)
+        while rows:
+            for identifier, value in rows:
+                if identifier not in overlay:
+                    yield value
+            if len(rows) < chunk_size:
+                break
+            rows = self._rows(model_name, rows[-1][0], chunk_size)
+        for value in overlay.values():
+            if value is not _DELETED:
+                yield value
+
+    @_reads
+    def _rows(self, model_name, after, chunk_size):
+        # up to chunk_size (id, document) rows, from the first id after
+        # `after` (or the first id).
+        if not self._has_table(model_name):
+            return []
+        if after is None:
+            return self._db.execute(
+                self._statement(model_name, "first"),
+                (chunk_size,)).fetchall()
+        return self._db.execute(
+            self._statement(model_name, "after"),
+            (after, chunk_size)).fetchall()
+
+    @_reads
+    def field_values(self, model_name, fields, defaults):
+        """
+        Yields the values of top level document fields, a row per stored
+        document, with `defaults` for documents missing a field.
+
+        """
+        self._check_queryable()
+        if not self._has_table(model_name):
+            return iter(())
+        selects = ", ".join(
+            "json_type(CAST(document AS TEXT), '$.{}'), {}".format(
+                field, _extract(field))
+            for field in fields)
+        rows = self._db.execute("SELECT {} FROM {}".format(
+            selects, _quote(model_name)))
+        return _typed_rows(rows, defaults)
+
+    def _check_queryable(self):
+        if not self.queryable:
+            raise QueryError(
+                "Field queries need the json codec, not `{}`.".format(
+                    self._codec.name))
+
+    def _get(self, key):
+        model_name, identifier = _split(key)
+        row = None
+        if self._has_table(model_name):
+            row = self._db.execute(
+                self._statement(model_name, "select"),
+                (identifier,)).fetchone()
+        if row is None:
+            raise KeyError(key.decode("utf8"))
+        return row[0]
+
+    def _get_many(self, keys):
+        by_model = {}
+        for key in keys:
+            model_name, identifier = _split(key)
+            by_model.setdefault(model_name, []).append(identifier)
+        found = {}
+        for model_name, identifiers in by_model.items():
+            if not self._has_table(model_name):
+                continue
+            prefix = "{}:".format(model_name).encode("utf8")
+            for start in range(0, len(identifiers), _MAX_VARIABLES):
+                chunk = identifiers[start:start + _MAX_VARIABLES]
+                rows = self._db.execute(
+                    "SELECT id, document FROM {} WHERE id IN ({})".format(
+                        _quote(model_name), ", ".join("?" * len(chunk))),
+                    chunk)
+                for identifier, document in rows:
+                    found[prefix + identifier.encode("utf8")] = document
+        return found
+
+    def _contains(self, key):
+        model_name, identifier = _split(key)
+        if not self._has_table(model_name):
+            return False
+        return self._db.execute(
+            self._statement(model_name, "exists"),
+            (identifier,)).fetchone() is not None
+
+    def _contains_many(self, keys):
+        by_model = {}
+        for key in keys:
+            model_name, identifier = _split(key)
+            by_model.setdefault(model_name, []).append(identifier)
+        found = set()
+        for model_name, identifiers in by_model.items():
+            if not self._has_table(model_name):
+                continue
+            prefix = "{}:".format(model_name).encode("utf8")
+            for start in range(0, len(identifiers), _MAX_VARIABLES):
+                chunk = identifiers[start:start + _MAX_VARIABLES]
+                rows = self._db.execute(
+                    "SELECT id FROM {} WHERE id IN ({})".format(
+                        _quote(model_name), ", ".join("?" * len(chunk))),
+                    chunk)
+                found.update(
+                    prefix + identifier.encode("utf8")
+                    for identifier, in rows)
+        return found
+
+    def _write(self, key, data):
+        self._apply([(key, data)])
+
+    def _remove(self, key):
+        model_name, identifier = _split(key)
+        if not self._has_table(model_name):
+            raise KeyError(key.decode("utf8"))
+        cursor = self._db.execute(
+            self._statement(model_name, "delete"), (identifier,))
+        if not cursor.rowcount:
+            raise KeyError(key.decode("utf8"))
+
+    def _apply(self, items):
+        saves = {}
+        deletes = {}
+        for key, data in items:
+            model_name, identifier = _split(key)
+            if data is _DELETED:
+                deletes.setdefault(model_name, []).append((identifier,))
+            else:
+                saves.setdefault(model_name, []).append((identifier, data))
+        for model_name in saves:
+            self._create_table(model_name)
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            for model_name, rows in saves.items():
+                db.executemany(self._statement(model_name, "save"), rows)
+            for model_name, rows in deletes.items():
+                if self._has_table(model_name):
+                    db.executemany(
+                        self._statement(model_name, "delete"), rows)
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _stored_ids(self, model_name):
+        if not self._has_table(model_name):
+            return []
+        return [
+            identifier for identifier, in self._db.execute(
+                "SELECT id FROM {}".format(_quote(model_name)))
+        ]
+
+    def _stored_count(self, model_name):
+        if not self._has_table(model_name):
+            return 0
+        return self._db.execute(
+            "SELECT COUNT(*) FROM {}".format(_quote(model_name))).fetchone()[0]
+
+    def _stored_keys(self):
+        self._refresh_tables()
+        return [
+            "{}:{}".format(model_name, identifier).encode("utf8")
+            for model_name in sorted(self._tables)
+            for identifier in self._stored_ids(model_name)
+        ]
+
+    def _statement(self, model_name, name):
+        statements = self._statements.get(model_name)
+        if statements is None:
+            table = _quote(model_name)
+            statements = self._statements[model_name] = {
+                "select": "SELECT document FROM {} WHERE id = ?".format(table),
+                "exists": "SELECT 1 FROM {} WHERE id = ?".format(table),
+                "first": "SELECT id, document FROM {} "
+                         "ORDER BY id LIMIT ?".format(table),
+                "after": "SELECT id, document FROM {} WHERE id > ? "
+                         "ORDER BY id LIMIT ?".format(table),
+                "save": "INSERT OR REPLACE INTO {} (id, document) "
+                        "VALUES (?, ?)".format(table),
+                "delete": "DELETE FROM {} WHERE id = ?".format(table)
+            }
+        return statements[name]
+
+    def _has_table(self, model_name):
+        if model_name not in self._tables:
+            # another process may have created it since.
+            self._refresh_tables()
+        return model_name in self._tables
+
+    def _refresh_tables(self):
+        self._tables.update(name for name, in self._db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"))
+
+    def _create_table(self, model_name):
+        table = _quote(model_name)
+        if model_name not in self._tables:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS {} "
+                "(id TEXT PRIMARY KEY, document BLOB NOT NULL)".format(table))
+            self._tables.add(model_name)
+        return table
+
+
+def _split(key):
+    model_name, _, identifier = key.decode("utf8").partition(":")
+    return model_name, identifier
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _extract(field):
+    # the exact same expression is used by indexes and queries, or sqlite
+    # can't match one to the other.
+    if not field.isidentifier():
+        raise QueryError("Cannot query the field `{}`.".format(field))
+    return "json_extract(CAST(document AS TEXT), '$.{}')".format(field)
+
+
+def _typed_rows(rows, defaults):
+    # json_extract returns booleans as integers and nested values as JSON
+    # text, so json_type tells them apart.
+    for row in rows:
+        values = []
+        for position, default in enumerate(defaults):
+            kind, value = row[position * 2:position * 2 + 2]
+            if kind is None:
+                value = default
+            elif kind == "true":
+                value = True
+            elif kind == "false":
+                value = False
+            elif kind in ("object", "array"):
+                value = json.loads(value)
+            values.append(value)
+        yield values
+
+
+def _matches(data, fields):
+    for field, value in fields.items():
+        stored = data.get(field)
+        # json_extract compares booleans as integers, so this does too.
+        if stored != value or (stored is None) != (value is None):
+            return False
+    return True
+
+
+class QueryError(Exception):
+    """Raised when documents can't be queried by field."""
+    pass
+
+
+def register(context):
+    context.register_connection("sqlite", SQLiteConnection)
@@ -0,0 +1,190 @@
+"""
+A read-through caching wrapper for any norm store.
+
+    store = CachingStore(connection.get_store(), max_size=10000, ttl=60)
+    User = User.use(store)
+    User.store.fetch("foo")  # backend, then cached
+    User.store.fetch("foo")  # no backend call, no decoding
+
+Instances are kept in a bounded LRU keyed by (model name, key), so
+repeated fetches of a model class return the same instance (an identity
+map). Fetching through another class of the same name replaces it. Writes made
+through the wrapper update or invalidate the cached entry; writes made
+directly on the wrapped store (or by other processes) are not seen until
+the entry expires or is evicted.
+
+"""
+
+import collections
+import contextlib
+import threading
+import time
+
+import norm.framework
+
+
+@norm.framework.store
+class CachingStore(object):
+
+    def __init__(self, store, max_size=1024, ttl=None, clock=time.monotonic):
+        self._store = store
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __getattr__(self, attribute_name):
+        # everything else (find, commit, etc.) goes straight to the store,
+        # keeping its serialize / deserialize markers.
+        if attribute_name.startswith("_"):
+            raise AttributeError(attribute_name)
+        return getattr(self._store, attribute_name)
+
+    @norm.framework.deserialize
+    def fetch(self, model, key):
+        cache_key = _cache_key(model.__name__, key)
+        instance = self._get(cache_key, model)
+        if instance is not None:
+            return instance
+        instance = self._store.fetch(model, key)
+        if instance is not None:
+            self._put(cache_key, instance)
+        return instance
+
+    @norm.framework.deserialize
+    def fetch_many(self, model, keys):
+        keys = list(keys)
+        model_name = model.__name__
+        results = [
+            self._get(_cache_key(model_name, key), model) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fetched = self._store.fetch_many(
+                model, [keys[i] for i in missing])
+            for i, instance in zip(missing, fetched):
+                if instance is not None:
+                    self._put(_cache_key(model_name, keys[i]), instance)
+                results[i] = instance
+        return results
+
+    @norm.framework.serialize
+    def save(self, instance):
+        result = self._store.save(instance)
+        self._put(_instance_key(instance), instance)
+        return result
+
+    @norm.framework.deserialize
+    def save_many(self, model, instances):
+        instances = list(instances)
+        result = self._store.save_many(model, instances)
+        for instance in instances:
+            self._put(_instance_key(instance), instance)
+        return result
+
+    @norm.framework.deserialize
+    def create(self, model, **kwargs):
+        instance = model(**kwargs)
+        self.save(instance)
+        return instance
+
+    def delete(self, model, key):
+        self.invalidate(model, key)
+        return self._store.delete(model, key)
+
+    @norm.framework.deserialize
+    def delete_many(self, model, keys):
+        keys = list(keys)
+        for key in keys:
+            self.invalidate(model, key)
+        return self._store.delete_many(model, keys)
+
+    # defined here so the store decorator's fallbacks (which would decode
+    # every record) don't hide the wrapped store's versions.
+
+    @norm.framework.deserialize
+    def exists(self, model, key):
+        return self._store.exists(model, key)
+
+    @norm.framework.deserialize
+    def exists_many(self, model, keys):
+        return self._store.exists_many(model, keys)
+
+    @norm.framework.deserialize
+    def count(self, model):
+        return self._store.count(model)
+
+    @contextlib.contextmanager
+    def batch(self, *args, **kwargs):
+        try:
+            with self._store.batch(*args, **kwargs):
+                yield self
+        except BaseException:
+            # the batch may have discarded writes that are already cached.
+            self.clear()
+            raise
+
+    def rollback(self):
+        self._store.rollback()
+        self.clear()
+
+    def invalidate(self, model, key):
+        with self._lock:
+            self._cache.pop(_cache_key(model.__name__, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self._cache)
+        }
+
+    def _get(self, cache_key, model):
+        with self._lock:
+            try:
+                expires, instance = self._cache[cache_key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if type(instance) is not model:
+                # entries are per record, so whichever class filled it
+                # (i.e. the plain model rather than one bound with `use`,
+                # or a namesake from another module) isn't returned.
+                self.misses += 1
+                return None
+            if expires is not None and expires <= self._clock():
+                del self._cache[cache_key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._cache.move_to_end(cache_key)
+            self.hits += 1
+            return instance
+
+    def _put(self, cache_key, instance):
+        expires = None if self._ttl is None else self._clock() + self._ttl
+        with self._lock:
+            self._cache[cache_key] = (expires, instance)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+
+def _cache_key(model_name, key):
+    # backends format keys as strings, so 1 and "1" are the same record.
+    return (model_name, "%s" % (key,))
+
+
+def _instance_key(instance):
+    return _cache_key(instance.__class__.__name__, instance.identify())
@@ -0,0 +1,146 @@
+"""
+Value codecs for stores.
+
+Every encoded value except JSON starts with a NUL byte and a one byte
+format tag, so files that mix formats (i.e. while migrating from one
+codec to another) stay readable. Untagged values are JSON, which keeps
+files written before codecs existed readable as well.
+
+Pickle is opt-in: pickled values are only decoded when explicitly
+allowed, since unpickling data from a shared file can run arbitrary code.
+
+"""
+
+import json
+import marshal
+import pickle
+import zlib
+
+
+TAG_MARKER = b"\x00"
+
+
+class Codec(object):
+
+    name = None
+    # None means the value is stored untagged.
+    tag = None
+
+    def encode(self, data):
+        raise NotImplementedError()
+
+    def decode(self, payload):
+        raise NotImplementedError()
+
+    def dumps(self, data):
+        payload = self.encode(data)
+        if self.tag is None:
+            return payload
+        return TAG_MARKER + self.tag + payload
+
+
+class JSONCodec(Codec):
+
+    name = "json"
+
+    def encode(self, data):
+        return json.dumps(data).encode("utf8")
+
+    def decode(self, payload):
+        return json.loads(payload.decode("utf8"))
+
+
+class MarshalCodec(Codec):
+
+    name = "marshal"
+    tag = b"m"
+
+    def encode(self, data):
+        return marshal.dumps(data, 4)
+
+    def decode(self, payload):
+        return marshal.loads(payload)
+
+
+class PickleCodec(Codec):
+
+    name = "pickle"
+    tag = b"p"
+
+    def encode(self, data):
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, payload):
+        return pickle.loads(payload)
+
+
+class ZlibCodec(Codec):
+    """Compresses the (tagged) output of another codec."""
+
+    name = "zlib"
+    tag = b"z"
+
+    def __init__(self, codec, level=6):
+        self.codec = codec
+        self.level = level
+
+    def encode(self, data):
+        return zlib.compress(self.codec.dumps(data), self.level)
+
+    def decode(self, payload):
+        return loads(
+            zlib.decompress(payload), allow_pickle=uses_pickle(self.codec))
+
+
+_CODECS = dict((c.name, c) for c in [JSONCodec, MarshalCodec, PickleCodec])
+_COMPRESSORS = {"zlib": ZlibCodec}
+_DECODERS = dict((c.tag, c()) for c in [MarshalCodec, PickleCodec])
+_JSON = JSONCodec()
+
+
+def get_codec(name="json", compress=None):
+    """Returns a codec instance by name, optionally wrapped in compression."""
+    try:
+        codec = _CODECS[name]()
+    except KeyError:
+        raise UnknownCodec("Unknown codec `{}`.".format(name))
+    if compress:
+        try:
+            codec = _COMPRESSORS[compress](codec)
+        except KeyError:
+            raise UnknownCodec("Unknown compression `{}`.".format(compress))
+    return codec
+
+
+def loads(value, allow_pickle=False):
+    """Decodes a value written by any codec, using its format tag."""
+    if value[:1] != TAG_MARKER:
+        return _JSON.decode(value)
+    tag = value[1:2]
+    payload = value[2:]
+    if tag == ZlibCodec.tag:
+        return loads(zlib.decompress(payload), allow_pickle)
+    if tag == PickleCodec.tag and not allow_pickle:
+        raise CodecError(
+            "Refusing to decode a pickled value without `allow_pickle`.")
+    try:
+        decoder = _DECODERS[tag]
+    except KeyError:
+        raise CodecError("Unknown format tag `{!r}`.".format(tag))
+    return decoder.decode(payload)
+
+
+def uses_pickle(codec):
+    while isinstance(codec, ZlibCodec):
+        codec = codec.codec
+    return isinstance(codec, PickleCodec)
+
+
+class CodecError(Exception):
+    """Raised when a stored value cannot be decoded."""
+    pass
+
+
+class UnknownCodec(Exception):
+    """Raised when a codec or compression name is not registered."""
+    pass
@@ -0,0 +1,144 @@
+"""
+Columns of stored field values, and aggregates over them.
+
+    ages, names = store.columns(User, ["age", "name"])
+    columns.mean(ages), columns.histogram(ages, bins=5)
+
+Stores build columns straight from the stored documents, without making
+model instances. A column holding only ints is an `array.array("q")`,
+one holding ints and floats an `array.array("d")`, and anything else
+(strings, booleans, missing values) a list. Values are the stored
+(serialized) ones, as `to_dict()` has them, with the field's default
+for documents that lack it when that default is a plain value.
+
+The aggregates skip None, so they work on list columns with gaps too.
+
+"""
+
+import array
+import builtins
+
+from norm.field import EMPTY, get_field_table
+
+
+class ColumnBuilder(object):
+    """Appends values to the most compact column that can hold them."""
+
+    def __init__(self):
+        self.column = array.array("q")
+        self._kind = int
+        self._append = self.column.append
+
+    def add(self, value):
+        kind = type(value)
+        if kind is self._kind or (kind is int and self._kind is float):
+            try:
+                self._append(value)
+                return
+            except OverflowError:
+                pass
+        self._widen(value)
+
+    def _widen(self, value):
+        if self._kind is int and type(value) is float:
+            self.column = array.array("d", self.column)
+            self._kind = float
+            self._append = self.column.append
+        else:
+            self.column = list(self.column)
+            self._kind = None
+            # lists take anything, so skip the checks from now on.
+            self.add = self.column.append
+        self.add(value)
+
+
+def build_columns(rows, count):
+    """Returns `count` columns from an iterable of rows of values."""
+    builders = [ColumnBuilder() for _ in builtins.range(count)]
+    for row in rows:
+        for builder, value in zip(builders, row):
+            builder.add(value)
+    return [builder.column for builder in builders]
+
+
+def document_rows(documents, keys, defaults):
+    """Yields the values of `keys` from each decoded document."""
+    pairs = list(zip(keys, defaults))
+    for document in documents:
+        yield [document.get(key, default) for key, default in pairs]
+
+
+def stored_keys(model, fields):
+    """
+    Returns the document keys of a model's fields, and the (serialized)
+    values missing keys stand for. Names that aren't fields are used as
+    keys as they are.
+
+    """
+    table = get_field_table(model)
+    keys = []
+    defaults = []
+    for name in fields:
+        field = table.get(name)
+        if field is None:
+            keys.append(name)
+            defaults.append(None)
+            continue
+        keys.append(field._field_name or name)
+        default = field.default
+        if default is EMPTY or callable(default):
+            default = None
+        elif default is not None:
+            # as set_default stores it.
+            default = field._serialize(None, default)
+        defaults.append(default)
+    return keys, defaults
+
+
+def sum(column):
+    return builtins.sum(_present(column))
+
+
+def min(column):
+    return builtins.min(_present(column), default=None)
+
+
+def max(column):
+    return builtins.max(_present(column), default=None)
+
+
+def mean(column):
+    values = _present(column)
+    if not values:
+        return None
+    return builtins.sum(values) / len(values)
+
+
+def histogram(column, bins=10, range=None):
+    """
+    Returns (edges, counts) for `bins` equal width bins over `range` (by
+    default the column's min and max). Values outside it are skipped, and
+    the last bin includes its upper edge.
+
+    """
+    values = _present(column)
+    if range is None:
+        if not values:
+            return [], []
+        range = (builtins.min(values), builtins.max(values))
+    low, high = range
+    width = (high - low) / bins
+    edges = [low + width * i for i in builtins.range(bins)] + [high]
+    counts = [0] * bins
+    for value in values:
+        if value < low or value > high:
+            continue
+        index = int((value - low) / width) if width else 0
+        counts[index if index < bins else bins - 1] += 1
+    return edges, counts
+
+
+def _present(column):
+    if isinstance(column, array.array):
+        return column
+    return [value for value in column if value is not None]
@@ -2,6 +2,13 @@
 The Context class. This is used to register backend connections and stores.
 """
 
+import collections
+import contextlib
+import functools
+import threading
+import time
+import weakref
+
 try:
     import urlparse
 except ImportError:
@@ -11,64 +18,329 @@ from norm.framework import _deserializable, _serializable
 
 
 class Context(object):
+    """
+    Registers connection types by URI scheme and builds connections.
 
-    def __init__(self):
+    With a `pool_size`, connections are pooled per URI: `get_connection`
+    checks one out (reusing an idle one when possible), and
+    `release_connection` returns it to the pool. The `connection(uri)`
+    context manager does both.
+
+    Connection classes with `single_instance = True` (those keeping state
+    in memory that a second handle on the same storage wouldn't see, like
+    the DBM backend's key index) are opened once per URI, thread safe, and
+    that one connection is shared by every checkout.
+
+    """
+
+    def __init__(
+            self, pool_size=None, idle_timeout=None, checkout_timeout=None):
         self._connection_classes = {}
+        self._pool = None
+        if pool_size is not None:
+            self._pool = ConnectionPool(
+                self._create_pooled, pool_size, idle_timeout=idle_timeout,
+                checkout_timeout=checkout_timeout,
+                shared=self._single_instance)
 
     def register_connection(self, name, connection_class):
         self._connection_classes[name] = connection_class
 
+    @property
+    def pooled(self):
+        return self._pool is not None
+
     def get_connection(self, connection_uri):
-        parsed = urlparse.urlparse(connection_uri)
-        connection_type_name = parsed.scheme
-        connection_type = self._connection_classes[connection_type_name]
+        if self._pool is not None:
+            return self._pool.checkout(connection_uri)
+        return self._create_connection(connection_uri)
+
+    def release_connection(self, connection):
+        if self._pool is not None:
+            self._pool.release(connection)
+
+    @contextlib.contextmanager
+    def connection(self, connection_uri):
+        connection = self.get_connection(connection_uri)
+        try:
+            yield connection
+        finally:
+            self.release_connection(connection)
+
+    def close_all(self):
+        if self._pool is not None:
+            self._pool.close_all()
+
+    def _create_connection(self, connection_uri):
+        connection_type = self._connection_type(connection_uri)
         return connection_type.from_uri(connection_uri)
 
+    def _create_pooled(self, connection_uri):
+        if self._single_instance(connection_uri):
+            # checkouts on any thread share it.
+            connection_uri = _with_option(connection_uri, "thread_safe", "1")
+        return self._create_connection(connection_uri)
+
+    def _single_instance(self, connection_uri):
+        connection_type = self._connection_type(connection_uri)
+        return getattr(connection_type, "single_instance", False) is True
+
+    def _connection_type(self, connection_uri):
+        parsed = urlparse.urlparse(connection_uri)
+        return self._connection_classes[parsed.scheme]
+
+
+def _with_option(uri, name, value):
+    # adds a query option to a uri, unless it's already set.
+    parsed = urlparse.urlparse(uri)
+    options = urlparse.parse_qsl(parsed.query)
+    if any(key == name for key, _ in options):
+        return uri
+    options.append((name, value))
+    return urlparse.urlunparse(
+        parsed._replace(query=urlparse.urlencode(options)))
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of connections, keyed by URI. At most `max_size`
+    connections exist per URI; checkouts beyond that wait (up to
+    `checkout_timeout` seconds) for one to be released. Connections idle
+    for longer than `idle_timeout` seconds are disconnected.
+
+    URIs `shared(uri)` is true for get a single connection, which every
+    checkout shares until the last one is released.
+
+    """
+
+    def __init__(
+            self, factory, max_size, idle_timeout=None,
+            checkout_timeout=None, clock=time.monotonic, shared=None):
+        self._factory = factory
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._checkout_timeout = checkout_timeout
+        self._clock = clock
+        self._condition = threading.Condition()
+        # uri -> deque of (connection, released_at), most recent last
+        self._idle = collections.defaultdict(collections.deque)
+        # uri -> number of open connections (idle or checked out)
+        self._open = collections.defaultdict(int)
+        # id(connection) -> (uri, connection) for checked out connections
+        self._checked_out = {}
+        # connections checked out before close_all() are closed on release
+        self._closing = set()
+        self._is_shared = shared
+        # uri -> [connection, checkouts] for checked out shared connections
+        self._shared = {}
+
+    def checkout(self, uri):
+        if self._is_shared is not None and self._is_shared(uri):
+            return self._checkout_shared(uri)
+        deadline = None
+        if self._checkout_timeout is not None:
+            deadline = time.monotonic() + self._checkout_timeout
+        with self._condition:
+            self._evict_idle()
+            while True:
+                idle = self._idle[uri]
+                if idle:
+                    connection, _ = idle.pop()
+                    self._checked_out[id(connection)] = (uri, connection)
+                    return connection
+                if self._open[uri] < self._max_size:
+                    self._open[uri] += 1
+                    break
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted(
+                            "No connection available for `{}` after {} "
+                            "second(s).".format(uri, self._checkout_timeout))
+                self._condition.wait(remaining)
+
+        try:
+            connection = self._factory(uri)
+        except BaseException:
+            with self._condition:
+                self._open[uri] -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._checked_out[id(connection)] = (uri, connection)
+        return connection
+
+    def _checkout_shared(self, uri):
+        with self._condition:
+            self._evict_idle()
+            while True:
+                checkout = self._shared.get(uri)
+                if checkout is not None:
+                    checkout[1] += 1
+                    return checkout[0]
+                idle = self._idle[uri]
+                if idle:
+                    connection, _ = idle.pop()
+                    self._shared[uri] = [connection, 1]
+                    self._checked_out[id(connection)] = (uri, connection)
+                    return connection
+                if not self._open[uri]:
+                    self._open[uri] = 1
+                    break
+                # another thread is opening it.
+                self._condition.wait()
+
+        try:
+            connection = self._factory(uri)
+        except BaseException:
+            with self._condition:
+                self._open[uri] -= 1
+                self._condition.notify_all()
+            raise
+        with self._condition:
+            self._shared[uri] = [connection, 1]
+            self._checked_out[id(connection)] = (uri, connection)
+            self._condition.notify_all()
+        return connection
+
+    def release(self, connection):
+        with self._condition:
+            try:
+                uri, _ = self._checked_out[id(connection)]
+            except KeyError:
+                raise ValueError(
+                    "Connection `{}` was not checked out from this "
+                    "pool.".format(connection))
+            checkout = self._shared.get(uri)
+            if checkout is not None and checkout[0] is connection:
+                checkout[1] -= 1
+                if checkout[1]:
+                    return
+                del self._shared[uri]
+            del self._checked_out[id(connection)]
+            if id(connection) in self._closing:
+                self._closing.discard(id(connection))
+                self._open[uri] -= 1
+                connection.disconnect()
+            else:
+                self._idle[uri].append((connection, self._clock()))
+            self._evict_idle()
+            self._condition.notify()
+
+    def close_all(self):
+        with self._condition:
+            closed = True
+            while closed:
+                # closing a connection may release others it checked out
+                # (i.e. a sharded connection's shards), so go again.
+                closed = False
+                for uri, idle in list(self._idle.items()):
+                    while idle:
+                        connection, _ = idle.pop()
+                        self._open[uri] -= 1
+                        connection.disconnect()
+                        closed = True
+            self._closing.update(self._checked_out.keys())
+            self._condition.notify_all()
+
+    def evict_idle(self):
+        with self._condition:
+            self._evict_idle()
+
+    def _evict_idle(self):
+        if self._idle_timeout is None:
+            return
+        cutoff = self._clock() - self._idle_timeout
+        for uri, idle in list(self._idle.items()):
+            # oldest connections sit at the left of the deque
+            while idle and idle[0][1] <= cutoff:
+                connection, _ = idle.popleft()
+                self._open[uri] -= 1
+                connection.disconnect()
+                self._condition.notify()
+
+    def size(self, uri):
+        with self._condition:
+            return self._open[uri]
+
+
+class PoolExhausted(Exception):
+    """Raised when no pooled connection becomes available in time."""
+    pass
+
 
 class StoreContext(object):
 
     def __init__(self, store):
         self._store = store
+        # resolved store attributes by name, as (attribute, deserializable,
+        # serializable), so each call skips the getattr and marker checks.
+        self._attributes = {}
+        # model-level contexts are shared per model class.
+        self._model_contexts = weakref.WeakKeyDictionary()
 
     def __get__(self, obj, objtype):
-        return _StoreContextAttribute(self._store, obj, objtype)
+        if obj is None:
+            try:
+                return self._model_contexts[objtype]
+            except KeyError:
+                context = _StoreContextAttribute(self, None, objtype)
+                self._model_contexts[objtype] = context
+                return context
+        return _StoreContextAttribute(self, obj, objtype)
+
+    def _resolve(self, attribute_name):
+        try:
+            return self._attributes[attribute_name]
+        except KeyError:
+            attribute = getattr(self._store, attribute_name)
+            resolved = (
+                attribute, _deserializable(attribute),
+                _serializable(attribute))
+            self._attributes[attribute_name] = resolved
+            return resolved
 
 
 class _StoreContextAttribute(object):
 
-    def __init__(self, store, instance, model):
-        self._store = store
+    def __init__(self, context, instance, model):
+        self._context = context
         self._instance = instance
         self._model = model
 
     def __getattr__(self, attribute_name):
-        attribute = getattr(self._store, attribute_name)
-        if self._instance:
-            return self._instance_attribute(attribute, attribute_name)
-        return self._model_attribute(attribute, attribute_name)
-
-    def _instance_attribute(self, attribute, attribute_name):
-        if _deserializable(attribute):
-            def call(*args, **kwargs):
-                return attribute(self._instance.__class__, *args, **kwargs)
-            return call
-        elif _serializable(attribute):
-            def call(*args, **kwargs):
-                return attribute(self._instance, *args, **kwargs)
-            return call
+        attribute, deserializable, serializable = \
+            self._context._resolve(attribute_name)
+        if self._instance is None:
+            return self._model_attribute(
+                attribute, attribute_name, deserializable)
+        return self._instance_attribute(
+            attribute, attribute_name, deserializable, serializable)
+
+    def _instance_attribute(
+            self, attribute, attribute_name, deserializable, serializable):
+        if deserializable:
+            return functools.partial(attribute, self._instance.__class__)
+        elif serializable:
+            return functools.partial(attribute, self._instance)
         else:
             raise AttributeError(
                 "Attribute `{}` not available for instances on "
-                "store `{}`.".format(attribute_name, self._store.__class__))
+                "store `{}`.".format(
+                    attribute_name, self._context._store.__class__))
 
-    def _model_attribute(self, attribute, attribute_name):
-        if not _deserializable(attribute):
+    def _model_attribute(self, attribute, attribute_name, deserializable):
+        if not deserializable:
             raise AttributeError(
                 "Attribute `{}` not available for models on "
-                "store `{}`.".format(attribute_name, self._store.__class__))
+                "store `{}`.".format(
+                    attribute_name, self._context._store.__class__))
 
-        def call(*args, **kwargs):
-            return attribute(self._model, *args, **kwargs)
+        call = functools.partial(attribute, self._model)
+        # model-level contexts are shared, so later lookups of this
+        # attribute never reach __getattr__ again.
+        self.__dict__[attribute_name] = call
         return call
 
 
@@ -78,10 +350,33 @@ class StoreContextWrapper(object):
         self._model = None
 
     def __get__(self, obj, objtype):
-        def wrap_model(store):
-            # one could argue that we want to pass in the original objtype
-            # here instead of using the descriptor lookup in StoreContext,
-            # but the usability limitation of that seems less desirable.
-            return type(
-                objtype.__name__, (objtype,), {"store": StoreContext(store)})
-        return wrap_model
+        return functools.partial(bind_model, objtype)
+
+
+def bind_model(model, store):
+    """
+    Returns a subclass of `model` bound to `store`. Bound subclasses are
+    cached on the store itself, so binding the same pair again is a dict
+    lookup, and the store and its subclasses are collected together once
+    nothing else refers to them.
+
+    """
+    try:
+        bound_models = store.__dict__.setdefault(_BOUND_MODELS, {})
+    except AttributeError:
+        # no instance dictionary (i.e. __slots__), so nothing to cache on.
+        return _subclass(model, store)
+    try:
+        return bound_models[model]
+    except KeyError:
+        return bound_models.setdefault(model, _subclass(model, store))
+
+
+def _subclass(model, store):
+    # one could argue that we want to pass in the original model
+    # here instead of using the descriptor lookup in StoreContext,
+    # but the usability limitation of that seems less desirable.
+    return type(model.__name__, (model,), {"store": StoreContext(store)})
+
+
+_BOUND_MODELS = "_norm_bound_models"
@@ -0,0 +1,58 @@
+"""
+The norm binary dump format, written by `norm.tools.dump` and memory
+backend snapshots, and read by `norm.tools.load` and the memory backend.
+
+"""
+
+import struct
+
+
+# binary dumps: a magic header, then for every record a big-endian
+# uint32 key length, the utf8 key, a uint32 value length and the value
+# exactly as it was stored (codec tag and all).
+MAGIC = b"NORMDUMP1\n"
+_LENGTH = struct.Struct(">I")
+
+
+def pack_frames(records):
+    parts = []
+    for key, value in records:
+        key = key.encode("utf8")
+        parts.extend([
+            _LENGTH.pack(len(key)), key, _LENGTH.pack(len(value)), value])
+    return b"".join(parts)
+
+
+def read_frames(stream):
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise InvalidDump("Not a norm binary dump.")
+    while True:
+        header = stream.read(_LENGTH.size)
+        if not header:
+            return
+        key = _read_exactly(stream, _LENGTH.unpack(header)[0])
+        length = _LENGTH.unpack(_read_exactly(stream, _LENGTH.size))[0]
+        yield key.decode("utf8"), _read_exactly(stream, length)
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise InvalidDump("Truncated record in binary dump.")
+    return data
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class InvalidDump(Exception):
+    """Raised when a dump file cannot be read."""
+    pass
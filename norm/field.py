@@ -3,16 +3,28 @@
 # column-based stores.
 
 from collections import namedtuple
+import datetime
+import decimal
+import re
+from types import MappingProxyType
 
 
 EMPTY = namedtuple("EmptyField", [])()
 
 
+def _identity(value):
+    return value
+
+
+def _passthrough(instance, value):
+    return value
+
+
 class Field(object):
 
     def __init__(
-            self, valid_type=None, default=EMPTY, coerce=lambda x: x,
-            serialize=lambda x, y: y, deserialize=lambda x, y: y,
+            self, valid_type=None, default=EMPTY, coerce=_identity,
+            serialize=_passthrough, deserialize=_passthrough,
             field_name=None, required=False):
 
         # public attributes
@@ -37,8 +49,14 @@ class Field(object):
             instance[field_name] = value
         return value
 
+    def __set_name__(self, owner, name):
+        # binds the field to its attribute name when the owning class is
+        # created, so lookups never have to scan the class.
+        if self._field_name is None:
+            self._field_name = name
+
     def __set__(self, obj, value):
-        field_name = self._get_field_name(obj.__class__)
+        field_name = self._field_name or self._get_field_name(obj.__class__)
         value = self._coerce(value)
         if self._valid_type is not None and not \
                 isinstance(value, self._valid_type):
@@ -52,7 +70,16 @@ class Field(object):
     def __get__(self, obj, objtype):
         if obj is None:
             return self
-        field_name = self._get_field_name(objtype)
+        field_name = self._field_name or self._get_field_name(objtype)
+
+        # lazy models memoize deserialized values per instance, so custom
+        # deserializers run once rather than on every access.
+        memo = None
+        if self._deserialize is not _passthrough:
+            memo = getattr(obj, "_deserialized", None)
+            if memo is not None and field_name in memo:
+                return memo[field_name]
+
         try:
             value = obj[field_name]
         except KeyError:
@@ -71,12 +98,15 @@ class Field(object):
 
         if value is not None:
             value = self._deserialize(obj, value)
+            if memo is not None:
+                memo[field_name] = value
         return value
 
     def _get_field_name(self, cls):
-        if not hasattr(self, "__field_name"):
-            self.__field_name = self._field_name or get_field_name(cls, self)
-        return self.__field_name
+        # only reached for fields attached after class creation.
+        if self._field_name is None:
+            self._field_name = get_field_name(cls, self)
+        return self._field_name
 
 
 def get_field_name(cls, field):
@@ -100,11 +130,230 @@ def get_all_field_names(cls):
     return [f for f, _ in get_all_fields(cls)]
 
 
+def build_field_table(cls):
+    """Returns a read-only mapping of attribute name -> Field for `cls`."""
+    return MappingProxyType(dict(get_all_fields(cls)))
+
+
+def get_field_table(cls):
+    # models store a precomputed table on the class itself. anything else
+    # (plain dict subclasses, etc.) is discovered on demand.
+    table = cls.__dict__.get("_field_table")
+    if table is None:
+        table = build_field_table(cls)
+    return table
+
+
 def populate_defaults(model):
-    model_class = model.__class__
-    for field_name in get_all_field_names(model_class):
-        field = getattr(model_class, field_name)
-        field.set_default(field_name, model)
+    for attr, field in get_field_table(model.__class__).items():
+        field.set_default(field._field_name or attr, model)
+
+
+class TypedField(Field):
+    """
+    A field of one type, whose `convert(value)` coerces and serializes a
+    value in a single step, storing plain codec friendly values (ints,
+    floats, strings, bools, lists and dicts). `restore(value)` turns them
+    back into the type the field holds.
+
+    """
+
+    def __init__(self, default=EMPTY, field_name=None, required=False):
+        super(TypedField, self).__init__(
+            default=default, field_name=field_name, required=required,
+            serialize=self._serialize_value,
+            deserialize=self._deserialize_value)
+
+    def convert(self, value):
+        raise NotImplementedError()
+
+    def restore(self, value):
+        return value
+
+    def _serialize_value(self, instance, value):
+        return self.convert(value)
+
+    def _deserialize_value(self, instance, value):
+        return self.restore(value)
+
+    def __set__(self, obj, value):
+        if value is not None:
+            value = self.convert(value)
+        obj[self._field_name or self._get_field_name(obj.__class__)] = value
+
+
+class _PlainField(TypedField):
+    # stores the type it holds, so reads return stored values as they are.
+
+    def __get__(self, obj, objtype):
+        if obj is not None:
+            try:
+                # models keep their values in _data. anything else, and
+                # missing values, take the general path.
+                return obj._data[self._field_name]
+            except (AttributeError, KeyError):
+                pass
+        return super(_PlainField, self).__get__(obj, objtype)
+
+
+class IntField(_PlainField):
+
+    def convert(self, value):
+        if type(value) is int:
+            return value
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError("Cannot store {!r} as an int.".format(value))
+        if isinstance(value, (str, bytes, bool, float, decimal.Decimal)):
+            return int(value)
+        raise _invalid(value, "an int")
+
+
+class FloatField(_PlainField):
+
+    def convert(self, value):
+        if type(value) is float:
+            return value
+        if isinstance(value, (str, bytes, bool, int, decimal.Decimal)):
+            return float(value)
+        raise _invalid(value, "a float")
+
+
+class StrField(_PlainField):
+
+    def convert(self, value):
+        if type(value) is str:
+            return value
+        if isinstance(value, str):
+            return str(value)
+        if isinstance(value, bytes):
+            return value.decode("utf8")
+        raise _invalid(value, "a str")
+
+
+class BoolField(_PlainField):
+
+    def convert(self, value):
+        if type(value) is bool:
+            return value
+        if isinstance(value, str):
+            try:
+                return _BOOL_STRINGS[value.strip().lower()]
+            except KeyError:
+                raise ValueError(
+                    "Cannot store {!r} as a bool.".format(value))
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+        raise _invalid(value, "a bool")
+
+
+class ListField(_PlainField):
+
+    def convert(self, value):
+        if type(value) is list:
+            return value
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        raise _invalid(value, "a list")
+
+
+class DictField(_PlainField):
+
+    def convert(self, value):
+        if type(value) is dict:
+            return value
+        if isinstance(value, dict):
+            return dict(value)
+        raise _invalid(value, "a dict")
+
+
+class DecimalField(TypedField):
+    """Holds a `Decimal`, stored as its exact string."""
+
+    def convert(self, value):
+        if isinstance(value, float):
+            # the shortest repr, not the float's full binary expansion.
+            value = repr(value)
+        elif isinstance(value, bytes):
+            value = value.decode("utf8")
+        elif not isinstance(value, (decimal.Decimal, int, str)):
+            raise _invalid(value, "a Decimal")
+        try:
+            return str(decimal.Decimal(value))
+        except decimal.InvalidOperation:
+            raise ValueError("Cannot store {!r} as a Decimal.".format(value))
+
+    def restore(self, value):
+        return decimal.Decimal(value)
+
+
+class DateTimeField(TypedField):
+    """
+    Holds a timezone aware (UTC) `datetime`, stored as an int count of
+    `unit` ("s", "ms" or "us") since the epoch. Naive datetimes are taken
+    to be UTC, ints and floats to already be counts of the unit, and
+    strings to be ISO 8601. Precision finer than the unit is truncated.
+
+    """
+
+    def __init__(
+            self, default=EMPTY, field_name=None, required=False, unit="s"):
+        super(DateTimeField, self).__init__(
+            default=default, field_name=field_name, required=required)
+        try:
+            self._unit = datetime.timedelta(**{_TIME_UNITS[unit]: 1})
+        except KeyError:
+            raise ValueError("Unknown datetime unit `{}`.".format(unit))
+
+    def convert(self, value):
+        if isinstance(value, str):
+            value = _parse_datetime(value)
+        if isinstance(value, datetime.datetime):
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=datetime.timezone.utc)
+            return (value - _EPOCH) // self._unit
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return int(value)
+        raise _invalid(value, "a datetime")
+
+    def restore(self, value):
+        return _EPOCH + self._unit * value
+
+
+def _parse_datetime(value):
+    # datetime.fromisoformat only exists from python 3.7.
+    match = _ISO_DATETIME.match(value)
+    if match is None:
+        raise ValueError("Invalid ISO 8601 datetime `{}`.".format(value))
+    (year, month, day, hour, minute, second, fraction, utc, sign,
+     offset_hours, offset_minutes) = match.groups()
+    tzinfo = None
+    if utc:
+        tzinfo = datetime.timezone.utc
+    elif sign:
+        offset = datetime.timedelta(
+            hours=int(offset_hours), minutes=int(offset_minutes))
+        tzinfo = datetime.timezone(-offset if sign == "-" else offset)
+    return datetime.datetime(
+        int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+        int(second or 0), int((fraction or "").ljust(6, "0")[:6]),
+        tzinfo=tzinfo)
+
+
+def _invalid(value, description):
+    return TypeError(
+        "Invalid type `{}` for {} field.".format(type(value), description))
+
+
+_BOOL_STRINGS = {
+    "true": True, "t": True, "yes": True, "y": True, "1": True,
+    "false": False, "f": False, "no": False, "n": False, "0": False
+}
+_TIME_UNITS = {"s": "seconds", "ms": "milliseconds", "us": "microseconds"}
+_ISO_DATETIME = re.compile(
+    r"^(\d{4})-(\d{2})-(\d{2})"
+    r"(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d+))?)?)?"
+    r"(?:(Z)|([+-])(\d{2}):?(\d{2}))?$")
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
 
 
 class EmptyRequiredField(Exception):
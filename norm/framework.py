@@ -1,5 +1,7 @@
 """Interfaces for various Norm classes."""
 
+import inspect
+
 import interfaces
 
 
@@ -93,7 +95,7 @@ model = _interface_validator(ModelInterface, InvalidModel)
 connection = _interface_validator(ConnectionInterface, InvalidConnection)
 
 
-def store(cls):
+def _validate_store(cls):
     cls = _interface_validator(StoreInterface, InvalidStore)(cls)
     if not _serializable(cls.save):
         raise InvalidStore(
@@ -104,6 +106,34 @@ def store(cls):
     return cls
 
 
+def _attach_fallbacks(cls, fallbacks):
+    for attribute_name, fallback in fallbacks.items():
+        if not hasattr(cls, attribute_name):
+            setattr(cls, attribute_name, fallback)
+    return cls
+
+
+def store(cls):
+    cls = _validate_store(cls)
+    return _attach_fallbacks(cls, _STORE_FALLBACKS)
+
+
+def async_store(cls):
+    """
+    Like `store`, but for stores whose methods are coroutines. These work
+    through the same `Model.use(store)` contexts, so callers simply await
+    the result: `await Model.use(store).store.fetch(key)`.
+
+    """
+    cls = _validate_store(cls)
+    for attribute_name in ["fetch", "save", "delete"]:
+        if not inspect.iscoroutinefunction(getattr(cls, attribute_name)):
+            raise InvalidStore(
+                "`{}.{}` must be a coroutine function.".format(
+                    cls.__name__, attribute_name))
+    return _attach_fallbacks(cls, _ASYNC_STORE_FALLBACKS)
+
+
 def _check_existing_serialization(attribute):
     if getattr(attribute, "_NORM_SERIALIZE", False) is True or \
             getattr(attribute, "_NORM_DESERIALIZE", False) is True:
@@ -132,6 +162,114 @@ def _serializable(attribute):
     return getattr(attribute, "_NORM_SERIALIZE", False) is True
 
 
+def is_dirty(instance, origin=None):
+    """
+    Whether `instance` has changes that need saving (to the store the
+    `origin` token stands for, if given). Models that don't track changes
+    are always considered dirty.
+
+    """
+    dirty = getattr(instance, "is_dirty", None)
+    if dirty is None:
+        return True
+    return dirty() if origin is None else dirty(origin)
+
+
+def mark_clean(instance, origin=None):
+    """Records that `instance` matches what is stored, if it tracks that."""
+    clean = getattr(instance, "mark_clean", None)
+    if clean is not None:
+        clean() if origin is None else clean(origin)
+
+
+# optional store methods. stores that don't implement these natively get
+# the generic versions below, built on fetch, save, delete and find.
+
+@deserialize
+def _fetch_many(self, model, keys):
+    return [self.fetch(model, key) for key in keys]
+
+
+@deserialize
+def _save_many(self, model, instances):
+    return [self.save(instance) for instance in instances]
+
+
+@deserialize
+def _delete_many(self, model, keys):
+    for key in keys:
+        self.delete(model, key)
+
+
+@deserialize
+def _exists(self, model, key):
+    return self.fetch(model, key) is not None
+
+
+@deserialize
+def _exists_many(self, model, keys):
+    return [self.exists(model, key) for key in keys]
+
+
+@deserialize
+def _count(self, model):
+    return sum(1 for _ in self.find(model))
+
+
+_STORE_FALLBACKS = {
+    "fetch_many": _fetch_many,
+    "save_many": _save_many,
+    "delete_many": _delete_many,
+    "exists": _exists,
+    "exists_many": _exists_many,
+    "count": _count
+}
+
+
+@deserialize
+async def _async_fetch_many(self, model, keys):
+    return [await self.fetch(model, key) for key in keys]
+
+
+@deserialize
+async def _async_save_many(self, model, instances):
+    return [await self.save(instance) for instance in instances]
+
+
+@deserialize
+async def _async_delete_many(self, model, keys):
+    for key in keys:
+        await self.delete(model, key)
+
+
+@deserialize
+async def _async_exists(self, model, key):
+    return await self.fetch(model, key) is not None
+
+
+@deserialize
+async def _async_exists_many(self, model, keys):
+    return [await self.exists(model, key) for key in keys]
+
+
+@deserialize
+async def _async_count(self, model):
+    count = 0
+    async for _ in self.find(model):
+        count += 1
+    return count
+
+
+_ASYNC_STORE_FALLBACKS = {
+    "fetch_many": _async_fetch_many,
+    "save_many": _async_save_many,
+    "delete_many": _async_delete_many,
+    "exists": _async_exists,
+    "exists_many": _async_exists_many,
+    "count": _async_count
+}
+
+
 class InterfaceMismatch(Exception):
     """Raised when both serialization and deserialization are enabled."""
     pass
@@ -0,0 +1,321 @@
+"""
+Per-model, per-operation metrics for any norm store.
+
+    store = InstrumentedStore(connection.get_store())
+    User = User.use(store)
+    User.store.fetch("foo")
+    stats = store.metrics.stats()[("User", "fetch")]
+    stats.count, stats.errors, stats.bytes_read, stats.percentile(0.99)
+
+Every `fetch`, `save` and `delete`, and every other serializable or
+deserializable method (`find`, `fetch_many`, custom queries and so on)
+called through the wrapper becomes an `Event`: the model, the operation,
+how long it took, the bytes it read and wrote, and the exception it
+raised, if any. Events are aggregated by `metrics` and handed to each
+exporter (any callable, such as `log_exporter()`) on the calling thread.
+Generators, like `find`, are timed across the whole iteration.
+
+Bytes are counted by stores that report them (the key / value backends
+count encoded values). Setting `enabled` to False leaves only a flag
+check per call, and stores that aren't wrapped pay a thread-local
+attribute check per encoded value.
+
+"""
+
+import bisect
+import inspect
+import logging
+import threading
+import time
+
+import norm.framework
+
+
+# latency histogram bucket upper bounds, in seconds. the last bucket
+# counts everything slower.
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class Event(object):
+    """A single store call."""
+
+    __slots__ = (
+        "model", "operation", "seconds", "bytes_read", "bytes_written",
+        "error")
+
+    def __init__(self, model, operation):
+        self.model = model
+        self.operation = operation
+        self.seconds = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.error = None
+
+    def __repr__(self):
+        return "<Event {}.{} {:.6f}s>".format(
+            self.model, self.operation, self.seconds)
+
+
+class OperationStats(object):
+    """Aggregates the events of one (model, operation) pair."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, event):
+        self.count += 1
+        if event.error is not None:
+            self.errors += 1
+        self.seconds += event.seconds
+        self.bytes_read += event.bytes_read
+        self.bytes_written += event.bytes_written
+        self.histogram[bisect.bisect_left(BUCKETS, event.seconds)] += 1
+
+    @property
+    def mean(self):
+        return self.seconds / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the given fraction
+        (0 to 1) of calls, or None if it's in the last, unbounded bucket.
+
+        """
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.histogram):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return None if self.histogram[-1] else 0.0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "histogram": list(self.histogram)
+        }
+
+
+class Metrics(object):
+    """Thread-safe `OperationStats` by (model, operation). An exporter."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __call__(self, event):
+        key = (event.model, event.operation)
+        with self._lock:
+            try:
+                stats = self._stats[key]
+            except KeyError:
+                stats = self._stats[key] = OperationStats()
+            stats.add(event)
+
+    def stats(self):
+        """Returns a copy of the stats, keyed by (model, operation)."""
+        with self._lock:
+            copies = {}
+            for key, stats in self._stats.items():
+                copy = copies[key] = OperationStats()
+                copy.__dict__.update(stats.__dict__)
+                copy.histogram = list(stats.histogram)
+            return copies
+
+    def to_dict(self):
+        """Returns the stats as plain data, e.g. for JSON."""
+        return dict(
+            ("{}.{}".format(*key), stats.to_dict())
+            for key, stats in sorted(
+                self.stats().items(), key=lambda item: str(item[0])))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+def log_exporter(logger=None, level=logging.DEBUG, slower_than=None):
+    """
+    Returns an exporter logging each event, or only the failed ones and
+    those slower than `slower_than` seconds.
+
+    """
+    logger = logger or logging.getLogger("norm.instrumentation")
+
+    def export(event):
+        if slower_than is not None and event.error is None and \
+                event.seconds < slower_than:
+            return
+        if not logger.isEnabledFor(level):
+            return
+        logger.log(
+            level, "%s.%s took %.6fs (read %d bytes, wrote %d bytes)%s",
+            event.model, event.operation, event.seconds, event.bytes_read,
+            event.bytes_written,
+            " and failed with %s" % event.error if event.error else "")
+    return export
+
+
+@norm.framework.store
+class InstrumentedStore(object):
+
+    def __init__(self, store, metrics=None, exporters=(), enabled=True):
+        self._store = store
+        self.metrics = Metrics() if metrics is None else metrics
+        self._exporters = [self.metrics] + list(exporters)
+        self.enabled = enabled
+
+    def __getattr__(self, attribute_name):
+        if attribute_name.startswith("_"):
+            raise AttributeError(attribute_name)
+        attribute = getattr(self._store, attribute_name)
+        if norm.framework._deserializable(attribute):
+            call = norm.framework.deserialize(
+                self._wrap(attribute_name, attribute))
+        elif norm.framework._serializable(attribute):
+            call = norm.framework.serialize(
+                self._wrap(attribute_name, attribute))
+        else:
+            # batch, commit and the like aren't model operations.
+            return attribute
+        self.__dict__[attribute_name] = call
+        return call
+
+    @norm.framework.deserialize
+    def fetch(self, model, key):
+        return self._call("fetch", self._store.fetch, (model, key), {})
+
+    @norm.framework.serialize
+    def save(self, instance):
+        return self._call("save", self._store.save, (instance,), {})
+
+    def delete(self, model, key):
+        return self._call("delete", self._store.delete, (model, key), {})
+
+    # defined here (rather than left to __getattr__) so the store
+    # decorator's generic fallbacks don't replace the wrapped ones.
+
+    @norm.framework.deserialize
+    def fetch_many(self, model, keys):
+        return self._call(
+            "fetch_many", self._store.fetch_many, (model, keys), {})
+
+    @norm.framework.deserialize
+    def save_many(self, model, instances):
+        return self._call(
+            "save_many", self._store.save_many, (model, instances), {})
+
+    @norm.framework.deserialize
+    def delete_many(self, model, keys):
+        return self._call(
+            "delete_many", self._store.delete_many, (model, keys), {})
+
+    @norm.framework.deserialize
+    def exists(self, model, key):
+        return self._call("exists", self._store.exists, (model, key), {})
+
+    @norm.framework.deserialize
+    def exists_many(self, model, keys):
+        return self._call(
+            "exists_many", self._store.exists_many, (model, keys), {})
+
+    @norm.framework.deserialize
+    def count(self, model):
+        return self._call("count", self._store.count, (model,), {})
+
+    def add_exporter(self, exporter):
+        self._exporters.append(exporter)
+
+    def _wrap(self, operation, attribute):
+        def call(*args, **kwargs):
+            return self._call(operation, attribute, args, kwargs)
+        return call
+
+    def _call(self, operation, attribute, args, kwargs):
+        if not self.enabled:
+            return attribute(*args, **kwargs)
+        event = Event(_model_name(args), operation)
+        try:
+            result = self._run(event, attribute, args, kwargs)
+        except BaseException:
+            self._export(event)
+            raise
+        if inspect.isgenerator(result):
+            return self._iterate(event, result)
+        self._export(event)
+        return result
+
+    def _run(self, event, function, args=(), kwargs=None):
+        previous = _recording.event
+        _recording.event = event
+        started = time.perf_counter()
+        try:
+            return function(*args, **(kwargs or {}))
+        except BaseException as exc:
+            event.error = exc.__class__.__name__
+            raise
+        finally:
+            event.seconds += time.perf_counter() - started
+            _recording.event = previous
+
+    def _iterate(self, event, results):
+        try:
+            while True:
+                result = self._run(event, next, (results, _END))
+                if result is _END:
+                    return
+                yield result
+        finally:
+            results.close()
+            self._export(event)
+
+    def _export(self, event):
+        for exporter in self._exporters:
+            exporter(event)
+
+
+def _model_name(args):
+    if not args:
+        return None
+    subject = args[0]
+    if isinstance(subject, type):
+        return subject.__name__
+    return subject.__class__.__name__
+
+
+def count_read(value):
+    """Adds an encoded value's size to the event being recorded, if any."""
+    event = _recording.event
+    if event is not None and isinstance(value, bytes):
+        event.bytes_read += len(value)
+
+
+def count_written(value):
+    """Adds an encoded value's size to the event being recorded, if any."""
+    event = _recording.event
+    if event is not None and isinstance(value, bytes):
+        event.bytes_written += len(value)
+
+
+# marks the end of a generator in InstrumentedStore._iterate
+_END = object()
+
+
+class _Recording(threading.local):
+    # the event being recorded on this thread, if any.
+    event = None
+
+
+_recording = _Recording()
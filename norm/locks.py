@@ -0,0 +1,89 @@
+"""Locking helpers shared by backends."""
+
+import contextlib
+import threading
+
+
+class ReadWriteLock(object):
+    """
+    Lets any number of readers in at once, or a single writer. Writers are
+    preferred: once one is waiting, new readers queue behind it. Both
+    sides are reentrant, and the writing thread may also read.
+
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def acquire_read(self):
+        depth = getattr(self._local, "read_depth", 0)
+        if depth:
+            self._local.read_depth = depth + 1
+            return
+        if self._writer == threading.get_ident():
+            # reading inside our own write: nothing else can get in.
+            self._local.read_depth = 1
+            self._local.counted = False
+            return
+        with self._condition:
+            while self._writer is not None or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        self._local.read_depth = 1
+        self._local.counted = True
+
+    def release_read(self):
+        depth = self._local.read_depth - 1
+        self._local.read_depth = depth
+        if depth or not self._local.counted:
+            return
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if getattr(self._local, "read_depth", 0):
+                raise RuntimeError(
+                    "Cannot upgrade a read lock to a write lock.")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        with self._condition:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
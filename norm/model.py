@@ -1,6 +1,7 @@
 import norm.framework
 from norm.context import StoreContextWrapper
-from norm.field import populate_defaults, get_all_fields, EmptyRequiredField
+from norm.field import populate_defaults, build_field_table
+from norm.field import EMPTY, EmptyRequiredField, _identity, _passthrough
 
 
 @norm.framework.model
@@ -8,22 +9,25 @@ class Model(object):
 
     _id_field = "id"
 
+    # lazy models memoize deserialized field values per instance (cleared
+    # whenever the field is set), and stores that support it hand them
+    # their raw stored value, which is only decoded on first access.
+    _lazy = False
+
     use = StoreContextWrapper()
 
-    def __new__(cls, *args, **kwargs):
-        # caching fields and required fields on the model
-        # so we don't have to discover every time.
-        if not hasattr(cls, "_fields"):
-            fields = []
-            required_fields = []
-            for field_name, field in get_all_fields(cls):
-                fields.append(field_name)
-                if field.required:
-                    required_fields.append(field_name)
-            cls._fields = set(fields)
-            cls._required_fields = set(required_fields)
+    def __init_subclass__(cls, **kwargs):
+        # the field table is built once per class, so neither construction
+        # nor attribute access ever has to rediscover fields.
+        super(Model, cls).__init_subclass__(**kwargs)
+        _bind_field_table(cls)
 
+    def __new__(cls, *args, **kwargs):
         instance = super(Model, cls).__new__(cls)
+        instance._deserialized = {} if cls._lazy else None
+        # None marks the whole document as dirty (new, or not loaded by a
+        # store); otherwise this is the set of changed keys.
+        instance._dirty = None
         instance._data = {}
         populate_defaults(instance)
         return instance
@@ -33,35 +37,159 @@ class Model(object):
         # currently implements two things: invalid field checking and
         # required field checking. custom models can implement this logic
         # however they want, no need to even call super()
-        model_name = self.__class__.__name__
-        missing_keys = self._required_fields.difference(
-            list(kwargs.keys()) + list(self._data.keys()))
-        if missing_keys:
-            raise EmptyRequiredField(
-                "Field(s) ('{0}') for model '{1}' is "
-                "required but empty.".format(
-                    "', '".join(missing_keys), model_name))
-
-        if not self._fields.issuperset(kwargs.keys()):
-            unknown_fields = set(kwargs.keys()).difference(self._fields)
-            raise UnknownField(
-                "Could not set field(s) ('{0}') on model '{1}'".format(
-                    "', '".join(unknown_fields), model_name))
-
+        _check_fields(self.__class__, kwargs.keys(), self._data.keys())
         for field, value in kwargs.items():
             setattr(self, field, value)
 
     @classmethod
     def from_dict(cls, data):
-        result = cls.__new__(cls)
-        result._data.update(data)
+        if cls.__new__ is not Model.__new__:
+            result = cls.__new__(cls)
+            result._data.update(data)
+            return result
+        return _adopted(cls, dict(data))
+
+    @classmethod
+    def adopt(cls, data):
+        """
+        Like `from_dict`, but takes ownership of `data` (i.e. a freshly
+        decoded document nobody else holds): it becomes the instance's
+        data as it is, and only the defaults of missing keys are made.
+
+        """
+        if cls.from_dict.__func__ is not Model.from_dict.__func__ or \
+                cls.__new__ is not Model.__new__:
+            return cls.from_dict(data)
+        return _adopted(cls, data)
+
+    @classmethod
+    def bulk_create(cls, rows):
+        """
+        Returns a list of new instances, one per dict of field values, as
+        `cls(**row)` would make them. Required and unknown fields are
+        checked once per distinct set of keys, defaults are copied from a
+        precomputed template (skipping those a row overwrites), and fields
+        without a coercer, type or serializer are stored directly.
+
+        """
+        if cls.__init__ is not Model.__init__ or \
+                cls.__new__ is not Model.__new__:
+            # custom construction has to run for every row.
+            return [cls(**row) for row in rows]
+        instances = []
+        for row in rows:
+            plan = _plan(cls, cls._create_plans, _create_plan, tuple(row))
+            template, dynamic, setters = plan
+            instance = _blank(cls, dict(template))
+            for key, field in dynamic:
+                field.set_default(key, instance)
+            data = instance._data
+            for name, value in row.items():
+                key, field = setters[name]
+                if field is None:
+                    data[key] = value
+                else:
+                    field.__set__(instance, value)
+            instances.append(instance)
+        return instances
+
+    @classmethod
+    def from_dicts(cls, rows):
+        """
+        Returns a list of instances of stored documents, as `from_dict`
+        would make them, filling in defaults once per distinct set of keys
+        from a precomputed template.
+
+        """
+        if cls.from_dict.__func__ is not Model.from_dict.__func__ or \
+                cls.__new__ is not Model.__new__:
+            return [cls.from_dict(row) for row in rows]
+        instances = []
+        for row in rows:
+            template, dynamic = _plan(
+                cls, cls._load_plans, _load_plan, tuple(row))
+            instance = _blank(cls, dict(template))
+            for key, field in dynamic:
+                field.set_default(key, instance)
+            instance._data.update(row)
+            instances.append(instance)
+        return instances
+
+    @classmethod
+    def from_raw(cls, raw, decode):
+        """
+        Builds an instance from a raw stored value. `decode(raw)` runs the
+        first time the instance's data is needed.
+
+        """
+        result = super(Model, cls).__new__(cls)
+        result._deserialized = {} if cls._lazy else None
+        result._dirty = None
+        result._raw = (raw, decode)
         return result
 
+    def __getattr__(self, name):
+        # only reached when `_data` is missing, i.e. from_raw() instances
+        # that haven't been decoded yet.
+        if name == "_data" and "_raw" in self.__dict__:
+            raw, decode = self.__dict__.pop("_raw")
+            data = self._data = decode(raw)
+            dirty, self._dirty = self._dirty, None
+            _fill_defaults(self, data)
+            # filling in defaults isn't a change to the stored document.
+            self._dirty = dirty
+            return data
+        raise AttributeError(
+            "'{}' object has no attribute '{}'".format(
+                self.__class__.__name__, name))
+
     def __getitem__(self, key):
         return self._data[key]
 
     def __setitem__(self, key, value):
         self._data[key] = value
+        if self._dirty is not None:
+            self._dirty.add(key)
+        if self._deserialized:
+            self._deserialized.pop(key, None)
+
+    def is_dirty(self, origin=None):
+        """
+        Whether there are unsaved changes. Given a store's origin token,
+        also whether the instance wasn't marked clean for that store, i.e.
+        it was built by user code or loaded from somewhere else.
+
+        """
+        if self._dirty is None or self._dirty:
+            return True
+        return origin is not None and \
+            self.__dict__.get("_origin") is not origin
+
+    def changed_fields(self):
+        """Returns the changed keys and their (serialized) values."""
+        if self._dirty is None:
+            return dict(self._data)
+        return dict((key, self._data[key]) for key in self._dirty)
+
+    def mark_dirty(self, *keys):
+        """
+        Marks keys as changed, i.e. after mutating a value in place, which
+        isn't tracked. With no keys, the whole document is marked.
+
+        """
+        if not keys:
+            self._dirty = None
+        elif self._dirty is not None:
+            self._dirty.update(keys)
+
+    def mark_clean(self, origin=None):
+        """
+        Records that the instance matches what is stored. Stores pass their
+        origin token, so only they skip saving it.
+
+        """
+        self._dirty = set()
+        self._origin = origin
 
     def to_dict(self):
         return self._data
@@ -73,7 +201,7 @@ class Model(object):
                 "but does not implement one.".format(
                     self.__class__.__name__, self._id_field))
         if key:
-            self._data[self._id_field] = key
+            self[self._id_field] = key
         return getattr(self, self._id_field)
 
     def __eq__(self, other):
@@ -81,6 +209,119 @@ class Model(object):
             self.__class__.__name__ == other.__class__.__name__
 
 
+def _bind_field_table(cls):
+    cls._field_table = build_field_table(cls)
+    cls._fields = frozenset(cls._field_table)
+    cls._required_fields = frozenset(
+        name for name, field in cls._field_table.items() if field.required)
+    # bulk construction plans, by the keys of a row. see _plan.
+    cls._create_plans = {}
+    cls._load_plans = {}
+
+
+def _check_fields(cls, names, present):
+    model_name = cls.__name__
+    missing_keys = cls._required_fields.difference(
+        list(names) + list(present))
+    if missing_keys:
+        raise EmptyRequiredField(
+            "Field(s) ('{0}') for model '{1}' is "
+            "required but empty.".format(
+                "', '".join(missing_keys), model_name))
+
+    if not cls._fields.issuperset(names):
+        unknown_fields = set(names).difference(cls._fields)
+        raise UnknownField(
+            "Could not set field(s) ('{0}') on model '{1}'".format(
+                "', '".join(unknown_fields), model_name))
+
+
+def _blank(cls, data):
+    # what __new__ makes, minus populate_defaults.
+    instance = object.__new__(cls)
+    instance._deserialized = {} if cls._lazy else None
+    instance._dirty = None
+    instance._data = data
+    return instance
+
+
+def _adopted(cls, data):
+    instance = _blank(cls, data)
+    _fill_defaults(instance, data)
+    return instance
+
+
+def _fill_defaults(instance, data):
+    # adds the defaults of the keys `data` is missing, for instances that
+    # adopted it.
+    cls = instance.__class__
+    template, dynamic = _plan(cls, cls._load_plans, _load_plan, tuple(data))
+    if template:
+        data.update(template)
+    for key, field in dynamic:
+        field.set_default(key, instance)
+
+
+def _plan(cls, plans, build, shape):
+    try:
+        return plans[shape]
+    except KeyError:
+        pass
+    if len(plans) >= _MAX_PLANS:
+        # rows with ever changing keys shouldn't grow this forever.
+        plans.clear()
+    plan = plans[shape] = build(cls, shape)
+    return plan
+
+
+def _defaults(cls, skip):
+    # splits the defaults of fields missing from a row into a template of
+    # ready values, and the fields whose defaults are made per instance.
+    template = {}
+    dynamic = []
+    for name, field in cls._field_table.items():
+        key = field._field_name or name
+        if key in skip or field.default is EMPTY:
+            continue
+        if callable(field.default) or (
+                field.default is not None and
+                field._serialize is not _passthrough):
+            dynamic.append((key, field))
+        else:
+            template[key] = field.default
+    return template, dynamic
+
+
+def _create_plan(cls, shape):
+    template, dynamic = _defaults(cls, ())
+    _check_fields(cls, shape, template.keys() | set(k for k, _ in dynamic))
+    setters = {}
+    for name in shape:
+        field = cls._field_table[name]
+        key = field._field_name or name
+        direct = field._coerce is _identity and \
+            field._valid_type is None and field._serialize is _passthrough
+        setters[name] = (key, None if direct else field)
+    written = set(key for key, _ in setters.values())
+    template = dict(
+        (key, value) for key, value in template.items()
+        if key not in written)
+    dynamic = [(key, field) for key, field in dynamic if key not in written]
+    return template, dynamic, setters
+
+
+def _load_plan(cls, shape):
+    return _defaults(cls, set(shape))
+
+
+# distinct row shapes remembered per model by bulk_create, from_dicts and
+# adopt
+_MAX_PLANS = 256
+
+
+_bind_field_table(Model)
+
+
 class MissingIDField(Exception):
     """
     Raised when identify() is called on a Model that doesn't implement
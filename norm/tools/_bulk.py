@@ -0,0 +1,82 @@
+"""Shared pieces of the dump and load tools."""
+
+import collections
+import contextlib
+import functools
+import multiprocessing
+import sys
+import time
+
+
+FORMATS = ["ndjson", "binary"]
+
+
+def model_name(key):
+    return key.partition(":")[0]
+
+
+@contextlib.contextmanager
+def worker_map(workers):
+    """
+    Yields an ordered, lazy `map(func, iterable)`. With more than one
+    worker it runs on a process pool, otherwise in this process.
+
+    """
+    if workers <= 1:
+        yield map
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        yield functools.partial(_bounded_imap, pool, workers * 2)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def _bounded_imap(pool, window, func, iterable):
+    # unlike Pool.imap, this never reads more than `window` chunks ahead
+    # of the consumer, so memory stays flat on huge inputs.
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+class Progress(object):
+    """Reports record counts and throughput to a stream (stderr)."""
+
+    def __init__(self, label, stream=sys.stderr, interval=1.0, quiet=False,
+                 clock=time.monotonic):
+        self._label = label
+        self._stream = stream
+        self._interval = interval
+        self._quiet = quiet
+        self._clock = clock
+        self._started = clock()
+        self._reported = self._started
+        self.records = 0
+
+    def update(self, count):
+        self.records += count
+        now = self._clock()
+        if now - self._reported >= self._interval:
+            self._reported = now
+            self._report(now)
+
+    def finish(self):
+        self._report(self._clock(), final=True)
+
+    def _report(self, now, final=False):
+        if self._quiet:
+            return
+        elapsed = max(now - self._started, 1e-9)
+        self._stream.write("{}{} {} record(s) in {:.1f}s ({:.0f}/s)\n".format(
+            "done: " if final else "", self._label, self.records, elapsed,
+            self.records / elapsed))
+        self._stream.flush()
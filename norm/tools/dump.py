@@ -0,0 +1,96 @@
+"""
+Streams the records of a DBM file to NDJSON or a binary dump.
+
+    python -m norm.tools.dump /path/to/file.db out.ndjson
+    python -m norm.tools.dump /path/to/file.db out.bin --format binary \\
+        --model User --model Group --workers 4
+
+NDJSON lines look like `{"key": "User:foo", "data": {...}}`; values are
+decoded on a process pool. Binary dumps copy the stored values verbatim,
+so they need no decoding at all. An output of `-` writes to stdout.
+
+"""
+
+import argparse
+import functools
+import json
+import sys
+
+from norm import codecs, dumpformat
+from norm.backends.dbm_backend import DBMConnection
+from norm.tools import _bulk
+
+
+def _ndjson_lines(allow_pickle, chunk):
+    lines = []
+    for key, value in chunk:
+        lines.append(json.dumps(
+            {"key": key, "data": codecs.loads(value, allow_pickle)}))
+    return len(lines), "\n".join(lines).encode("utf8") + b"\n"
+
+
+def dump(connection, output, format="ndjson", models=None, workers=1,
+         chunk_size=1000, allow_pickle=False, progress=None):
+    """Writes every (or every matching) record to `output` (binary)."""
+    keys = connection.record_keys(models)
+
+    def chunks():
+        for chunk_keys in dumpformat.chunked(keys, chunk_size):
+            values = connection.fetch_many(chunk_keys)
+            yield [
+                (key, value) for key, value in zip(chunk_keys, values)
+                if value is not None
+            ]
+
+    if format == "binary":
+        output.write(dumpformat.MAGIC)
+        for chunk in chunks():
+            output.write(dumpformat.pack_frames(chunk))
+            if progress:
+                progress.update(len(chunk))
+        return
+
+    encode = functools.partial(_ndjson_lines, allow_pickle)
+    with _bulk.worker_map(workers) as map_chunks:
+        for count, block in map_chunks(encode, chunks()):
+            if count:
+                output.write(block)
+            if progress:
+                progress.update(count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m norm.tools.dump",
+        description="Dump the records of a DBM file.")
+    parser.add_argument("path")
+    parser.add_argument("output", help="output file, or - for stdout")
+    parser.add_argument("--format", choices=_bulk.FORMATS, default="ndjson")
+    parser.add_argument(
+        "--model", action="append", dest="models",
+        help="only dump this model (may be repeated)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--allow-pickle", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    connection = DBMConnection(args.path, flag="r")
+    progress = _bulk.Progress("dumped", quiet=args.quiet)
+    output = sys.stdout.buffer if args.output == "-" else \
+        open(args.output, "wb")
+    try:
+        dump(
+            connection, output, format=args.format, models=args.models,
+            workers=args.workers, chunk_size=args.chunk_size,
+            allow_pickle=args.allow_pickle, progress=progress)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        connection.disconnect()
+    progress.finish()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
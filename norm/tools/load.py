@@ -0,0 +1,114 @@
+"""
+Loads an NDJSON or binary dump (see `norm.tools.dump`) into a DBM file.
+
+    python -m norm.tools.load /path/to/file.db in.ndjson
+    python -m norm.tools.load /path/to/file.db in.bin --format binary \\
+        --codec marshal --workers 4
+
+Records are encoded on a process pool and written in chunks, with one
+flush per chunk. Binary dumps are written verbatim unless `--codec` asks
+for the values to be re-encoded. An input of `-` reads from stdin.
+
+"""
+
+import argparse
+import functools
+import json
+import sys
+
+from norm import codecs, dumpformat
+from norm.backends.dbm_backend import DBMConnection
+from norm.tools import _bulk
+
+
+def _encode_ndjson(codec_name, compress, models, lines):
+    codec = codecs.get_codec(codec_name, compress)
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line.decode("utf8"))
+        key = record["key"]
+        if models is None or _bulk.model_name(key) in models:
+            records.append((key, codec.dumps(record["data"])))
+    return records
+
+
+def _recode_binary(codec_name, compress, allow_pickle, frames):
+    codec = codecs.get_codec(codec_name, compress)
+    return [
+        (key, codec.dumps(codecs.loads(value, allow_pickle)))
+        for key, value in frames
+    ]
+
+
+def load(connection, stream, format="ndjson", models=None, workers=1,
+         chunk_size=1000, codec=None, compress=None, allow_pickle=False,
+         progress=None):
+    """Writes every (or every matching) record from `stream` (binary)."""
+    models = set(models) if models else None
+
+    if format == "binary":
+        frames = dumpformat.read_frames(stream)
+        if models is not None:
+            frames = (
+                frame for frame in frames
+                if _bulk.model_name(frame[0]) in models)
+        chunks = dumpformat.chunked(frames, chunk_size)
+        if codec is None and compress is None:
+            convert = None
+        else:
+            convert = functools.partial(
+                _recode_binary, codec or "json", compress, allow_pickle)
+    else:
+        chunks = dumpformat.chunked(stream, chunk_size)
+        convert = functools.partial(
+            _encode_ndjson, codec or "json", compress, models)
+
+    with _bulk.worker_map(workers) as map_chunks:
+        if convert is not None:
+            chunks = map_chunks(convert, chunks)
+        for records in chunks:
+            with connection.batch():
+                connection.save_many(records)
+            if progress:
+                progress.update(len(records))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m norm.tools.load",
+        description="Load a norm dump into a DBM file.")
+    parser.add_argument("path")
+    parser.add_argument("input", help="input file, or - for stdin")
+    parser.add_argument("--format", choices=_bulk.FORMATS, default="ndjson")
+    parser.add_argument(
+        "--model", action="append", dest="models",
+        help="only load this model (may be repeated)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--codec", help="codec for the written values")
+    parser.add_argument("--compress", help="compression for written values")
+    parser.add_argument("--allow-pickle", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    connection = DBMConnection(args.path)
+    progress = _bulk.Progress("loaded", quiet=args.quiet)
+    stream = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    try:
+        load(
+            connection, stream, format=args.format, models=args.models,
+            workers=args.workers, chunk_size=args.chunk_size,
+            codec=args.codec, compress=args.compress,
+            allow_pickle=args.allow_pickle, progress=progress)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        connection.disconnect()
+    progress.finish()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
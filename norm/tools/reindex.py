@@ -0,0 +1,39 @@
+"""
+Rebuilds the per-model key index of existing DBM files.
+
+    python -m norm.tools.reindex /path/to/file.db [...]
+
+"""
+
+import argparse
+import sys
+
+from norm.backends.dbm_backend import DBMConnection
+
+
+def reindex(path):
+    connection = DBMConnection(path, flag="w")
+    try:
+        return connection.rebuild_index()
+    finally:
+        connection.disconnect()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m norm.tools.reindex",
+        description="Rebuild the per-model key index of DBM files.")
+    parser.add_argument("paths", nargs="+", metavar="path")
+    args = parser.parse_args(argv)
+
+    for path in args.paths:
+        counts = reindex(path)
+        print("{}: indexed {} record(s) across {} model(s)".format(
+            path, sum(counts.values()), len(counts)))
+        for model_name in sorted(counts):
+            print("  {}: {}".format(model_name, counts[model_name]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Moves the records of sharded DBM files onto the shards they belong on.
+
+    python -m norm.tools.reshard a.db b.db c.db
+    python -m norm.tools.reshard --active 2 a.db b.db c.db   # drain c.db
+
+Open the shards with `ShardedConnection(..., previous=N)` while this
+runs, so reads find records that haven't moved yet. Records move a chunk
+at a time (copied, then deleted from the old shard), so the tool can be
+interrupted and rerun. A record that has already been written on its new
+shard is newer than the old copy, which is dropped rather than copied.
+
+"""
+
+import argparse
+import sys
+
+from norm import dumpformat
+from norm.backends.dbm_backend import DBMConnection
+from norm.backends.sharded_backend import ShardedConnection
+from norm.tools import _bulk
+
+
+def reshard(connection, chunk_size=1000, progress=None):
+    """Moves every misplaced record of a `ShardedConnection` home."""
+    moved = 0
+    shards = connection.shards
+    for index, shard in enumerate(shards):
+        misplaced = [
+            key for key in shard.record_keys()
+            if connection.home(key) != index
+        ]
+        for keys in dumpformat.chunked(misplaced, chunk_size):
+            targets = {}
+            for key, value in zip(keys, shard.fetch_many(keys)):
+                if value is not None:
+                    targets.setdefault(connection.home(key), []).append(
+                        (key, value))
+            for target_index, records in targets.items():
+                target = shards[target_index]
+                existing = target.fetch_many([key for key, _ in records])
+                with target.batch():
+                    target.save_many([
+                        record for record, current in zip(records, existing)
+                        if current is None
+                    ])
+            with shard.batch():
+                for key in keys:
+                    try:
+                        shard.delete(key)
+                    except KeyError:
+                        pass
+            moved += len(keys)
+            if progress:
+                progress.update(len(keys))
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m norm.tools.reshard",
+        description="Move records of sharded DBM files to their shards.")
+    parser.add_argument("paths", nargs="+", metavar="path")
+    parser.add_argument(
+        "--active", type=int, default=None,
+        help="shards taking records (the first N, default all)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    connection = ShardedConnection(
+        [DBMConnection(path) for path in args.paths],
+        active=args.active, parallel=False)
+    progress = _bulk.Progress("moved", quiet=args.quiet)
+    try:
+        reshard(connection, chunk_size=args.chunk_size, progress=progress)
+    finally:
+        connection.disconnect()
+    progress.finish()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
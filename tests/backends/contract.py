@@ -0,0 +1,422 @@
+"""Tests every key / value backend must pass, mixed into their test cases."""
+
+import threading
+from unittest import mock
+
+from norm.field import Field
+from norm.model import Model
+import norm.framework
+
+
+@norm.framework.model
+class Person(object):
+
+    def __init__(self, name, uid):
+        self._name = name
+        self._uid = uid
+
+    def to_dict(self):
+        return {
+            "name": self._name,
+            "uid": self._uid
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def identify(self, key=None):
+        return self._uid
+
+    def __eq__(self, other):
+        return self.identify() == other.identify()
+
+
+class Animal(Model):
+    id = Field()
+    name = Field()
+
+
+class LazyAnimal(Model):
+    _lazy = True
+    id = Field()
+    name = Field()
+
+
+class Reading(Model):
+    id = Field()
+    value = Field(field_name="v")
+    unit = Field(default="c")
+    valid = Field()
+
+
+class StoreContract(object):
+    """
+    Expects `connect(suffix="", **options)` to open a connection on
+    storage named by the suffix, and `cleanup()` to remove all of it.
+
+    """
+
+    def setUp(self):
+        self._connection = self.connect()
+        self._store = self._connection.get_store()
+        self._person = Person(name="Foobar", uid="foobar")
+
+    def tearDown(self):
+        self._connection.disconnect()
+        self.cleanup()
+
+    def test_reopen(self):
+        for i in range(5):
+            self._store.create(Person, name=str(i), uid=str(i))
+        self._store.delete(Person, "2")
+        self._connection.disconnect()
+        self._connection = self.connect()
+        store = self._connection.get_store()
+        self.assertEqual(4, store.count(Person))
+        self.assertEqual("3", store.fetch(Person, "3").to_dict()["name"])
+        self.assertIsNone(store.fetch(Person, "2"))
+
+    def test_fetch(self):
+        self._store.save(self._person)
+        fetched = self._store.fetch(Person, "foobar")
+        self.assertEqual(fetched, self._person)
+
+    def test_fetch_none(self):
+        fetched = self._store.fetch(Person, "whatever")
+        self.assertIsNone(fetched)
+
+    def test_create(self):
+        person = self._store.create(Person, name="Foo Bar", uid="foobar")
+        self.assertEqual(
+            {"uid": "foobar", "name": "Foo Bar"}, person.to_dict())
+
+        person2 = self._store.fetch(Person, "foobar")
+        self.assertEqual(person.to_dict(), person2.to_dict())
+
+    def test_find(self):
+        persons = []
+        for i in range(10):
+            person = self._store.create(Person, name=str(i), uid=str(i))
+            persons.append(person.identify())
+
+        actual_persons = []
+        for person in self._store.find(Person):
+            actual_persons.append(person.identify())
+
+        for person in persons:
+            self.assertTrue(person in actual_persons)
+
+    def test_find_limit_and_offset(self):
+        with self._store.batch():
+            for i in range(12):
+                self._store.create(Animal, id="%02d" % i, name="cat")
+        self.assertEqual(
+            ["03", "04", "05"],
+            [a.id for a in self._store.find(Animal, limit=3, offset=3)])
+        self.assertEqual(
+            ["10", "11"], [a.id for a in self._store.find(Animal, offset=10)])
+        self.assertEqual(12, len(list(self._store.find(Animal))))
+
+    def test_find_page(self):
+        with self._store.batch():
+            for i in range(25):
+                self._store.create(Animal, id="%02d" % i, name="cat")
+        pages = []
+        cursor = None
+        while True:
+            animals, cursor = Animal.use(self._store).store.find_page(
+                10, cursor=cursor)
+            pages.append([a.id for a in animals])
+            if cursor is None:
+                break
+            # records written between pages after the cursor are seen.
+            self._store.create(Animal, id="%02d" % (len(pages) + 90))
+        self.assertEqual([10, 10, 7], [len(page) for page in pages])
+        self.assertEqual(
+            ["%02d" % i for i in range(25)] + ["91", "92"],
+            [identifier for page in pages for identifier in page])
+        self.assertEqual(
+            ["22", "23"], [a.id for a in self._store.find(
+                Animal, limit=2, cursor=self._store.find_page(
+                    Animal, 22)[1])])
+        with self.assertRaises(ValueError):
+            list(self._store.find(Animal, cursor="☃"))
+
+    def test_delete(self):
+        for i in range(10):
+            person = self._store.create(Person, name=str(i), uid=str(i))
+        self._store.delete(Person, person.identify())
+        people = list(self._store.find(Person))
+        self.assertEqual(9, len(people))
+        uids = [p.identify() for p in people]
+        self.assertFalse(person.identify() in uids)
+
+    def test_batch(self):
+        with mock.patch.object(self._connection, "flush") as flush:
+            with self._store.batch():
+                for i in range(10):
+                    self._store.create(Person, name=str(i), uid=str(i))
+                self._store.delete(Person, "3")
+                self.assertEqual(0, flush.call_count)
+            self.assertEqual(1, flush.call_count)
+
+        uids = set(p.identify() for p in self._store.find(Person))
+        self.assertEqual(set(str(i) for i in range(10) if i != 3), uids)
+
+    def test_batch_reads_pending_writes(self):
+        self._store.save(self._person)
+        with self._store.batch():
+            other = Person(name="Other", uid="other")
+            self._store.save(other)
+            self.assertEqual(other, self._store.fetch(Person, "other"))
+            self._store.delete(Person, "foobar")
+            self.assertIsNone(self._store.fetch(Person, "foobar"))
+            self.assertEqual(["other"], [
+                p.identify() for p in self._store.find(Person)])
+            with self.assertRaises(KeyError):
+                self._store.delete(Person, "foobar")
+
+    def test_batch_discards_on_error(self):
+        with self.assertRaises(ValueError):
+            with self._store.batch():
+                self._store.save(self._person)
+                raise ValueError("oops")
+        self.assertIsNone(self._store.fetch(Person, "foobar"))
+        self.assertFalse(self._connection.batching)
+
+    def test_batch_applies_on_error(self):
+        with self.assertRaises(ValueError):
+            with self._store.batch(discard_on_error=False):
+                self._store.save(self._person)
+                raise ValueError("oops")
+        self.assertEqual(self._person, self._store.fetch(Person, "foobar"))
+
+    def test_batch_commit_and_rollback(self):
+        with self._store.batch():
+            self._store.save(self._person)
+            self._store.commit()
+            self._store.save(Person(name="Other", uid="other"))
+            self._store.rollback()
+        self.assertEqual(self._person, self._store.fetch(Person, "foobar"))
+        self.assertIsNone(self._store.fetch(Person, "other"))
+
+    def test_nested_batch_joins_outer(self):
+        with mock.patch.object(self._connection, "flush") as flush:
+            with self._store.batch():
+                with self._store.batch():
+                    self._store.save(self._person)
+                self.assertEqual(0, flush.call_count)
+            self.assertEqual(1, flush.call_count)
+
+    def test_batch_through_model_store(self):
+        A = Animal.use(self._store)
+        with self._store.batch():
+            A(id="1", name="cat").store.save()
+            A(id="2", name="dog").store.save()
+        self.assertEqual("dog", A.store.fetch("2").name)
+
+    def test_fetch_many(self):
+        for i in range(5):
+            self._store.create(Person, name=str(i), uid=str(i))
+        people = self._store.fetch_many(Person, ["3", "missing", "1"])
+        self.assertEqual("3", people[0].identify())
+        self.assertIsNone(people[1])
+        self.assertEqual("1", people[2].identify())
+
+    def test_save_many(self):
+        people = [Person(name=str(i), uid=str(i)) for i in range(5)]
+        with mock.patch.object(self._connection, "flush") as flush:
+            self._store.save_many(Person, people)
+            self.assertEqual(1, flush.call_count)
+        self.assertEqual(people, self._store.fetch_many(
+            Person, [str(i) for i in range(5)]))
+
+    def test_delete_many(self):
+        for i in range(5):
+            self._store.create(Person, name=str(i), uid=str(i))
+        self._store.delete_many(Person, ["1", "2"])
+        uids = set(p.identify() for p in self._store.find(Person))
+        self.assertEqual(set(["0", "3", "4"]), uids)
+
+    def test_bulk_operations_through_model_store(self):
+        A = Animal.use(self._store)
+        A.store.save_many([A(id="1", name="cat"), A(id="2", name="dog")])
+        self.assertEqual(
+            ["dog", "cat"], [a.name for a in A.store.fetch_many(["2", "1"])])
+        A.store.delete_many(["1"])
+        self.assertEqual([None], A.store.fetch_many(["1"]))
+
+    def test_count(self):
+        for i in range(5):
+            self._store.create(Person, name=str(i), uid=str(i))
+        self._store.create(Animal, id="1", name="cat")
+        self.assertEqual(5, self._store.count(Person))
+        self.assertEqual(1, self._store.count(Animal))
+        self._store.delete(Person, "1")
+        self.assertEqual(4, self._store.count(Person))
+
+    def test_exists(self):
+        self._store.save(self._person)
+        with mock.patch.object(self._connection, "decode") as decode:
+            self.assertTrue(self._store.exists(Person, "foobar"))
+            self.assertFalse(self._store.exists(Person, "missing"))
+            self.assertEqual(
+                [False, True],
+                self._store.exists_many(Person, ["missing", "foobar"]))
+            self.assertEqual(0, decode.call_count)
+        with self._store.batch():
+            self._store.delete(Person, "foobar")
+            self._store.create(Person, name="New", uid="new")
+            self.assertEqual(
+                [False, True],
+                self._store.exists_many(Person, ["foobar", "new"]))
+        self.assertFalse(self._store.exists(Person, "foobar"))
+        self.assertTrue(self._store.exists(Person, "new"))
+
+    def test_columns(self):
+        with self._store.batch():
+            for i in range(6):
+                self._store.create(
+                    Reading, id=str(i), value=i, valid=i % 2 == 0)
+            # pending writes are read too.
+            self.assertEqual(
+                [0, 1, 2, 3, 4, 5],
+                sorted(self._store.column(Reading, "value")))
+        self._connection.save("Reading:9", self._connection.encode({
+            "id": "9", "v": 1.5, "extra": [1]}))
+        with mock.patch.object(Reading, "from_dict") as from_dict:
+            values, units, valid, extra = Reading.use(
+                self._store).store.columns(["value", "unit", "valid", "extra"])
+            self.assertEqual(0, from_dict.call_count)
+        self.assertEqual("d", values.typecode)
+        self.assertEqual(16.5, sum(values))
+        self.assertEqual(["c"] * 7, units)
+        self.assertEqual(
+            [False, False, False, True, True, True, None], sorted(
+                valid, key=lambda v: (v is None, v)))
+        self.assertEqual([[1]], [e for e in extra if e is not None])
+        self.assertEqual("q", self._store.column(Animal, "name").typecode)
+
+    def test_thread_safe_connection(self):
+        connection = self.connect(".safe", thread_safe=True)
+        store = connection.get_store()
+        errors = []
+
+        def work(offset):
+            try:
+                for i in range(20):
+                    uid = str(offset * 100 + i)
+                    store.save(Person(name=uid, uid=uid))
+                    self.assertEqual(uid, store.fetch(Person, uid).identify())
+                    list(store.find(Person))
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        self.assertEqual([], errors)
+        self.assertEqual(80, store.count(Person))
+        connection.disconnect()
+
+    def test_thread_safe_batches_are_per_thread(self):
+        connection = self.connect(".safe", thread_safe=True)
+        store = connection.get_store()
+        seen = []
+
+        with store.batch():
+            store.save(self._person)
+            thread = threading.Thread(target=lambda: seen.append(
+                (connection.batching, store.fetch(Person, "foobar"))))
+            thread.start()
+            thread.join()
+        self.assertEqual([(False, None)], seen)
+        self.assertEqual(self._person, store.fetch(Person, "foobar"))
+        connection.disconnect()
+
+    def test_lazy_model_decodes_on_access(self):
+        self._store.create(LazyAnimal, id="1", name="cat")
+        with mock.patch.object(
+                self._connection, "decode",
+                wraps=self._connection.decode) as decode:
+            animal = self._store.fetch(LazyAnimal, "1")
+            animals = list(self._store.find(LazyAnimal))
+            self.assertEqual(0, decode.call_count)
+            self.assertEqual("cat", animal.name)
+            self.assertEqual(1, decode.call_count)
+        self.assertEqual(["cat"], [a.name for a in animals])
+
+    def test_save_skips_clean_instances(self):
+        self._store.create(Animal, id="1", name="cat")
+        animal = self._store.fetch(Animal, "1")
+        with mock.patch.object(self._connection, "flush") as flush:
+            self._store.save(animal)
+            self._store.save_many(Animal, [animal])
+            self.assertEqual(0, flush.call_count)
+            animal.name = "dog"
+            self._store.save(animal)
+            self.assertEqual(1, flush.call_count)
+        self.assertFalse(animal.is_dirty())
+        self.assertEqual("dog", self._store.fetch(Animal, "1").name)
+
+    def test_saves_instances_built_by_user_code(self):
+        self._store.save(Animal.from_dict({"id": "1", "name": "cat"}))
+        self._store.save(Animal.adopt({"id": "2", "name": "dog"}))
+        self._store.save_many(Animal, Animal.from_dicts([
+            {"id": "3", "name": "cow"}, {"id": "4", "name": "pig"}]))
+        self.assertEqual(
+            ["cat", "dog", "cow", "pig"],
+            [a.name for a in self._store.fetch_many(
+                Animal, ["1", "2", "3", "4"])])
+
+    def test_saves_instances_loaded_from_another_store(self):
+        self._store.create(Animal, id="1", name="cat")
+        self._store.create(LazyAnimal, id="1", name="cat")
+        other = self.connect(".other")
+        try:
+            store = other.get_store()
+            store.save(self._store.fetch(Animal, "1"))
+            store.save_many(LazyAnimal, list(self._store.find(LazyAnimal)))
+            self.assertEqual("cat", store.fetch(Animal, "1").name)
+            self.assertEqual("cat", store.fetch(LazyAnimal, "1").name)
+        finally:
+            other.disconnect()
+
+    def test_saves_instances_again_after_delete(self):
+        self._store.create(Animal, id="1", name="cat")
+        self._store.create(Animal, id="2", name="dog")
+        animals = self._store.fetch_many(Animal, ["1", "2"])
+        self._store.delete(Animal, "1")
+        self._store.save(animals[0])
+        self.assertEqual("cat", self._store.fetch(Animal, "1").name)
+        self._store.delete_many(Animal, ["2"])
+        self._store.save_many(Animal, animals[1:])
+        self.assertEqual("dog", self._store.fetch(Animal, "2").name)
+
+        animal = self._store.fetch(Animal, "1")
+        with self._store.batch():
+            self._store.save(Animal(id="1", name="cow"))
+            self._store.delete(Animal, "1")
+        self._store.save(animal)
+        self.assertEqual("cat", self._store.fetch(Animal, "1").name)
+
+    def test_saves_instances_again_after_rollback(self):
+        with self._store.batch():
+            self._store.create(Animal, id="1", name="cat")
+            animal = self._store.fetch(Animal, "1")
+            self._store.rollback()
+        self._store.save(animal)
+        self.assertEqual("cat", self._store.fetch(Animal, "1").name)
+
+    def test_discarded_batch_leaves_instances_dirty(self):
+        animal = Animal(id="1", name="cat")
+        with self.assertRaises(ValueError):
+            with self._store.batch():
+                self._store.save(animal)
+                self._store.save_many(Animal, [Animal(id="2", name="dog")])
+                raise ValueError("oops")
+        self.assertTrue(animal.is_dirty())
+        self._store.save(animal)
+        self.assertFalse(animal.is_dirty())
+        self.assertEqual("cat", self._store.fetch(Animal, "1").name)
@@ -1,52 +1,32 @@
 """Just a general placeholder for usage tests for now."""
 
 import dbm
+import glob
 import json
 import os
 import tempfile
-from unittest import TestCase
+from unittest import mock, TestCase
 
 from norm.backends import dbm_backend
 from norm.context import Context
-import norm.framework
 
+from tests.backends.contract import Animal, Person, StoreContract
 
-@norm.framework.model
-class Person(object):
 
-    def __init__(self, name, uid):
-        self._name = name
-        self._uid = uid
-
-    def to_dict(self):
-        return {
-            "name": self._name,
-            "uid": self._uid
-        }
-
-    @classmethod
-    def from_dict(cls, data):
-        return cls(**data)
-
-    def identify(self, key=None):
-        return self._uid
-
-    def __eq__(self, other):
-        return self.identify() == other.identify()
-
-
-class TestDBMBackend(TestCase):
+class TestDBMBackend(StoreContract, TestCase):
 
     def setUp(self):
         with tempfile.NamedTemporaryFile(suffix=".db") as temp:
             self._tempfile = temp.name
-        self._connection = dbm_backend.DBMConnection(self._tempfile)
-        self._store = dbm_backend.DBMStore(self._connection)
-        self._person = Person(name="Foobar", uid="foobar")
+        super(TestDBMBackend, self).setUp()
+
+    def connect(self, suffix="", **options):
+        return dbm_backend.DBMConnection(self._tempfile + suffix, **options)
 
-    def tearDown(self):
-        if os.path.exists(self._tempfile):
-            os.remove(self._tempfile)
+    def cleanup(self):
+        # dbm implementations may add their own suffixes to the path.
+        for path in glob.glob(self._tempfile + "*"):
+            os.remove(path)
 
     def test_save(self):
         self._store.save(self._person)
@@ -55,15 +35,6 @@ class TestDBMBackend(TestCase):
             {"name": "Foobar", "uid": "foobar"},
             json.loads(dbm_connection["Person:foobar"].decode("utf8")))
 
-    def test_fetch(self):
-        self._store.save(self._person)
-        fetched = self._store.fetch(Person, "foobar")
-        self.assertEqual(fetched, self._person)
-
-    def test_fetch_none(self):
-        fetched = self._store.fetch(Person, "whatever")
-        self.assertIsNone(fetched)
-
     def test_register(self):
         context = Context()
         dbm_backend.register(context)
@@ -75,32 +46,173 @@ class TestDBMBackend(TestCase):
         person = store.fetch(Person, "foobar")
         self.assertEqual(person, self._person)
 
-    def test_create(self):
-        person = self._store.create(Person, name="Foo Bar", uid="foobar")
+    def test_find_uses_index(self):
+        for i in range(5):
+            self._store.create(Person, name=str(i), uid=str(i))
+        self._store.create(Animal, id="1", name="cat")
+        self.assertTrue(self._connection.indexed)
+        with mock.patch.object(self._connection, "keys") as keys:
+            animals = list(Animal.use(self._store).store.find())
+            self.assertEqual(0, keys.call_count)
+        self.assertEqual(["cat"], [a.name for a in animals])
+
+    def test_index_persists_across_connections(self):
+        for i in range(5):
+            self._store.create(Person, name=str(i), uid=str(i))
+        self._connection.disconnect()
+        connection = dbm_backend.DBMConnection(self._tempfile)
+        self.assertTrue(connection.indexed)
+        self.assertEqual(5, connection.get_store().count(Person))
+
+    def test_index_appends_deltas(self):
+        with self._store.batch():
+            for i in range(200):
+                self._store.create(Person, name=str(i), uid=str(i))
+        base = self._connection._dbm[dbm_backend._index_key("Person")]
+        self._store.delete(Person, "3")
+        self._store.create(Person, name="new", uid="new")
+        # single writes don't rewrite every id...
+        self.assertEqual(
+            base, self._connection._dbm[dbm_backend._index_key("Person")])
         self.assertEqual(
-            {"uid": "foobar", "name": "Foo Bar"}, person.to_dict())
-
-        person2 = self._store.fetch(Person, "foobar")
-        self.assertEqual(person.to_dict(), person2.to_dict())
-
-    def test_find(self):
-        persons = []
-        for i in range(10):
-            person = self._store.create(Person, name=str(i), uid=str(i))
-            persons.append(person.identify())
-
-        actual_persons = []
-        for person in self._store.find(Person):
-            actual_persons.append(person.identify())
-
-        for person in persons:
-            self.assertTrue(person in actual_persons)
-
-    def test_delete(self):
-        for i in range(10):
-            person = self._store.create(Person, name=str(i), uid=str(i))
-        self._store.delete(Person, person.identify())
-        people = list(self._store.find(Person))
-        self.assertEqual(9, len(people))
-        uids = [p.identify() for p in people]
-        self.assertFalse(person.identify() in uids)
+            [["new"], ["3"]], json.loads(self._connection._dbm[
+                dbm_backend._delta_key("Person", 0)].decode("utf8")))
+
+        # ...until the deltas are compacted.
+        for i in range(dbm_backend._MIN_DELTAS):
+            self._store.create(Person, name="x", uid="x%d" % i)
+        self.assertNotEqual(
+            base, self._connection._dbm[dbm_backend._index_key("Person")])
+        self.assertEqual([], [
+            key for key in self._connection._dbm.keys()
+            if key.startswith(b"\x00delta:")])
+
+        self._connection.disconnect()
+        connection = dbm_backend.DBMConnection(self._tempfile)
+        ids = connection.model_ids("Person")
+        self.assertEqual(200 + dbm_backend._MIN_DELTAS, len(ids))
+        self.assertIn("new", ids)
+        self.assertNotIn("3", ids)
+        connection.disconnect()
+
+    def test_index_removes_deltas_left_by_a_crash(self):
+        with self._store.batch():
+            for i in range(200):
+                self._store.create(Person, name=str(i), uid=str(i))
+        for i in range(3):
+            self._store.create(Person, name="x", uid="x%d" % i)
+        self._connection.disconnect()
+        # compacted into the base, but stopped after removing one delta.
+        legacy = dbm.open(self._tempfile, "w")
+        legacy[dbm_backend._index_key("Person")] = json.dumps({
+            "ids": [str(i) for i in range(200)] + ["x0", "x1", "x2"],
+            "first": 3, "previous": 0}).encode("utf8")
+        del legacy[dbm_backend._delta_key("Person", 0)]
+        legacy.close()
+
+        self._connection = dbm_backend.DBMConnection(self._tempfile)
+        store = self._connection.get_store()
+        self.assertEqual(203, store.count(Person))
+        store.create(Person, name="y", uid="y")
+        self.assertEqual([dbm_backend._delta_key("Person", 3)], [
+            key for key in self._connection._dbm.keys()
+            if key.startswith(b"\x00delta:")])
+
+    def test_unindexed_file_and_rebuild(self):
+        # a file written before the index existed...
+        legacy = dbm.open(self._tempfile, "n")
+        for i in range(3):
+            legacy["Person:%d" % i] = json.dumps(
+                {"name": str(i), "uid": str(i)}).encode("utf8")
+        legacy.close()
+
+        connection = dbm_backend.DBMConnection(self._tempfile)
+        store = connection.get_store()
+        self.assertFalse(connection.indexed)
+        self.assertEqual(3, store.count(Person))
+        self.assertEqual(3, len(list(store.find(Person))))
+
+        self.assertEqual({"Person": 3}, connection.rebuild_index())
+        self.assertTrue(connection.indexed)
+        store.create(Person, name="new", uid="new")
+        self.assertEqual(4, store.count(Person))
+        self.assertEqual(
+            set(["0", "1", "2", "new"]),
+            set(p.identify() for p in store.find(Person)))
+
+    def test_codec_from_uri(self):
+        context = Context()
+        dbm_backend.register(context)
+        connection = context.get_connection(
+            "dbm://%s?codec=marshal&compress=zlib" % self._tempfile)
+        store = connection.get_store()
+        store.save(self._person)
+        self.assertEqual(b"\x00z", connection.fetch("Person:foobar")[:2])
+        self.assertEqual(self._person, store.fetch(Person, "foobar"))
+
+    def test_mixed_codecs(self):
+        self._store.save(self._person)
+        self._connection.disconnect()
+
+        connection = dbm_backend.DBMConnection(
+            self._tempfile, codec="marshal")
+        store = connection.get_store()
+        other = Person(name="Other", uid="other")
+        store.save(other)
+        self.assertEqual(
+            [self._person, other], store.fetch_many(
+                Person, ["foobar", "other"]))
+
+    def test_find_walks_unindexed_gdbm_keys(self):
+        legacy = dbm.open(self._tempfile + ".legacy", "n")
+        for i in range(5):
+            legacy["Animal:%d" % i] = json.dumps(
+                {"id": str(i), "name": "cat"}).encode("utf8")
+        legacy["Person:1"] = json.dumps(
+            {"name": "1", "uid": "1"}).encode("utf8")
+        legacy.close()
+
+        with mock.patch.object(dbm, "open", _walkable(dbm.open)):
+            connection = self.connect(".legacy")
+        store = connection.get_store()
+        self.assertFalse(connection.indexed)
+        with mock.patch.object(connection, "model_ids") as model_ids:
+            found = [a.id for a in store.find(Animal)]
+            ids = list(connection.iter_ids("Animal", chunk_size=2))
+            self.assertEqual(0, model_ids.call_count)
+        self.assertEqual([str(i) for i in range(5)], sorted(found))
+        self.assertEqual(sorted(found), sorted(ids))
+        connection.disconnect()
+
+
+def _walkable(open_dbm):
+    # gives dbm.dumb files gdbm's firstkey / nextkey traversal.
+    class Walkable(object):
+
+        def __init__(self, db):
+            self._db = db
+
+        def __getattr__(self, name):
+            return getattr(self._db, name)
+
+        def __contains__(self, key):
+            return key in self._db
+
+        def __getitem__(self, key):
+            return self._db[key]
+
+        def __len__(self):
+            return len(self._db)
+
+        def keys(self):
+            raise AssertionError("Walked files shouldn't list their keys.")
+
+        def firstkey(self):
+            return self.nextkey(None)
+
+        def nextkey(self, key):
+            later = sorted(
+                k for k in self._db.keys() if key is None or k > key)
+            return later[0] if later else None
+
+    return lambda *args: Walkable(open_dbm(*args))
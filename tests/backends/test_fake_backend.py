@@ -80,3 +80,14 @@ class TestFakeBackend(unittest.TestCase):
         self.assertEqual(
             {"Model.foo": {"id": "foo", "name": "test"}},
             self._connection.data)
+
+    def test_bulk_operations(self):
+        M = Model.use(self._store)
+        M.store.save_many([M(name="a", id="a"), M(name="b", id="b")])
+        self.assertEqual(
+            [{"name": "b", "id": "b"}, {"name": "a", "id": "a"}],
+            M.store.fetch_many(["b", "a"]))
+
+        M.store.delete_many(["a"])
+        self.assertEqual(
+            {"Model.b": {"id": "b", "name": "b"}}, self._connection.data)
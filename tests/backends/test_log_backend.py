@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock, TestCase
+
+from norm.backends import log_backend
+from norm.context import Context
+
+from tests.backends.contract import Animal, Person, StoreContract
+
+
+class TestLogBackend(StoreContract, TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        super(TestLogBackend, self).setUp()
+
+    def connect(self, suffix="", **options):
+        return log_backend.LogConnection(
+            os.path.join(self._directory, "log" + suffix), **options)
+
+    def cleanup(self):
+        shutil.rmtree(self._directory)
+
+    def _path(self, *names):
+        return os.path.join(self._directory, "log", *names)
+
+    def _fill(self, store, count, name="x"):
+        for i in range(count):
+            store.create(Animal, id=str(i), name=name * 10)
+
+    def test_register(self):
+        context = Context()
+        log_backend.register(context)
+        connection = context.get_connection(
+            "log://%s?codec=marshal&compress=zlib&max_segment_size=100" %
+            self._path("..", "other"))
+        store = connection.get_store()
+        store.save(self._person)
+        self.assertEqual(b"\x00z", connection.fetch("Person:foobar")[:2])
+        self.assertEqual(self._person, store.fetch(Person, "foobar"))
+        connection.disconnect()
+
+    def test_saves_append_without_rewriting(self):
+        self._store.create(Animal, id="1", name="cat")
+        size = os.path.getsize(self._path("00000001.log"))
+        self._store.create(Animal, id="1", name="dog")
+        self.assertGreater(os.path.getsize(self._path("00000001.log")), size)
+        self.assertEqual("dog", self._store.fetch(Animal, "1").name)
+
+    def test_segments_roll_over_with_hints(self):
+        self._connection.disconnect()
+        self._connection = self.connect(max_segment_size=200)
+        self._fill(self._connection.get_store(), 20)
+        segments = self._connection.segments()
+        self.assertGreater(len(segments), 2)
+        for segment in segments[:-1]:
+            self.assertTrue(
+                os.path.exists(self._path("%08d.hint" % segment)))
+
+        self._connection.disconnect()
+        with mock.patch.object(
+                log_backend.LogConnection, "_scan",
+                autospec=True, side_effect=log_backend.LogConnection._scan
+        ) as scan:
+            self._connection = self.connect(max_segment_size=200)
+            # only the active segment, which has no hint, is read.
+            self.assertEqual(1, scan.call_count)
+        store = self._connection.get_store()
+        self.assertEqual(20, store.count(Animal))
+        self.assertEqual("xxxxxxxxxx", store.fetch(Animal, "7").name)
+
+    def test_stale_hint_is_ignored(self):
+        self._connection.disconnect()
+        self._connection = self.connect(max_segment_size=200)
+        self._fill(self._connection.get_store(), 20)
+        self._connection.disconnect()
+        with open(self._path("00000001.hint"), "ab") as stream:
+            stream.write(b"garbage")
+        self._connection = self.connect()
+        self.assertEqual(20, self._connection.get_store().count(Animal))
+
+    def test_truncated_append_is_dropped(self):
+        self._fill(self._store, 3)
+        self._connection.disconnect()
+        with open(self._path("00000001.log"), "ab") as stream:
+            stream.write(b"\x00\x01\x02partial")
+        self._connection = self.connect()
+        store = self._connection.get_store()
+        self.assertEqual(3, store.count(Animal))
+        store.create(Animal, id="3", name="cat")
+        self._connection.disconnect()
+        self._connection = self.connect()
+        self.assertEqual(
+            "cat", self._connection.get_store().fetch(Animal, "3").name)
+
+    def test_corrupt_closed_segment(self):
+        self._connection.disconnect()
+        self._connection = self.connect(max_segment_size=200)
+        self._fill(self._connection.get_store(), 20)
+        self._connection.disconnect()
+        os.remove(self._path("00000001.hint"))
+        with open(self._path("00000001.log"), "r+b") as stream:
+            stream.seek(20)
+            stream.write(b"!")
+        with self.assertRaises(log_backend.CorruptLog):
+            self.connect()
+        self._connection = self.connect(".other")
+
+    def test_compact(self):
+        self._connection.disconnect()
+        self._connection = self.connect(max_segment_size=200)
+        store = self._connection.get_store()
+        for name in ["cat", "dog", "cow"]:
+            self._fill(store, 10, name)
+        store.delete(Animal, "4")
+        self.assertTrue(self._connection.needs_compaction())
+        before = len(self._connection.segments())
+
+        self.assertGreater(self._connection.compact(), 0)
+        self.assertLess(len(self._connection.segments()), before)
+        self.assertFalse(self._connection.needs_compaction())
+        self.assertEqual(9, store.count(Animal))
+        self.assertEqual("cow" * 10, store.fetch(Animal, "9").name)
+
+        self._connection.disconnect()
+        self._connection = self.connect(max_segment_size=200)
+        store = self._connection.get_store()
+        self.assertEqual(9, store.count(Animal))
+        self.assertIsNone(store.fetch(Animal, "4"))
+        self.assertEqual(
+            set(["cow" * 10]),
+            set(a.name for a in store.find(Animal)))
+
+    def test_compact_everything_deleted(self):
+        self._connection.disconnect()
+        self._connection = self.connect(max_segment_size=100)
+        store = self._connection.get_store()
+        self._fill(store, 5)
+        store.delete_many(Animal, [str(i) for i in range(5)])
+        self._connection.compact()
+        self.assertEqual(1, len(self._connection.segments()))
+        self._connection.disconnect()
+        self._connection = self.connect()
+        self.assertEqual(0, self._connection.get_store().count(Animal))
+
+    def test_interrupted_compaction_is_undone(self):
+        self._connection.disconnect()
+        self._connection = self.connect(max_segment_size=200)
+        self._fill(self._connection.get_store(), 20)
+        segments = self._connection.segments()
+        self._connection.disconnect()
+        # the compacted segment was written, but never swapped in.
+        target = segments[-2]
+        with open(self._path("%08d.log.compact" % target), "wb") as stream:
+            stream.write(b"incomplete")
+        with open(self._path("COMPACTING"), "w") as stream:
+            json.dump({"target": target, "segments": segments[:-1]}, stream)
+
+        self._connection = self.connect()
+        self.assertEqual(segments, self._connection.segments())
+        self.assertEqual(20, self._connection.get_store().count(Animal))
+        self.assertEqual([], [
+            name for name in os.listdir(self._path())
+            if name.endswith(".compact") or name == "COMPACTING"])
+
+    def test_background_compaction(self):
+        self._connection.disconnect()
+        self._connection = self.connect(
+            max_segment_size=200, compact_interval=0.01)
+        store = self._connection.get_store()
+        for name in ["cat", "dog", "cow"]:
+            self._fill(store, 10, name)
+        deadline = time.monotonic() + 5
+        while self._connection.needs_compaction():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertEqual(10, store.count(Animal))
+        self.assertEqual(
+            set(["cow" * 10]), set(a.name for a in store.find(Animal)))
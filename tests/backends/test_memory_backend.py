@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import types
+from unittest import TestCase
+
+from norm.backends import memory_backend
+from norm.backends.dbm_backend import DBMConnection
+from norm.context import Context
+from norm.field import Field
+from norm.model import Model
+from norm.tools.load import load
+
+from tests.backends.contract import Animal, Person, StoreContract
+
+
+class Pet(Model):
+    id = Field()
+    tags = Field(default=list)
+
+
+class TestMemoryBackend(StoreContract, TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._options = {}
+        super(TestMemoryBackend, self).setUp()
+
+    def connect(self, suffix="", **options):
+        options.update(self._options)
+        return memory_backend.MemoryConnection(
+            os.path.join(self._directory, "snapshot" + suffix), **options)
+
+    def cleanup(self):
+        shutil.rmtree(self._directory)
+
+    def test_register(self):
+        context = Context()
+        memory_backend.register(context)
+        connection = context.get_connection("memory://?codec=marshal")
+        store = connection.get_store()
+        store.save(self._person)
+        self.assertEqual(b"\x00m", connection.fetch("Person:foobar")[:2])
+        self.assertEqual(self._person, store.fetch(Person, "foobar"))
+        connection.disconnect()
+        self.assertEqual([], os.listdir(self._directory))
+
+    def test_stored_values_are_not_shared(self):
+        pet = Pet(id="1", tags=["small"])
+        self._store.save(pet)
+        pet.tags.append("loud")
+        fetched = self._store.fetch(Pet, "1")
+        self.assertEqual(["small"], fetched.tags)
+        fetched.tags.append("furry")
+        self.assertEqual(["small"], self._store.fetch(Pet, "1").tags)
+
+    def test_frozen_values(self):
+        connection = self.connect(".frozen", frozen=True)
+        store = connection.get_store()
+        pet = Pet(id="1", tags=["small"])
+        store.save(pet)
+        pet.tags.append("loud")
+        stored = connection.fetch("Pet:1")
+        self.assertEqual(("small",), stored["tags"])
+        with self.assertRaises(TypeError):
+            stored["tags"] = []
+        fetched = store.fetch(Pet, "1")
+        fetched.tags.append("furry")
+        self.assertEqual(["small"], store.fetch(Pet, "1").tags)
+        connection.disconnect()
+
+    def test_snapshot_is_unaffected_by_writes(self):
+        for i in range(3):
+            self._store.create(Animal, id=str(i), name="cat")
+        snapshot = self._connection.snapshot()
+        self._store.create(Animal, id="3", name="dog")
+        self._store.save(Animal(id="0", name="cow"))
+        self._store.delete(Animal, "1")
+        self.assertEqual(3, snapshot.count("Animal"))
+        self.assertEqual(
+            ["0", "1", "2"], sorted(snapshot.model_ids("Animal")))
+        self.assertEqual(
+            {"id": "0", "name": "cat"},
+            self._connection.decode(snapshot.fetch("Animal:0")))
+        self.assertEqual(3, self._store.count(Animal))
+        self.assertEqual("cow", self._store.fetch(Animal, "0").name)
+
+    def test_find_while_writing(self):
+        for i in range(10):
+            self._store.create(Animal, id=str(i), name="cat")
+        seen = []
+        for animal in self._store.find(Animal):
+            seen.append(animal.id)
+            self._store.delete(Animal, animal.id)
+            self._store.create(Animal, id="new" + animal.id, name="dog")
+        self.assertEqual(sorted(str(i) for i in range(10)), sorted(seen))
+        self.assertEqual(
+            set(["dog"]), set(a.name for a in self._store.find(Animal)))
+
+    def test_writes_copy_only_tables_still_read(self):
+        for i in range(3):
+            self._store.create(Animal, id=str(i), name="cat")
+        table = self._connection._tables["Animal"]
+        self.assertEqual(3, len(list(self._store.find(Animal))))
+        self._store.create(Animal, id="3", name="dog")
+        self.assertTrue(table is self._connection._tables["Animal"])
+
+        finds = self._store.find(Animal)
+        next(finds)
+        self._store.create(Animal, id="4", name="dog")
+        self.assertFalse(table is self._connection._tables["Animal"])
+        finds.close()
+
+        table = self._connection._tables["Animal"]
+        snapshot = self._connection.snapshot()
+        self._store.create(Animal, id="5", name="dog")
+        self.assertFalse(table is self._connection._tables["Animal"])
+        table = self._connection._tables["Animal"]
+        del snapshot
+        self._connection.snapshot()
+        self._store.create(Animal, id="6", name="dog")
+        self.assertTrue(table is self._connection._tables["Animal"])
+        self.assertEqual(7, self._store.count(Animal))
+
+    def test_persist_and_reload(self):
+        for i in range(5):
+            self._store.create(Animal, id=str(i), name="cat")
+        self._store.delete(Animal, "2")
+        self._connection.disconnect()
+        self._connection = self.connect()
+        store = self._connection.get_store()
+        self.assertEqual(4, store.count(Animal))
+        self.assertEqual("cat", store.fetch(Animal, "4").name)
+
+    def test_frozen_persist_and_reload(self):
+        self._options = {"frozen": True}
+        self._connection.disconnect()
+        self._connection = self.connect()
+        self._store = self._connection.get_store()
+        self.test_persist_and_reload()
+        self.assertIsInstance(
+            self._connection.fetch("Animal:4"), types.MappingProxyType)
+
+    def test_snapshot_file_is_a_dump(self):
+        self._store.create(Animal, id="1", name="cat")
+        path = os.path.join(self._directory, "copy")
+        self._connection.persist(path)
+        connection = DBMConnection(os.path.join(self._directory, "db"))
+        with open(path, "rb") as stream:
+            load(connection, stream, format="binary", progress=False)
+        self.assertEqual(
+            "cat", connection.get_store().fetch(Animal, "1").name)
+        connection.disconnect()
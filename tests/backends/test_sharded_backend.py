@@ -0,0 +1,159 @@
+import glob
+import os
+import tempfile
+import threading
+from unittest import mock, TestCase
+
+from norm.backends import dbm_backend, memory_backend, sharded_backend
+from norm.context import Context
+
+from tests.backends.contract import Animal, Person, StoreContract
+
+
+class TestShardedBackend(StoreContract, TestCase):
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(suffix=".db") as temp:
+            self._tempfile = temp.name
+        super(TestShardedBackend, self).setUp()
+
+    def connect(self, suffix="", shards=3, **options):
+        return sharded_backend.ShardedConnection([
+            dbm_backend.DBMConnection(
+                "%s%s.%d" % (self._tempfile, suffix, i), thread_safe=True)
+            for i in range(shards)
+        ], **options)
+
+    def cleanup(self):
+        for path in glob.glob(self._tempfile + "*"):
+            os.remove(path)
+
+    def _fill(self, count):
+        for i in range(count):
+            self._store.create(Animal, id=str(i), name="cat")
+
+    def test_shard_index_is_stable(self):
+        # pinned, since changing the hash would strand every record.
+        self.assertEqual(
+            [0, 2, 2, 0, 1], [sharded_backend.shard_index(
+                "Animal:%d" % i, 3) for i in range(5)])
+        for i in range(100):
+            key = "Animal:%d" % i
+            before = sharded_backend.shard_index(key, 3)
+            after = sharded_backend.shard_index(key, 4)
+            self.assertIn(after, (before, 3))
+
+    def test_records_spread_across_shards(self):
+        self._fill(30)
+        counts = [shard.count("Animal") for shard in self._connection.shards]
+        self.assertEqual(30, sum(counts))
+        self.assertTrue(all(counts))
+        for index, shard in enumerate(self._connection.shards):
+            for identifier in shard.model_ids("Animal"):
+                self.assertEqual(
+                    index, self._connection.home("Animal:" + identifier))
+
+    def test_save_flushes_only_its_shard(self):
+        shards = self._connection.shards
+        home = self._connection.home("Animal:1")
+        with mock.patch.object(shards[home], "flush") as flush:
+            with mock.patch.object(shards[home - 1], "flush") as other:
+                self._store.create(Animal, id="1", name="cat")
+        self.assertEqual(1, flush.call_count)
+        self.assertEqual(0, other.call_count)
+
+    def test_find_fans_out_in_threads(self):
+        self._fill(30)
+        threads = set()
+        for shard in self._connection.shards:
+            model_ids = shard.model_ids
+
+            def record(model_name, model_ids=model_ids):
+                threads.add(threading.current_thread())
+                return model_ids(model_name)
+
+            shard.model_ids = record
+        found = [a.id for a in self._store.find(Animal)]
+        self.assertEqual(sorted(str(i) for i in range(30)), sorted(found))
+        self.assertEqual(3, len(threads))
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_find_without_parallel(self):
+        self._connection.disconnect()
+        self._connection = self.connect(parallel=False)
+        self._store = self._connection.get_store()
+        self._fill(10)
+        self.assertEqual(10, len(list(self._store.find(Animal))))
+        self.assertEqual(10, self._store.count(Animal))
+
+    def test_stopping_a_find_early(self):
+        self._fill(300)
+        finds = self._store.find(Animal)
+        next(finds)
+        finds.close()
+        self.assertEqual(300, self._store.count(Animal))
+
+    def test_register(self):
+        context = Context()
+        dbm_backend.register(context)
+        memory_backend.register(context)
+        sharded_backend.register(context)
+        uri = sharded_backend.build_uri([
+            "dbm://%s.uri?thread_safe=1" % self._tempfile,
+            "memory://?codec=marshal"
+        ], codec="marshal")
+        connection = context.get_connection(uri)
+        store = connection.get_store()
+        for i in range(10):
+            store.create(Person, name=str(i), uid=str(i))
+        self.assertEqual(10, store.count(Person))
+        self.assertTrue(all(s.count("Person") for s in connection.shards))
+        self.assertEqual(
+            b"\x00m", connection.fetch("Person:1")[:2])
+        connection.disconnect()
+
+    def test_pooled_shards_are_released(self):
+        context = Context(pool_size=2)
+        dbm_backend.register(context)
+        sharded_backend.register(context)
+        shards = ["dbm://%s.pooled.%d" % (self._tempfile, i) for i in (0, 1)]
+        uri = sharded_backend.build_uri(shards)
+        with context.connection(uri) as connection:
+            for i in range(10):
+                connection.get_store().create(Animal, id=str(i), name="cat")
+        self.assertEqual(1, context._pool.size(shards[0]))
+        # closing the pooled sharded connection hands its shards back,
+        # and they're closed in turn.
+        context.close_all()
+        self.assertEqual(
+            [0, 0, 0], [context._pool.size(u) for u in [uri] + shards])
+
+        connection = context.get_connection(uri)
+        self.assertEqual(10, connection.get_store().count(Animal))
+        connection.disconnect()
+        # the shards are open, and shared with checkouts of their own.
+        with context.connection(shards[0]) as shard:
+            self.assertTrue(shard.count("Animal") > 0)
+        context.close_all()
+
+    def test_growing_reads_previous_shards(self):
+        self._fill(40)
+        self._connection.disconnect()
+        self._connection = self.connect(shards=4, previous=3)
+        store = self._connection.get_store()
+        self.assertEqual(40, store.count(Animal))
+        self.assertEqual(
+            sorted(str(i) for i in range(40)),
+            sorted(a.id for a in store.find(Animal)))
+        self.assertEqual(
+            [str(i) for i in range(40)],
+            [a.id for a in store.fetch_many(
+                Animal, [str(i) for i in range(40)])])
+
+        moved = [
+            str(i) for i in range(40)
+            if self._connection.home("Animal:%d" % i) == 3]
+        self.assertTrue(moved)
+        store.delete(Animal, moved[0])
+        self.assertIsNone(store.fetch(Animal, moved[0]))
+        self.assertEqual(39, store.count(Animal))
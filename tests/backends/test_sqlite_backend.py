@@ -0,0 +1,139 @@
+import glob
+import os
+import sqlite3
+import tempfile
+from unittest import mock, TestCase
+
+from norm.backends import sqlite_backend
+from norm.context import Context
+
+from tests.backends.contract import Animal, Person, StoreContract
+
+
+class TestSQLiteBackend(StoreContract, TestCase):
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(suffix=".sqlite") as temp:
+            self._tempfile = temp.name
+        super(TestSQLiteBackend, self).setUp()
+
+    def connect(self, suffix="", **options):
+        return sqlite_backend.SQLiteConnection(
+            self._tempfile + suffix, **options)
+
+    def cleanup(self):
+        # WAL mode adds -wal and -shm files beside the database.
+        for path in glob.glob(self._tempfile + "*"):
+            os.remove(path)
+
+    def _raw(self):
+        return sqlite3.connect(self._tempfile)
+
+    def test_wal_and_table_per_model(self):
+        self._store.save(self._person)
+        self._store.create(Animal, id="1", name="cat")
+        db = self._raw()
+        self.assertEqual(
+            "wal", db.execute("PRAGMA journal_mode").fetchone()[0])
+        self.assertEqual(["Animal", "Person"], sorted(name for name, in (
+            db.execute("SELECT name FROM sqlite_master WHERE type='table'"))))
+        self.assertEqual(
+            [("foobar", b'{"name": "Foobar", "uid": "foobar"}')],
+            db.execute("SELECT id, document FROM Person").fetchall())
+        db.close()
+
+    def test_register(self):
+        context = Context()
+        sqlite_backend.register(context)
+        connection = context.get_connection(
+            "sqlite://%s?index=Animal.name,Person.uid" % self._tempfile)
+        self.assertEqual(["name"], connection.indexes("Animal"))
+        self.assertEqual(["uid"], connection.indexes("Person"))
+        self._store.save(self._person)
+        self.assertEqual(
+            self._person, connection.get_store().fetch(Person, "foobar"))
+        connection.disconnect()
+
+    def test_readers_see_other_connections_writes(self):
+        other = self.connect()
+        self._store.create(Animal, id="1", name="cat")
+        self.assertEqual("cat", other.get_store().fetch(Animal, "1").name)
+        with self._store.batch():
+            self._store.create(Animal, id="2", name="dog")
+            self.assertIsNone(other.get_store().fetch(Animal, "2"))
+        self.assertEqual(2, other.get_store().count(Animal))
+        other.disconnect()
+
+    def test_query(self):
+        store = Animal.use(self._store).store
+        for i, name in enumerate(["cat", "dog", "cat", None]):
+            self._store.create(Animal, id=str(i), name=name)
+        self.assertEqual(
+            set(["0", "2"]), set(a.id for a in store.query(name="cat")))
+        self.assertEqual(["3"], [a.id for a in store.query(name=None)])
+        self.assertEqual([], list(store.query(name="cow")))
+        self.assertEqual(
+            ["1"], [a.id for a in store.query(id="1", name="dog")])
+
+    def test_query_sees_pending_writes(self):
+        self._store.create(Animal, id="1", name="cat")
+        self._store.create(Animal, id="2", name="cat")
+        with self._store.batch():
+            self._store.create(Animal, id="3", name="cat")
+            self._store.save(Animal(id="1", name="dog"))
+            self._store.delete(Animal, "2")
+            self.assertEqual(
+                ["3"], [a.id for a in self._store.query(Animal, name="cat")])
+
+    def test_find_selects_documents_in_chunks(self):
+        with self._store.batch():
+            for i in range(250):
+                self._store.create(Animal, id="%03d" % i, name="cat")
+        with mock.patch.object(self._connection, "fetch_many") as fetch:
+            found = []
+            for animal in self._store.find(Animal):
+                # saves move the rows they replace, but none come back.
+                self._store.save(Animal(id=animal.id, name="dog"))
+                found.append(animal.id)
+            self.assertEqual(0, fetch.call_count)
+        self.assertEqual(["%03d" % i for i in range(250)], found)
+        with self._store.batch():
+            self._store.delete(Animal, "000")
+            self._store.create(Animal, id="new", name="cow")
+            self.assertEqual(
+                250, len(set(a.id for a in self._store.find(Animal))))
+            self.assertEqual(
+                ["cow"], [a.name for a in self._store.find(Animal)
+                          if a.id in ("000", "new")])
+
+    def test_field_query_uses_index(self):
+        self._store.create(Animal, id="1", name="cat")
+        self._connection.create_index("Animal", "name")
+        self.assertEqual(["name"], self._connection.indexes("Animal"))
+        db = self._raw()
+        plan = " ".join(row[-1] for row in db.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM Animal WHERE " +
+            sqlite_backend._extract("name") + " = ?", ("cat",)))
+        self.assertIn("Animal_name", plan)
+        db.close()
+        self.assertEqual(
+            ["1"], [a.id for a in self._store.query(Animal, name="cat")])
+
+    def test_field_queries_need_json(self):
+        connection = self.connect(".marshal", codec="marshal")
+        self.assertFalse(connection.queryable)
+        with self.assertRaises(sqlite_backend.QueryError):
+            connection.create_index("Animal", "name")
+        with self.assertRaises(sqlite_backend.QueryError):
+            list(connection.get_store().query(Animal, name="cat"))
+        with self.assertRaises(sqlite_backend.QueryError):
+            self._connection.create_index("Animal", "name') --")
+        connection.disconnect()
+
+    def test_fetch_many_across_chunks(self):
+        animals = [Animal(id=str(i), name=str(i)) for i in range(1200)]
+        self._store.save_many(Animal, animals)
+        keys = [str(i) for i in range(0, 1200, 2)] + ["missing"] * 600
+        fetched = self._store.fetch_many(Animal, keys)
+        self.assertEqual(keys[:600], [a.id for a in fetched[:600]])
+        self.assertEqual([None] * 600, fetched[600:])
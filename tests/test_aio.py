@@ -0,0 +1,198 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from norm.aio import AsyncStoreAdapter
+from norm.backends.dbm_backend import DBMConnection
+from norm.field import Field
+from norm.model import Model
+import norm.framework
+
+
+class User(Model):
+    id = Field()
+    name = Field()
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestAsyncStoreAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._connection = DBMConnection(
+            os.path.join(self._tempdir.name, "aio.db"))
+        self._store = AsyncStoreAdapter(self._connection.get_store())
+        self._model = User.use(self._store)
+
+    def tearDown(self):
+        self._store.close()
+        self._connection.disconnect()
+        self._tempdir.cleanup()
+
+    def test_fetch_and_save(self):
+        async def scenario():
+            await self._model(id="foo", name="Foo").store.save()
+            return await self._model.store.fetch("foo")
+
+        user = run(scenario())
+        self.assertEqual("Foo", user.name)
+
+    def test_find(self):
+        store = AsyncStoreAdapter(
+            self._connection.get_store(), find_chunk_size=3)
+
+        async def scenario():
+            await self._model.store.save_many(
+                [self._model(id=str(i), name=str(i)) for i in range(10)])
+            return [user.id async for user in User.use(store).store.find()]
+
+        self.assertEqual(
+            set(str(i) for i in range(10)), set(run(scenario())))
+        store.close()
+
+    def test_delegated_methods(self):
+        async def scenario():
+            await self._model.store.create(id="foo", name="Foo")
+            return await self._model.store.count()
+
+        self.assertEqual(1, run(scenario()))
+
+    def test_bounded_concurrency(self):
+        release = threading.Event()
+        running = []
+
+        @norm.framework.store
+        class SlowStore(object):
+
+            @norm.framework.deserialize
+            def fetch(self, model, key):
+                running.append(key)
+                release.wait(5)
+                return key
+
+            @norm.framework.serialize
+            def save(self, instance):
+                pass
+
+            def delete(self, model, key):
+                pass
+
+        store = AsyncStoreAdapter(
+            SlowStore(), max_workers=4, max_concurrency=2)
+
+        async def scenario():
+            tasks = [
+                asyncio.ensure_future(store.fetch(User, str(i)))
+                for i in range(4)]
+            await asyncio.sleep(0.05)
+            in_flight = len(running)
+            release.set()
+            return in_flight, await asyncio.gather(*tasks)
+
+        in_flight, results = run(scenario())
+        self.assertEqual(2, in_flight)
+        self.assertEqual(["0", "1", "2", "3"], results)
+        store.close()
+
+    def test_cancel_before_start(self):
+        release = threading.Event()
+        calls = []
+
+        @norm.framework.store
+        class SlowStore(object):
+
+            @norm.framework.deserialize
+            def fetch(self, model, key):
+                calls.append(key)
+                release.wait(5)
+                return key
+
+            @norm.framework.serialize
+            def save(self, instance):
+                pass
+
+            def delete(self, model, key):
+                pass
+
+        store = AsyncStoreAdapter(SlowStore())
+
+        async def scenario():
+            first = asyncio.ensure_future(store.fetch(User, "first"))
+            second = asyncio.ensure_future(store.fetch(User, "second"))
+            await asyncio.sleep(0.05)
+            second.cancel()
+            release.set()
+            result = await first
+            with self.assertRaises(asyncio.CancelledError):
+                await second
+            return result
+
+        self.assertEqual("first", run(scenario()))
+        store.close()
+        self.assertEqual(["first"], calls)
+
+
+class TestAsyncStoreValidation(unittest.TestCase):
+
+    def test_requires_coroutines(self):
+        with self.assertRaises(norm.framework.InvalidStore):
+
+            @norm.framework.async_store
+            class Store(object):
+
+                @norm.framework.deserialize
+                def fetch(self, model, key):
+                    pass
+
+                @norm.framework.serialize
+                async def save(self, instance):
+                    pass
+
+                async def delete(self, model, key):
+                    pass
+
+    def test_async_fallbacks(self):
+
+        @norm.framework.async_store
+        class Store(object):
+
+            def __init__(self):
+                self.data = {}
+
+            @norm.framework.deserialize
+            async def fetch(self, model, key):
+                return self.data.get(key)
+
+            @norm.framework.serialize
+            async def save(self, instance):
+                self.data[instance] = instance
+
+            async def delete(self, model, key):
+                del self.data[key]
+
+            @norm.framework.deserialize
+            async def find(self, model):
+                for value in list(self.data.values()):
+                    yield value
+
+        store = Store()
+
+        async def scenario():
+            await store.save_many(None, ["a", "b", "c"])
+            await store.delete_many(None, ["b"])
+            return (
+                await store.fetch_many(None, ["a", "b"]),
+                await store.exists_many(None, ["a", "b"]),
+                await store.count(None))
+
+        self.assertEqual(
+            (["a", None], [True, False], 2), run(scenario()))
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from norm.backends.dbm_backend import DBMConnection
+from norm.caching import CachingStore
+from norm.field import Field
+from norm.model import Model
+
+
+class User(Model):
+    id = Field()
+    name = Field()
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCachingStore(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._connection = DBMConnection(
+            os.path.join(self._tempdir.name, "cache.db"))
+        self._backend = self._connection.get_store()
+        self._clock = Clock()
+        self._store = CachingStore(
+            self._backend, max_size=2, ttl=10, clock=self._clock)
+        self._user = User(id="foo", name="Foo")
+        self._backend.save(self._user)
+
+    def tearDown(self):
+        self._connection.disconnect()
+        self._tempdir.cleanup()
+
+    def test_fetch_hit_skips_backend(self):
+        U = User.use(self._store)
+        first = U.store.fetch("foo")
+        with mock.patch.object(self._backend, "fetch") as fetch:
+            second = U.store.fetch("foo")
+            self.assertEqual(0, fetch.call_count)
+        self.assertTrue(first is second)
+        self.assertEqual(1, self._store.hits)
+        self.assertEqual(1, self._store.misses)
+
+    def test_fetch_missing_not_cached(self):
+        self.assertIsNone(self._store.fetch(User, "missing"))
+        self.assertEqual(0, self._store.stats()["size"])
+
+    def test_save_updates_cache(self):
+        self._store.fetch(User, "foo")
+        user = User(id="foo", name="Changed")
+        User.use(self._store)(id="foo", name="Changed").store.save()
+        self.assertEqual("Changed", self._store.fetch(User, "foo").name)
+        self.assertEqual("Changed", self._backend.fetch(User, "foo").name)
+        self._store.save(user)
+        self.assertTrue(self._store.fetch(User, "foo") is user)
+
+    def test_delete_invalidates(self):
+        self._store.fetch(User, "foo")
+        self._store.delete(User, "foo")
+        self.assertIsNone(self._store.fetch(User, "foo"))
+
+    def test_lru_eviction(self):
+        for key in ["a", "b", "c"]:
+            self._store.save(User(id=key, name=key))
+        self.assertEqual(1, self._store.evictions)
+        with mock.patch.object(self._backend, "fetch") as fetch:
+            fetch.return_value = None
+            self._store.fetch(User, "a")
+            self.assertEqual(1, fetch.call_count)
+            self._store.fetch(User, "c")
+            self.assertEqual(1, fetch.call_count)
+
+    def test_ttl(self):
+        self._store.fetch(User, "foo")
+        self._clock.now = 11
+        with mock.patch.object(self._backend, "fetch") as fetch:
+            self._store.fetch(User, "foo")
+            self.assertEqual(1, fetch.call_count)
+        self.assertEqual(1, self._store.expirations)
+
+    def test_fetch_many(self):
+        self._backend.save(User(id="bar", name="Bar"))
+        self._store.fetch(User, "foo")
+        with mock.patch.object(
+                self._backend, "fetch_many",
+                wraps=self._backend.fetch_many) as fetch_many:
+            users = self._store.fetch_many(User, ["foo", "bar", "baz"])
+            fetch_many.assert_called_with(User, ["bar", "baz"])
+        self.assertEqual(["Foo", "Bar"], [u.name for u in users[:2]])
+        self.assertIsNone(users[2])
+
+    def test_fetch_many_takes_any_iterable(self):
+        users = self._store.fetch_many(User, (key for key in ["foo", "x"]))
+        self.assertEqual("Foo", users[0].name)
+        self.assertIsNone(users[1])
+
+    def test_fetch_through_bound_model(self):
+        self._store.save(User(id="foo", name="Foo"))
+        U = User.use(self._store)
+        user = U.store.fetch("foo")
+        self.assertTrue(type(user) is U)
+        user.name = "Changed"
+        user.store.save()
+        self.assertEqual([user], U.store.fetch_many(["foo"]))
+        self.assertTrue(type(self._store.fetch(User, "foo")) is User)
+        self.assertEqual("Changed", self._backend.fetch(User, "foo").name)
+
+    def test_delegates_other_methods(self):
+        U = User.use(self._store)
+        self.assertEqual(["foo"], [u.id for u in U.store.find()])
+
+    def test_batch_discard_clears_cache(self):
+        with self.assertRaises(ValueError):
+            with self._store.batch():
+                self._store.save(User(id="new", name="New"))
+                raise ValueError("oops")
+        self.assertIsNone(self._store.fetch(User, "new"))
@@ -0,0 +1,54 @@
+import json
+import unittest
+
+from norm import codecs
+
+
+DATA = {"id": "foo", "count": 5, "ratio": 0.5, "tags": ["a", "b"],
+        "nested": {"ok": True, "none": None}}
+
+
+class TestCodecs(unittest.TestCase):
+
+    def test_round_trip(self):
+        for name in ["json", "marshal", "pickle"]:
+            for compress in [None, "zlib"]:
+                codec = codecs.get_codec(name, compress)
+                value = codec.dumps(DATA)
+                self.assertEqual(
+                    DATA, codecs.loads(value, allow_pickle=True))
+
+    def test_json_is_untagged(self):
+        value = codecs.get_codec("json").dumps(DATA)
+        self.assertEqual(DATA, json.loads(value.decode("utf8")))
+
+    def test_format_tags(self):
+        self.assertEqual(
+            b"\x00m", codecs.get_codec("marshal").dumps(DATA)[:2])
+        self.assertEqual(
+            b"\x00z", codecs.get_codec("json", "zlib").dumps(DATA)[:2])
+
+    def test_pickle_is_opt_in(self):
+        value = codecs.get_codec("pickle").dumps(DATA)
+        with self.assertRaises(codecs.CodecError):
+            codecs.loads(value)
+
+        value = codecs.get_codec("pickle", "zlib").dumps(DATA)
+        with self.assertRaises(codecs.CodecError):
+            codecs.loads(value)
+
+    def test_uses_pickle(self):
+        self.assertTrue(codecs.uses_pickle(codecs.get_codec("pickle")))
+        self.assertTrue(
+            codecs.uses_pickle(codecs.get_codec("pickle", "zlib")))
+        self.assertFalse(codecs.uses_pickle(codecs.get_codec("marshal")))
+
+    def test_unknown_tag(self):
+        with self.assertRaises(codecs.CodecError):
+            codecs.loads(b"\x00?foo")
+
+    def test_unknown_codec(self):
+        with self.assertRaises(codecs.UnknownCodec):
+            codecs.get_codec("yaml")
+        with self.assertRaises(codecs.UnknownCodec):
+            codecs.get_codec("json", "lzma")
@@ -0,0 +1,74 @@
+import array
+import datetime
+import unittest
+
+from norm import columns
+from norm.field import DateTimeField, Field, IntField
+from norm.model import Model
+
+
+class Reading(Model):
+    id = Field()
+    value = Field(field_name="v")
+    unit = Field(default="c")
+    created = Field(default=list)
+
+
+class Event(Model):
+    id = Field()
+    at = DateTimeField(default=datetime.datetime(1970, 1, 1, 0, 1))
+    count = IntField(default=2.0)
+
+
+class TestColumns(unittest.TestCase):
+
+    def test_ints_stay_compact(self):
+        column, = columns.build_columns([[1], [2], [3]], 1)
+        self.assertEqual(array.array("q", [1, 2, 3]), column)
+
+    def test_floats_widen(self):
+        column, = columns.build_columns([[1], [2.5], [3]], 1)
+        self.assertEqual(array.array("d", [1, 2.5, 3]), column)
+
+    def test_anything_else_is_a_list(self):
+        for values in [
+                [1, None, 2], [True, 1], [1, "a"], [2 ** 70, 1],
+                [1.5, "a", 2]]:
+            column, = columns.build_columns([[v] for v in values], 1)
+            self.assertEqual(values, column)
+
+    def test_stored_keys(self):
+        self.assertEqual(
+            (["v", "unit", "created", "other"], [None, "c", None, None]),
+            columns.stored_keys(
+                Reading, ["value", "unit", "created", "other"]))
+
+    def test_stored_keys_serialize_defaults(self):
+        self.assertEqual(
+            (["at", "count"], [60, 2]),
+            columns.stored_keys(Event, ["at", "count"]))
+        self.assertEqual(Event().to_dict(), {"at": 60, "count": 2})
+
+    def test_document_rows(self):
+        rows = columns.document_rows(
+            [{"v": 1}, {"v": 2, "unit": "f"}], ["v", "unit"], [None, "c"])
+        self.assertEqual([[1, "c"], [2, "f"]], list(rows))
+
+    def test_aggregates(self):
+        for column in [array.array("q", [4, 1, 3]), [4, None, 1, 3]]:
+            self.assertEqual(8, columns.sum(column))
+            self.assertEqual(1, columns.min(column))
+            self.assertEqual(4, columns.max(column))
+            self.assertAlmostEqual(8 / 3.0, columns.mean(column))
+        self.assertIsNone(columns.mean([]))
+        self.assertIsNone(columns.max([None]))
+
+    def test_histogram(self):
+        edges, counts = columns.histogram(
+            array.array("d", [0, 1, 2, 5, 9.5, 10]), bins=2)
+        self.assertEqual([0, 5.0, 10], edges)
+        self.assertEqual([3, 3], counts)
+        edges, counts = columns.histogram([1, 5, None, 20], 2, range=(0, 10))
+        self.assertEqual([1, 1], counts)
+        self.assertEqual(([], []), columns.histogram([]))
+        self.assertEqual(([3, 3], [2]), columns.histogram([3, 3], bins=1))
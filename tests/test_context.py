@@ -1,8 +1,17 @@
 """Test the norm master context object."""
 
+import gc
+import os
+import tempfile
+import threading
+import weakref
 from unittest.mock import Mock
 
+from norm.backends import dbm_backend
 from norm.context import Context, StoreContext, StoreContextWrapper
+from norm.context import ConnectionPool, PoolExhausted
+from norm.field import Field
+from norm.model import Model
 
 from unittest import TestCase
 
@@ -103,3 +112,234 @@ class TestNormContext(TestCase):
         m = M(foo="bar")
         m.store.save()
         mock_store.save.assert_called_with(m)
+
+    def test_store_context_wrapper_caches_subclass(self):
+        store = Mock()
+        other_store = Mock()
+
+        class Model(Base):
+            use = StoreContextWrapper()
+
+        self.assertTrue(Model.use(store) is Model.use(store))
+        self.assertFalse(Model.use(store) is Model.use(other_store))
+
+    def test_store_context_wrapper_collects_with_store(self):
+        store = Mock()
+
+        class Model(Base):
+            use = StoreContextWrapper()
+
+        bound = weakref.ref(Model.use(store))
+        store_ref = weakref.ref(store)
+        del store
+        gc.collect()
+        self.assertIsNone(store_ref())
+        self.assertIsNone(bound())
+
+    def test_store_context_wrapper_slots_store(self):
+
+        class Store(object):
+            __slots__ = ["fetch"]
+
+        store = Store()
+        store.fetch = Mock()
+        store.fetch._NORM_DESERIALIZE = True
+
+        class Model(Base):
+            use = StoreContextWrapper()
+
+        M = Model.use(store)
+        M.store.fetch("foo")
+        store.fetch.assert_called_with(M, "foo")
+
+    def test_store_context_model_attribute_cached(self):
+        mock_store = Mock()
+        mock_store.fetch._NORM_DESERIALIZE = True
+
+        class Model(Base):
+            store = StoreContext(mock_store)
+
+        self.assertTrue(Model.store is Model.store)
+        self.assertTrue(Model.store.fetch is Model.store.fetch)
+
+    def test_store_context_falsy_instance(self):
+        mock_store = Mock()
+        mock_store.save._NORM_SERIALIZE = True
+
+        class Model(dict):
+            store = StoreContext(mock_store)
+
+        instance = Model()
+        instance.store.save()
+        mock_store.save.assert_called_with(instance)
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestConnectionPool(TestCase):
+
+    def setUp(self):
+        self._clock = Clock()
+        self._created = []
+        self._pool = ConnectionPool(
+            self._factory, 2, idle_timeout=30, checkout_timeout=0.01,
+            clock=self._clock)
+
+    def _factory(self, uri):
+        connection = Mock()
+        connection.uri = uri
+        self._created.append(connection)
+        return connection
+
+    def test_reuses_released_connections(self):
+        connection = self._pool.checkout("mock://a")
+        self._pool.release(connection)
+        self.assertTrue(connection is self._pool.checkout("mock://a"))
+        self.assertEqual(1, len(self._created))
+
+    def test_pools_per_uri(self):
+        a = self._pool.checkout("mock://a")
+        self._pool.release(a)
+        b = self._pool.checkout("mock://b")
+        self.assertEqual("mock://b", b.uri)
+        self.assertEqual(2, len(self._created))
+
+    def test_max_size(self):
+        self._pool.checkout("mock://a")
+        self._pool.checkout("mock://a")
+        with self.assertRaises(PoolExhausted):
+            self._pool.checkout("mock://a")
+        self.assertEqual(2, self._pool.size("mock://a"))
+
+    def test_waits_for_release(self):
+        pool = ConnectionPool(self._factory, 1, checkout_timeout=5)
+        connection = pool.checkout("mock://a")
+        timer = threading.Timer(0.01, pool.release, [connection])
+        timer.start()
+        self.assertTrue(connection is pool.checkout("mock://a"))
+        timer.join()
+
+    def test_idle_eviction(self):
+        connection = self._pool.checkout("mock://a")
+        self._pool.release(connection)
+        self._clock.now = 31
+        self._pool.evict_idle()
+        connection.disconnect.assert_called_with()
+        self.assertEqual(0, self._pool.size("mock://a"))
+        self.assertFalse(connection is self._pool.checkout("mock://a"))
+
+    def test_close_all(self):
+        idle = self._pool.checkout("mock://a")
+        busy = self._pool.checkout("mock://a")
+        self._pool.release(idle)
+        self._pool.close_all()
+        idle.disconnect.assert_called_with()
+        self.assertEqual(0, busy.disconnect.call_count)
+        self._pool.release(busy)
+        busy.disconnect.assert_called_with()
+        self.assertEqual(0, self._pool.size("mock://a"))
+
+    def test_release_unknown_connection(self):
+        with self.assertRaises(ValueError):
+            self._pool.release(Mock())
+
+    def test_shared_connections(self):
+        pool = ConnectionPool(
+            self._factory, 2, idle_timeout=30, checkout_timeout=0.01,
+            clock=self._clock, shared=lambda uri: uri == "mock://a")
+        first = pool.checkout("mock://a")
+        self.assertTrue(all(
+            first is pool.checkout("mock://a") for _ in range(3)))
+        self.assertEqual(1, pool.size("mock://a"))
+        pool.checkout("mock://b")
+        pool.checkout("mock://b")
+        with self.assertRaises(PoolExhausted):
+            pool.checkout("mock://b")
+
+        for _ in range(4):
+            pool.release(first)
+        with self.assertRaises(ValueError):
+            pool.release(first)
+        self.assertTrue(first is pool.checkout("mock://a"))
+        pool.close_all()
+        self.assertEqual(0, first.disconnect.call_count)
+        pool.release(first)
+        first.disconnect.assert_called_with()
+        self.assertEqual(0, pool.size("mock://a"))
+        self.assertEqual(3, len(self._created))
+
+    def test_factory_error_frees_slot(self):
+        pool = ConnectionPool(Mock(side_effect=IOError), 1)
+        with self.assertRaises(IOError):
+            pool.checkout("mock://a")
+        self.assertEqual(0, pool.size("mock://a"))
+
+
+class Animal(Model):
+    id = Field()
+    name = Field()
+
+
+class TestPooledContext(TestCase):
+
+    def test_pooled_context(self):
+        connection_class = Mock()
+        connection_class.from_uri.side_effect = lambda uri: Mock()
+        context = Context(pool_size=2)
+        context.register_connection("mock", connection_class)
+
+        with context.connection("mock://host") as connection:
+            pass
+        self.assertTrue(connection is context.get_connection("mock://host"))
+        self.assertEqual(1, connection_class.from_uri.call_count)
+        context.release_connection(connection)
+
+        context.close_all()
+        connection.disconnect.assert_called_with()
+
+    def test_single_instance_connections_are_shared(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        context = Context(pool_size=2)
+        dbm_backend.register(context)
+        uri = "dbm://" + os.path.join(directory.name, "pooled.db")
+        # both threads hold a checkout at once.
+        ready = threading.Barrier(2, timeout=5)
+
+        def work(ids):
+            with context.connection(uri) as connection:
+                store = connection.get_store()
+                ready.wait()
+                for uid in ids:
+                    store.save(Animal(id=uid, name="cat"))
+
+        threads = [
+            threading.Thread(target=work, args=(ids,))
+            for ids in (["1", "3", "5"], ["2", "4"])]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        with context.connection(uri) as connection:
+            store = connection.get_store()
+            self.assertEqual(5, store.count(Animal))
+            self.assertEqual(
+                ["cat"] * 5, [a.name for a in store.fetch_many(
+                    Animal, ["1", "2", "3", "4", "5"])])
+            self.assertIsNotNone(connection._lock)
+        context.close_all()
+
+    def test_unpooled_release_is_noop(self):
+        connection_class = Mock()
+        context = Context()
+        context.register_connection("mock", connection_class)
+        with context.connection("mock://host"):
+            pass
+        with context.connection("mock://host"):
+            pass
+        self.assertEqual(2, connection_class.from_uri.call_count)
@@ -1,9 +1,13 @@
+import datetime
+from decimal import Decimal
 import json
 from unittest import mock
 import unittest
 from norm.field import Field, get_all_field_names, get_field_name
 from norm.field import get_all_fields, populate_defaults, EMPTY
-from norm.field import EmptyRequiredField
+from norm.field import EmptyRequiredField, get_field_table
+from norm.field import BoolField, DateTimeField, DecimalField, DictField
+from norm.field import FloatField, IntField, ListField, StrField
 from norm.context import StoreContextWrapper
 
 try:
@@ -221,3 +225,142 @@ class TestField(unittest.TestCase):
         instance = Model()
         self.assertEqual([], instance.field)
         self.assertEqual([], json.loads(instance["field"]))
+
+    def test_field_bound_at_class_creation(self):
+        class Model(dict):
+            field = Field()
+
+        self.assertEqual("field", Model.field._field_name)
+
+    def test_field_attached_after_class_creation(self):
+        class Model(dict):
+            pass
+
+        Model.field = Field()
+        m = Model()
+        m.field = "foo"
+        self.assertEqual({"field": "foo"}, m)
+
+    def test_named_field_default(self):
+        class Model(dict):
+            field = Field(field_name="foo", default="bar")
+
+        model = Model()
+        populate_defaults(model)
+        self.assertEqual({"foo": "bar"}, model)
+
+    def test_get_field_table(self):
+        class Model(dict):
+            field1 = Field()
+            field2 = Field()
+
+        table = get_field_table(Model)
+        self.assertEqual({"field1", "field2"}, set(table))
+        self.assertTrue(table["field1"] is Model.field1)
+        with self.assertRaises(TypeError):
+            table["field3"] = Field()
+
+
+class TestTypedFields(unittest.TestCase):
+
+    def _model(self, field):
+        class Model(dict):
+            value = field
+        return Model()
+
+    def test_int(self):
+        model = self._model(IntField())
+        for value in [3, "3", 3.0, Decimal("3")]:
+            model.value = value
+            self.assertEqual(3, model["value"])
+            self.assertTrue(type(model.value) is int)
+        model.value = True
+        self.assertEqual(1, model["value"])
+        with self.assertRaises(ValueError):
+            model.value = 3.5
+        with self.assertRaises(TypeError):
+            model.value = [3]
+
+    def test_float_and_str(self):
+        model = self._model(FloatField())
+        model.value = "1.5"
+        self.assertEqual(1.5, model.value)
+        model.value = 2
+        self.assertTrue(type(model.value) is float)
+        model = self._model(StrField())
+        model.value = b"caf\xc3\xa9"
+        self.assertEqual(u"caf\xe9", model.value)
+        with self.assertRaises(TypeError):
+            model.value = 1
+
+    def test_bool(self):
+        model = self._model(BoolField())
+        for value, expected in [
+                ("yes", True), (" False", False), (1, True), (0, False)]:
+            model.value = value
+            self.assertTrue(model.value is expected)
+        with self.assertRaises(ValueError):
+            model.value = "maybe"
+        with self.assertRaises(TypeError):
+            model.value = 2
+
+    def test_list_and_dict(self):
+        model = self._model(ListField(default=list))
+        self.assertEqual([], model.value)
+        model.value = (1, 2)
+        self.assertEqual([1, 2], model["value"])
+        with self.assertRaises(TypeError):
+            model.value = "12"
+        model = self._model(DictField())
+        model.value = {"a": 1}
+        self.assertEqual({"a": 1}, model.value)
+        with self.assertRaises(TypeError):
+            model.value = [("a", 1)]
+
+    def test_decimal(self):
+        model = self._model(DecimalField(default="0.10"))
+        self.assertEqual(Decimal("0.10"), model.value)
+        model.value = 0.1
+        self.assertEqual("0.1", model["value"])
+        model.value = Decimal("1.005")
+        self.assertEqual(Decimal("1.005"), model.value)
+        self.assertEqual("1.005", json.loads(json.dumps(model))["value"])
+        with self.assertRaises(ValueError):
+            model.value = "lots"
+
+    def test_datetime(self):
+        model = self._model(DateTimeField())
+        moment = datetime.datetime(2020, 1, 2, 3, 4, 5, 678000)
+        model.value = moment
+        self.assertEqual(1577934245, model["value"])
+        self.assertEqual(
+            moment.replace(microsecond=0, tzinfo=datetime.timezone.utc),
+            model.value)
+        model.value = "2020-01-02T04:04:05+01:00"
+        self.assertEqual(1577934245, model["value"])
+        model.value = "2020-01-02 03:04:05.678Z"
+        self.assertEqual(1577934245, model["value"])
+        model.value = "2020-01-02"
+        self.assertEqual(1577923200, model["value"])
+        with self.assertRaises(ValueError):
+            model.value = "02/01/2020"
+        model.value = 10
+        self.assertEqual(10, model.value.timestamp())
+
+        model = self._model(DateTimeField(unit="ms"))
+        model.value = moment
+        self.assertEqual(1577934245678, model["value"])
+        self.assertEqual(678000, model.value.microsecond)
+        model.value = "2020-01-02T01:34:05.678-01:30"
+        self.assertEqual(1577934245678, model["value"])
+        with self.assertRaises(ValueError):
+            DateTimeField(unit="days")
+        with self.assertRaises(TypeError):
+            model.value = datetime.date(2020, 1, 2)
+
+    def test_none_and_required(self):
+        model = self._model(IntField(required=True))
+        with self.assertRaises(EmptyRequiredField):
+            model.value
+        model.value = None
+        self.assertIsNone(model.value)
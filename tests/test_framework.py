@@ -89,6 +89,66 @@ class TestFramework(TestCase):
             def delete(self, model, key):
                 pass
 
+    def test_store_bulk_fallbacks(self):
+
+        @norm.framework.store
+        class Store(object):
+
+            def __init__(self):
+                self.data = {}
+
+            @norm.framework.deserialize
+            def fetch(self, model, key):
+                return self.data.get(key)
+
+            @norm.framework.serialize
+            def save(self, instance):
+                self.data[instance] = instance
+
+            def delete(self, model, key):
+                del self.data[key]
+
+            @norm.framework.deserialize
+            def find(self, model):
+                return iter(self.data.values())
+
+        for method in [
+                "fetch_many", "save_many", "delete_many", "exists",
+                "exists_many", "count"]:
+            self.assertTrue(
+                norm.framework._deserializable(getattr(Store, method)))
+
+        store = Store()
+        store.save_many(None, ["a", "b", "c"])
+        self.assertEqual(["a", None], store.fetch_many(None, ["a", "d"]))
+        self.assertTrue(store.exists(None, "a"))
+        self.assertEqual([True, False], store.exists_many(None, ["b", "d"]))
+        self.assertEqual(3, store.count(None))
+        store.delete_many(None, ["a", "b"])
+        self.assertEqual({"c": "c"}, store.data)
+
+    def test_store_native_bulk_methods(self):
+
+        @norm.framework.store
+        class Store(object):
+
+            @norm.framework.deserialize
+            def fetch(self, model, key):
+                pass
+
+            @norm.framework.deserialize
+            def fetch_many(self, model, keys):
+                return "native"
+
+            @norm.framework.serialize
+            def save(self, instance):
+                pass
+
+            def delete(self, model, key):
+                pass
+
+        self.assertEqual("native", Store().fetch_many(None, []))
+
     def test_connection_requires_methods(self):
         self.assert_requires_methods(
             norm.framework.connection,
@@ -0,0 +1,128 @@
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from norm import instrumentation
+from norm.backends.dbm_backend import DBMConnection
+from norm.field import Field
+from norm.instrumentation import InstrumentedStore, Metrics, OperationStats
+from norm.model import Model
+
+
+class User(Model):
+    id = Field()
+    name = Field()
+
+
+class TestInstrumentedStore(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._connection = DBMConnection(
+            os.path.join(self._tempdir.name, "metrics.db"))
+        self._backend = self._connection.get_store()
+        self._events = []
+        self._store = InstrumentedStore(
+            self._backend, exporters=[self._events.append])
+
+    def tearDown(self):
+        self._connection.disconnect()
+        self._tempdir.cleanup()
+
+    def test_records_operations_per_model(self):
+        U = User.use(self._store)
+        U(id="foo", name="Foo").store.save()
+        self.assertEqual("Foo", U.store.fetch("foo").name)
+        self.assertIsNone(U.store.fetch("missing"))
+        stats = self._store.metrics.stats()
+        self.assertEqual(1, stats[("User", "save")].count)
+        self.assertEqual(2, stats[("User", "fetch")].count)
+        self.assertEqual(
+            stats[("User", "save")].bytes_written,
+            stats[("User", "fetch")].bytes_read)
+        self.assertTrue(stats[("User", "save")].bytes_written > 0)
+        self.assertEqual(
+            ["save", "fetch", "fetch"],
+            [event.operation for event in self._events])
+        self.assertTrue(all(event.seconds > 0 for event in self._events))
+
+    def test_wraps_other_store_methods(self):
+        self._store.save_many(
+            User, [User(id=str(i), name="x") for i in range(3)])
+        self.assertEqual(3, self._store.count(User))
+        found = User.use(self._store).store.find()
+        self.assertEqual(3, len(list(found)))
+        stats = self._store.metrics.stats()
+        self.assertEqual(1, stats[("User", "find")].count)
+        self.assertEqual(
+            stats[("User", "save_many")].bytes_written,
+            stats[("User", "find")].bytes_read)
+        # not model operations, so passed straight through.
+        self.assertEqual(self._backend.batch, self._store.batch)
+        self.assertNotIn(("User", "batch"), stats)
+
+    def test_find_is_exported_when_closed_early(self):
+        self._store.save_many(
+            User, [User(id=str(i), name="x") for i in range(3)])
+        found = self._store.find(User)
+        next(found)
+        self.assertEqual(["save_many"], [e.operation for e in self._events])
+        found.close()
+        self.assertEqual("find", self._events[-1].operation)
+
+    def test_errors(self):
+        with self.assertRaises(KeyError):
+            self._store.delete(User, "missing")
+        stats = self._store.metrics.stats()[("User", "delete")]
+        self.assertEqual(1, stats.errors)
+        self.assertEqual("KeyError", self._events[-1].error)
+
+    def test_disabled(self):
+        self._store.enabled = False
+        self._store.save(User(id="foo", name="Foo"))
+        self.assertEqual("Foo", self._store.fetch(User, "foo").name)
+        self.assertEqual({}, self._store.metrics.stats())
+        self.assertEqual([], self._events)
+
+    def test_log_exporter(self):
+        logger = mock.Mock()
+        logger.isEnabledFor.return_value = True
+        self._store.add_exporter(instrumentation.log_exporter(
+            logger, level=logging.INFO, slower_than=60))
+        self._store.save(User(id="foo", name="Foo"))
+        self.assertEqual(0, logger.log.call_count)
+        with self.assertRaises(KeyError):
+            self._store.delete(User, "missing")
+        self.assertEqual(1, logger.log.call_count)
+        self.assertEqual(logging.INFO, logger.log.call_args[0][0])
+
+
+class TestMetrics(unittest.TestCase):
+
+    def _event(self, seconds, error=None):
+        event = instrumentation.Event("User", "fetch")
+        event.seconds = seconds
+        event.error = error
+        return event
+
+    def test_histogram(self):
+        metrics = Metrics()
+        for seconds in [0.0001] * 98 + [0.02, 60]:
+            metrics(self._event(seconds))
+        stats = metrics.stats()[("User", "fetch")]
+        self.assertEqual(100, stats.count)
+        self.assertEqual(0.0001, stats.percentile(0.5))
+        self.assertEqual(0.025, stats.percentile(0.99))
+        self.assertIsNone(stats.percentile(1))
+        self.assertEqual(0.0, OperationStats().percentile(0.5))
+
+    def test_to_dict_and_reset(self):
+        metrics = Metrics()
+        metrics(self._event(0.001, error="KeyError"))
+        data = metrics.to_dict()["User.fetch"]
+        self.assertEqual(1, data["errors"])
+        self.assertEqual(1, sum(data["histogram"]))
+        metrics.reset()
+        self.assertEqual({}, metrics.to_dict())
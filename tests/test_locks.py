@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+
+from norm.locks import ReadWriteLock
+
+
+class TestReadWriteLock(unittest.TestCase):
+
+    def setUp(self):
+        self._lock = ReadWriteLock()
+
+    def test_parallel_readers(self):
+        inside = threading.Barrier(3, timeout=5)
+
+        def read():
+            with self._lock.read():
+                # all three readers must be inside at once to pass
+                inside.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(3)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        self.assertFalse(inside.broken)
+
+    def test_writer_excludes_readers(self):
+        events = []
+
+        def read():
+            with self._lock.read():
+                events.append("read")
+
+        with self._lock.write():
+            thread = threading.Thread(target=read)
+            thread.start()
+            time.sleep(0.05)
+            events.append("write")
+        thread.join()
+        self.assertEqual(["write", "read"], events)
+
+    def test_writer_waits_for_readers(self):
+        events = []
+
+        def write():
+            with self._lock.write():
+                events.append("write")
+
+        with self._lock.read():
+            thread = threading.Thread(target=write)
+            thread.start()
+            time.sleep(0.05)
+            events.append("read")
+        thread.join()
+        self.assertEqual(["read", "write"], events)
+
+    def test_reentrant(self):
+        with self._lock.write():
+            with self._lock.write():
+                with self._lock.read():
+                    pass
+        with self._lock.read():
+            with self._lock.read():
+                pass
+        # fully released, so another thread can write.
+        def write():
+            with self._lock.write():
+                pass
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_no_upgrade(self):
+        with self._lock.read():
+            with self.assertRaises(RuntimeError):
+                self._lock.acquire_write()
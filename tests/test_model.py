@@ -2,6 +2,7 @@ from unittest import mock
 import unittest
 from norm.model import Model, MissingIDField, UnknownField
 from norm.field import Field, EmptyRequiredField
+from norm.field import DateTimeField, IntField
 
 
 class TestModel(unittest.TestCase):
@@ -113,3 +114,235 @@ class TestModel(unittest.TestCase):
 
         # shouldn't cause any issues...
         M()
+
+    def test_field_table_built_at_class_creation(self):
+        class M(Model):
+            field1 = Field(required=True)
+            field2 = Field()
+
+        self.assertEqual(frozenset(["field1", "field2"]), M._fields)
+        self.assertEqual(frozenset(["field1"]), M._required_fields)
+        self.assertTrue(M._field_table["field2"] is M.field2)
+
+    def test_field_table_inherited(self):
+        class M(Model):
+            field1 = Field()
+
+        class N(M):
+            field2 = Field(default="foo")
+
+        self.assertEqual(frozenset(["field1"]), M._fields)
+        self.assertEqual(frozenset(["field1", "field2"]), N._fields)
+        self.assertEqual({"field2": "foo"}, N().to_dict())
+
+    def test_lazy_memoizes_deserialized_values(self):
+        calls = []
+
+        def deserialize(instance, value):
+            calls.append(value)
+            return [value]
+
+        class M(Model):
+            _lazy = True
+            field = Field(deserialize=deserialize)
+
+        model = M.from_dict({"field": "foo"})
+        self.assertTrue(model.field is model.field)
+        self.assertEqual(["foo"], calls)
+
+        model.field = "bar"
+        self.assertEqual(["bar"], model.field)
+        model["field"] = "baz"
+        self.assertEqual(["baz"], model.field)
+        self.assertEqual(["foo", "bar", "baz"], calls)
+
+    def test_not_lazy_deserializes_every_access(self):
+        class M(Model):
+            field = Field(deserialize=lambda instance, value: [value])
+
+        model = M.from_dict({"field": "foo"})
+        self.assertFalse(model.field is model.field)
+
+    def test_from_raw_decodes_on_first_access(self):
+        decoded = []
+
+        def decode(raw):
+            decoded.append(raw)
+            return {"id": raw, "field2": "thing"}
+
+        class M(Model):
+            id = Field()
+            field1 = Field(default="foobar")
+            field2 = Field()
+
+        model = M.from_raw("foo", decode)
+        self.assertEqual([], decoded)
+        self.assertEqual("thing", model.field2)
+        self.assertEqual("foobar", model.field1)
+        self.assertEqual("foo", model.identify())
+        self.assertEqual(
+            {"id": "foo", "field1": "foobar", "field2": "thing"},
+            model.to_dict())
+        self.assertEqual(["foo"], decoded)
+
+    def test_missing_attribute(self):
+        class M(Model):
+            pass
+
+        with self.assertRaises(AttributeError):
+            M().missing
+
+    def test_dirty_tracking(self):
+        class M(Model):
+            id = Field()
+            field = Field(default="foo")
+
+        new = M(id="a")
+        self.assertTrue(new.is_dirty())
+        self.assertEqual({"id": "a", "field": "foo"}, new.changed_fields())
+
+        # built by user code, so saved in full by any store.
+        self.assertTrue(M.from_dict({"id": "a"}).is_dirty())
+
+        origin = object()
+        loaded = M.from_dict({"id": "a"})
+        loaded.mark_clean(origin)
+        self.assertFalse(loaded.is_dirty())
+        self.assertFalse(loaded.is_dirty(origin))
+        self.assertTrue(loaded.is_dirty(object()))
+        self.assertEqual({}, loaded.changed_fields())
+        loaded.field = "bar"
+        self.assertTrue(loaded.is_dirty())
+        self.assertEqual({"field": "bar"}, loaded.changed_fields())
+
+        loaded.mark_clean()
+        self.assertFalse(loaded.is_dirty())
+        self.assertTrue(loaded.is_dirty(origin))
+        loaded.mark_dirty("id")
+        self.assertEqual({"id": "a"}, loaded.changed_fields())
+        loaded.mark_dirty()
+        self.assertEqual(
+            {"id": "a", "field": "bar"}, loaded.changed_fields())
+
+    def test_from_raw_stays_clean_on_decode(self):
+        class M(Model):
+            id = Field()
+            field = Field(default="foo")
+
+        self.assertTrue(M.from_raw("a", lambda raw: {"id": raw}).is_dirty())
+        model = M.from_raw("a", lambda raw: {"id": raw})
+        model.mark_clean()
+        self.assertEqual("foo", model.field)
+        self.assertFalse(model.is_dirty())
+
+    def test_bulk_create(self):
+        calls = []
+
+        def stamp():
+            calls.append(1)
+            return len(calls)
+
+        class M(Model):
+            id = Field(required=True)
+            name = Field(default="none")
+            created = Field(default=stamp)
+            count = Field(coerce=int, field_name="n")
+
+        rows = [
+            {"id": "1"}, {"id": "2", "created": 0, "count": "3"},
+            {"id": "3"}]
+        instances = M.bulk_create(rows)
+        self.assertEqual(
+            [dict(M(**row).to_dict(), created=c)
+             for row, c in zip(rows, [1, 0, 2])],
+            [instance.to_dict() for instance in instances])
+        self.assertEqual(3, instances[1]["n"])
+        # the default for "created" isn't made when the row sets it.
+        self.assertEqual(2 + 3, len(calls))
+        self.assertTrue(all(instance.is_dirty() for instance in instances))
+        self.assertEqual(2, len(M._create_plans))
+
+        with mock.patch("norm.model._check_fields") as check:
+            M.bulk_create([{"id": str(i)} for i in range(5)])
+            self.assertEqual(0, check.call_count)
+
+        with self.assertRaises(EmptyRequiredField):
+            M.bulk_create([{"name": "foo"}])
+        with self.assertRaises(UnknownField):
+            M.bulk_create([{"id": "1", "other": "foo"}])
+
+    def test_bulk_create_with_custom_init(self):
+        class M(Model):
+            name = Field()
+
+            def __init__(self, **kwargs):
+                super(M, self).__init__(**kwargs)
+                self.name = self.name.upper()
+
+        self.assertEqual(
+            ["FOO"], [m.name for m in M.bulk_create([{"name": "foo"}])])
+
+    def test_from_dicts(self):
+        class M(Model):
+            _lazy = True
+            id = Field()
+            name = Field(default="none")
+            tags = Field(default=list)
+
+        rows = [{"id": "1"}, {"id": "2", "name": "two", "tags": ["a"]}]
+        instances = M.from_dicts(rows)
+        self.assertEqual(
+            [M.from_dict(row).to_dict() for row in rows],
+            [instance.to_dict() for instance in instances])
+        self.assertTrue(all(i.is_dirty() for i in instances))
+        self.assertEqual({}, instances[0]._deserialized)
+        self.assertFalse(instances[0].tags is M.from_dicts(rows)[0].tags)
+
+    def test_adopt(self):
+        calls = []
+
+        def stamp():
+            calls.append(1)
+            return "made"
+
+        class M(Model):
+            id = Field()
+            name = Field(default="none")
+            created = Field(default=stamp)
+
+        data = {"id": "1", "created": "stored"}
+        instance = M.adopt(data)
+        self.assertTrue(instance.to_dict() is data)
+        self.assertEqual(
+            {"id": "1", "name": "none", "created": "stored"}, data)
+        self.assertEqual([], calls)
+        self.assertTrue(instance.is_dirty())
+        self.assertEqual("made", M.adopt({"id": "2"}).created)
+
+        copied = {"id": "3"}
+        self.assertFalse(M.from_dict(copied).to_dict() is copied)
+        self.assertEqual({"id": "3"}, copied)
+
+    def test_adopt_with_custom_from_dict(self):
+        class M(Model):
+            name = Field()
+
+            @classmethod
+            def from_dict(cls, data):
+                instance = super(M, cls).from_dict(data)
+                instance.name = instance.name.upper()
+                return instance
+
+        self.assertEqual("FOO", M.adopt({"name": "foo"}).name)
+
+    def test_typed_fields(self):
+        class M(Model):
+            id = IntField()
+            when = DateTimeField(default=0)
+
+        instances = M.bulk_create([{"id": "1"}, {"id": 2, "when": 60}])
+        self.assertEqual([1, 2], [m.id for m in instances])
+        self.assertEqual({"id": 2, "when": 60}, instances[1].to_dict())
+        self.assertEqual(0, instances[0]["when"])
+        restored = M.from_dict({"id": 3, "when": 60})
+        self.assertEqual(60, restored.when.timestamp())
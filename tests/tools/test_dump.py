@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from norm.backends.dbm_backend import DBMConnection
+from norm.dumpformat import InvalidDump, MAGIC
+from norm.tools import _bulk, dump, load
+
+
+class TestDumpLoad(TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._source = DBMConnection(self._path("source.db"), codec="marshal")
+        with self._source.batch():
+            for i in range(25):
+                self._source.save(
+                    "Person:%d" % i, self._source.encode({"uid": i}))
+            self._source.save(
+                "Animal:cat", self._source.encode({"id": "cat"}))
+
+    def tearDown(self):
+        self._source.disconnect()
+        self._tempdir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self._tempdir.name, name)
+
+    def _records(self, connection):
+        keys = connection.record_keys()
+        return dict(
+            (key, connection.decode(value))
+            for key, value in zip(keys, connection.fetch_many(keys)))
+
+    def test_ndjson_round_trip(self):
+        output = io.BytesIO()
+        dump.dump(self._source, output, chunk_size=4)
+        lines = output.getvalue().decode("utf8").splitlines()
+        self.assertEqual(26, len(lines))
+        self.assertEqual(
+            {"key": "Animal:cat", "data": {"id": "cat"}},
+            [json.loads(l) for l in lines if "Animal" in l][0])
+
+        target = DBMConnection(self._path("target.db"))
+        load.load(target, io.BytesIO(output.getvalue()), chunk_size=4)
+        self.assertEqual(self._records(self._source), self._records(target))
+        # written with the target's default codec...
+        self.assertEqual(b"{", target.fetch("Animal:cat")[:1])
+        target.disconnect()
+
+    def test_binary_round_trip(self):
+        output = io.BytesIO()
+        dump.dump(self._source, output, format="binary", chunk_size=4)
+        self.assertTrue(output.getvalue().startswith(MAGIC))
+
+        target = DBMConnection(self._path("target.db"))
+        load.load(target, io.BytesIO(output.getvalue()), format="binary")
+        self.assertEqual(self._records(self._source), self._records(target))
+        # values are copied verbatim
+        self.assertEqual(
+            self._source.fetch("Person:3"), target.fetch("Person:3"))
+        target.disconnect()
+
+    def test_binary_recode(self):
+        output = io.BytesIO()
+        dump.dump(self._source, output, format="binary")
+        target = DBMConnection(self._path("target.db"))
+        load.load(
+            target, io.BytesIO(output.getvalue()), format="binary",
+            codec="json", compress="zlib")
+        self.assertEqual(b"\x00z", target.fetch("Person:3")[:2])
+        self.assertEqual(self._records(self._source), self._records(target))
+        target.disconnect()
+
+    def test_model_filter(self):
+        output = io.BytesIO()
+        dump.dump(self._source, output, models=["Animal"])
+        self.assertEqual(1, len(output.getvalue().splitlines()))
+
+        output = io.BytesIO()
+        dump.dump(self._source, output, format="binary")
+        target = DBMConnection(self._path("target.db"))
+        load.load(
+            target, io.BytesIO(output.getvalue()), format="binary",
+            models=["Person"])
+        self.assertEqual(25, target.count("Person"))
+        self.assertEqual(0, target.count("Animal"))
+        target.disconnect()
+
+    def test_process_pool(self):
+        output = io.BytesIO()
+        dump.dump(self._source, output, workers=2, chunk_size=3)
+        target = DBMConnection(self._path("target.db"))
+        load.load(
+            target, io.BytesIO(output.getvalue()), workers=2, chunk_size=3,
+            models=["Person"])
+        self.assertEqual(25, target.count("Person"))
+        target.disconnect()
+
+    def test_progress(self):
+        stream = io.StringIO()
+        progress = _bulk.Progress("dumped", stream=stream, interval=0)
+        dump.dump(self._source, io.BytesIO(), progress=progress)
+        progress.finish()
+        self.assertEqual(26, progress.records)
+        self.assertTrue("done: dumped 26 record(s)" in stream.getvalue())
+
+    def test_invalid_binary_dump(self):
+        target = DBMConnection(self._path("target.db"))
+        with self.assertRaises(InvalidDump):
+            load.load(target, io.BytesIO(b"nope"), format="binary")
+        target.disconnect()
+
+    def test_main(self):
+        self._source.disconnect()
+        output = self._path("out.bin")
+        self.assertEqual(0, dump.main([
+            self._path("source.db"), output, "--format", "binary",
+            "--quiet"]))
+        self.assertEqual(0, load.main([
+            self._path("target.db"), output, "--format", "binary",
+            "--quiet"]))
+        target = DBMConnection(self._path("target.db"))
+        self.assertEqual(25, target.count("Person"))
+        target.disconnect()
+        self._source = DBMConnection(self._path("source.db"))
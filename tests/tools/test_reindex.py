@@ -0,0 +1,36 @@
+import dbm
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from norm.backends.dbm_backend import DBMConnection
+from norm.tools import reindex
+
+
+class TestReindex(TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._tempdir.name, "legacy.db")
+        legacy = dbm.open(self._path, "c")
+        for i in range(3):
+            legacy["Person:%d" % i] = json.dumps({"uid": i}).encode("utf8")
+        legacy["Animal:cat"] = json.dumps({"id": "cat"}).encode("utf8")
+        legacy.close()
+
+    def tearDown(self):
+        self._tempdir.cleanup()
+
+    def test_reindex(self):
+        self.assertFalse(DBMConnection(self._path).indexed)
+        self.assertEqual(
+            {"Person": 3, "Animal": 1}, reindex.reindex(self._path))
+        connection = DBMConnection(self._path)
+        self.assertTrue(connection.indexed)
+        self.assertEqual(
+            set(["0", "1", "2"]), set(connection.model_ids("Person")))
+
+    def test_main(self):
+        self.assertEqual(0, reindex.main([self._path]))
+        self.assertEqual(1, DBMConnection(self._path).count("Animal"))
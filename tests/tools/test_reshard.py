@@ -0,0 +1,66 @@
+import io
+import os
+import tempfile
+from unittest import TestCase
+
+from norm.backends.dbm_backend import DBMConnection
+from norm.backends.sharded_backend import ShardedConnection
+from norm.tools import _bulk, reshard
+
+from tests.backends.contract import Animal
+
+
+class TestReshard(TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._paths = [
+            os.path.join(self._tempdir.name, "shard.%d.db" % i)
+            for i in range(3)
+        ]
+        connection = self._connect(2)
+        store = connection.get_store()
+        for i in range(60):
+            store.create(Animal, id=str(i), name="cat")
+        connection.disconnect()
+
+    def tearDown(self):
+        self._tempdir.cleanup()
+
+    def _connect(self, shards, **options):
+        return ShardedConnection(
+            [DBMConnection(path) for path in self._paths[:shards]],
+            parallel=False, **options)
+
+    def _counts(self, connection):
+        return [shard.count("Animal") for shard in connection.shards]
+
+    def test_grow(self):
+        connection = self._connect(3, previous=2)
+        store = connection.get_store()
+        # written at its new home before it was moved, so it's kept.
+        newer = next(
+            str(i) for i in range(60) if connection.home("Animal:%d" % i) == 2)
+        store.save(Animal(id=newer, name="dog"))
+
+        progress = _bulk.Progress("moved", stream=io.StringIO())
+        moved = reshard.reshard(connection, chunk_size=5, progress=progress)
+        self.assertEqual(moved, progress.records)
+        counts = self._counts(connection)
+        self.assertEqual(60, sum(counts))
+        self.assertEqual(counts[2], moved)
+        self.assertLess(moved, 40)
+        self.assertEqual("dog", store.fetch(Animal, newer).name)
+        connection.disconnect()
+
+        connection = self._connect(3)
+        self.assertEqual(60, connection.get_store().count(Animal))
+        self.assertEqual(0, reshard.reshard(connection))
+        connection.disconnect()
+
+    def test_main_drains_shards(self):
+        self.assertEqual(
+            0, reshard.main(self._paths[:2] + ["--active", "1", "--quiet"]))
+        connection = self._connect(2)
+        self.assertEqual([60, 0], self._counts(connection))
+        connection.disconnect()